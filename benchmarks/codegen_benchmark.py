@@ -0,0 +1,69 @@
+import io
+import os
+import time
+from llvmlite import ir # type: ignore
+from slate.slasm.function import BasicBlock, Function
+from slate.slasm.instruction import *
+from slate.slasm.program import Program
+from slate.slasm.slasm import DataType, Word
+from slate.slasm.visitors import llvm_visitor, nasm_visitor
+from slate.utilities import i64
+
+def create_program(num_functions: int, num_terms: int) -> Program:
+    program = Program("x86-64-linux-nasm", set())
+
+    for idx in range(num_functions):
+        function = Function(f"F{idx}", ["x"], ["acc"], True)
+        entry = BasicBlock()
+
+        # acc = x; acc = acc * x + k; ... with a call to the previous function
+        entry.append_instr(LOAD_PARAM("x"))
+        entry.append_instr(STORE_LOCAL("acc"))
+
+        for term in range(num_terms):
+            entry.append_instr(LOAD_LOCAL("acc"))
+            entry.append_instr(LOAD_PARAM("x"))
+            entry.append_instr(MUL(DataType.I64))
+            entry.append_instr(LOAD_CONST(Word.FromI64(i64(term))))
+            entry.append_instr(ADD(DataType.I64))
+            entry.append_instr(STORE_LOCAL("acc"))
+
+        if idx != 0:
+            entry.append_instr(LOAD_LOCAL("acc"))
+            entry.append_instr(CALL(f"F{idx - 1}"))
+            entry.append_instr(STORE_LOCAL("acc"))
+
+        entry.append_instr(LOAD_LOCAL("acc"))
+        entry.append_instr(RET())
+
+        function.add_basic_block("entry", entry)
+        function.entry = "entry"
+        program.add_function(function)
+
+    program.entry = f"F{num_functions - 1}"
+    return program
+
+def setup_natives(llvm_module: ir.Module) -> None:
+    pass
+
+def main(num_functions: int = 2000, num_terms: int = 20) -> None:
+    program = create_program(num_functions, num_terms)
+    template = "#SLASM_VERSION##TARGET##DATA##GLOBALS##ENTRY_FUNC_NAME##SLASM_FUNCS#"
+    cpus = os.cpu_count() or 1
+
+    print(f"{num_functions} functions, {cpus} cpus")
+    print(f"{'jobs':>4} {'nasm':>10} {'llvm':>10}")
+
+    for jobs in sorted(set([1, 2, cpus])):
+        start_time = time.perf_counter()
+        nasm_visitor.write_Program(program, template, {}, io.StringIO(), cache_registers=2, fuse_operands=True, jobs=jobs)
+        nasm_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        llvm_visitor.link_RegisterProgram(program, setup_natives, jobs)
+        llvm_time = time.perf_counter() - start_time
+
+        print(f"{jobs:>4} {nasm_time:>9.3f}s {llvm_time:>9.3f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import ctypes
+import os
+from pathlib import Path
+import subprocess
+import tempfile
+import time
+from slate.interpreter import JITSession
+from slate.optimizer import OptimizationOptions
+from slate.slasm import llvm_runtime, toolchain
+from slate.slasm.function import BasicBlock, Function
+from slate.slasm.instruction import *
+from slate.slasm.program import Program
+from slate.slasm.slasm import DataType, Word
+from slate.slasm.visitors import llvm_visitor, nasm_visitor
+from slate.utilities import i64
+
+def create_program(count: int) -> Program:
+    program = Program("x86-64-linux-nasm", set())
+    function = Function("print_loop", [], ["i"], True)
+
+    # for (i = -count / 2; i < count - count / 2; i++) print(i * 7919)
+    entry = BasicBlock()
+    entry.append_instr(LOAD_CONST(Word.FromI64(i64(-(count // 2)))))
+    entry.append_instr(STORE_LOCAL("i"))
+    entry.append_instr(JUMP("loop"))
+
+    loop = BasicBlock()
+    loop.append_instr(LOAD_LOCAL("i"))
+    loop.append_instr(LOAD_CONST(Word.FromI64(i64(count - count // 2))))
+    loop.append_instr(LT(DataType.I64))
+    loop.append_instr(COND_JUMP("body", "exit"))
+
+    body = BasicBlock()
+    body.append_instr(LOAD_LOCAL("i"))
+    body.append_instr(LOAD_CONST(Word.FromI64(i64(7919))))
+    body.append_instr(MUL(DataType.I64))
+    body.append_instr(CALL("DEBUG_PRINT_I64"))
+    body.append_instr(LOAD_LOCAL("i"))
+    body.append_instr(INC(DataType.I64))
+    body.append_instr(STORE_LOCAL("i"))
+    body.append_instr(JUMP("loop"))
+
+    exit_block = BasicBlock()
+    exit_block.append_instr(LOAD_CONST(Word.FromI64(i64(0))))
+    exit_block.append_instr(RET())
+
+    function.add_basic_block("entry", entry)
+    function.add_basic_block("loop", loop)
+    function.add_basic_block("body", body)
+    function.add_basic_block("exit", exit_block)
+    function.entry = "entry"
+
+    program.add_function(function)
+    program.entry = function.name
+    return program
+
+def time_executable(program: Program, platform: toolchain.Platform, directory: Path) -> float:
+    natives = {"DEBUG_PRINT_I64": nasm_visitor.GlobalContext.FuncDef(["value"], [], False)}
+    target = toolchain.BuildTarget(directory / f"{platform.name}.asm", directory / f"{platform.name}.o", directory / platform.name)
+
+    with target.asm_path.open("w") as file:
+        nasm_visitor.write_Program(program, toolchain.read_Template(platform), natives, file, cache_registers=2, fuse_operands=True)
+
+    toolchain.build_Targets([target], platform, toolchain.BuildCache(None), builtin_assembler=True)
+
+    start_time = time.perf_counter()
+    subprocess.run([str(target.executable_path)], stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start_time
+
+def time_jit(program: Program) -> float:
+    session = JITSession(optimization=OptimizationOptions(opt_level=2))
+    session.add_module(llvm_visitor.link_RegisterProgram(program, llvm_runtime.define_OutputRuntime))
+    flush = ctypes.CFUNCTYPE(None)(session.get_function_address(llvm_runtime.FLUSH_FUNC_NAME))
+
+    # The runtime writes to file descriptor 1 directly, so point it at /dev/null while running
+    stdout = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+
+    try:
+        start_time = time.perf_counter()
+        session.run(program.entry)
+        flush()
+        return time.perf_counter() - start_time
+    finally:
+        os.dup2(stdout, 1)
+        os.close(devnull)
+        os.close(stdout)
+
+def main(count: int = 10000000) -> None:
+    program = create_program(count)
+    print(f"{count} integers")
+    print(f"{'runtime':<20} {'time':>10} {'rate':>14}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        timings = [(platform.name, time_executable(program, platform, Path(directory))) for platform in (toolchain.get_Platform(), toolchain.get_Platform(freestanding=True))]
+
+    timings.append(("llvm jit", time_jit(program)))
+
+    for name, seconds in timings:
+        print(f"{name:<20} {seconds:>9.3f}s {count / seconds / 1e6:>9.1f} M/s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import io
+import time
+from typing import Any, Callable, Dict, List, Optional, Union, cast
+from slate.slasm.function import BasicBlock, Function
+from slate.slasm.instruction import *
+from slate.slasm.program import Program
+from slate.slasm.slasm import DataType, Word
+from slate.slasm.vm import ExecutionMode, VirtualMachine, get_binary_operator, get_conversion, get_unary_operator
+from slate.utilities import i64, ui64
+
+# A straightforward opcode switch over the instruction dataclasses, used as the baseline
+class NaiveInterpreter:
+    def __init__(self, program: Program) -> None:
+        self.__program = program
+        self.__functions = {f.name: f for f in program.functions}
+        self.__operators : Dict[Any, Callable[..., int]] = {}
+        self.output = io.StringIO()
+
+    def __get_operator(self, key: Any, create: Callable[[], Callable[..., int]]) -> Callable[..., int]:
+        if key not in self.__operators:
+            self.__operators[key] = create()
+
+        return self.__operators[key]
+
+    def run(self) -> int:
+        result = self.call(self.__program.entry, [])
+        return 0 if result is None else Word.FromUI64(ui64(result)).as_i64()
+
+    def call(self, func_name: str, args: List[int]) -> Optional[int]:
+        if func_name == "DEBUG_PRINT_I64":
+            self.output.write(f"{Word.FromUI64(ui64(args[0])).as_i64()}\n")
+            return None
+
+        function = self.__functions[func_name]
+        params = dict(zip(list(function.params), args))
+        locals : Dict[str, int] = {name: 0 for name in function.locals}
+        blocks = dict(function.basic_blocks)
+        stack : List[int] = []
+        label = function.entry
+
+        while True:
+            for instr in blocks[label]:
+                op = instr.opcode
+
+                if op == OpCode.LOAD_CONST:
+                    stack.append(cast(LOAD_CONST, instr).value.as_ui64())
+                elif op == OpCode.LOAD_LOCAL:
+                    stack.append(locals[cast(LOAD_LOCAL, instr).name])
+                elif op == OpCode.LOAD_PARAM:
+                    stack.append(params[cast(LOAD_PARAM, instr).name])
+                elif op == OpCode.STORE_LOCAL:
+                    locals[cast(STORE_LOCAL, instr).name] = stack.pop()
+                elif op == OpCode.POP:
+                    stack.pop()
+                elif op in (OpCode.ADD, OpCode.SUB, OpCode.MUL, OpCode.DIV, OpCode.MOD, OpCode.EQ, OpCode.NEQ, OpCode.GT, OpCode.LT, OpCode.GTEQ, OpCode.LTEQ):
+                    data_type = cast(Union[ADD, SUB, MUL, DIV, MOD, EQ, NEQ, GT, LT, GTEQ, LTEQ], instr).data_type
+                    b, a = stack.pop(), stack.pop()
+                    stack.append(self.__get_operator((op, data_type), lambda: get_binary_operator(op, data_type))(a, b))
+                elif op in (OpCode.INC, OpCode.DEC, OpCode.NEG):
+                    data_type = cast(Union[INC, DEC, NEG], instr).data_type
+                    stack.append(self.__get_operator((op, data_type), lambda: get_unary_operator(op, data_type))(stack.pop()))
+                elif op == OpCode.CONVERT:
+                    convert = cast(CONVERT, instr)
+                    stack.append(self.__get_operator((convert.from_dt, convert.to_dt), lambda: get_conversion(convert.from_dt, convert.to_dt))(stack.pop()))
+                elif op == OpCode.CALL:
+                    target = cast(CALL, instr).target
+                    callee_args = [stack.pop() for _ in range(1 if target == "DEBUG_PRINT_I64" else self.__functions[target].num_params)]
+                    result = self.call(target, callee_args)
+
+                    if result is not None:
+                        stack.append(result)
+                elif op == OpCode.JUMP:
+                    label = cast(JUMP, instr).target
+                    break
+                elif op == OpCode.COND_JUMP:
+                    cond_jump = cast(COND_JUMP, instr)
+                    label = cond_jump.true_target if stack.pop() != 0 else cond_jump.false_target
+                    break
+                elif op == OpCode.RET:
+                    return stack.pop() if function.returns_value else None
+                else:
+                    raise NotImplementedError(op)
+
+def create_loop_program(name: str, iterations: int, body: List[Instruction]) -> Program:
+    program = Program("slasm-vm", set())
+    function = Function("Main", set(), {"i", "acc"}, True)
+
+    entry = BasicBlock()
+    entry.append_instr(LOAD_CONST(Word.FromI64(i64(0))))
+    entry.append_instr(STORE_LOCAL("i"))
+    entry.append_instr(LOAD_CONST(Word.FromI64(i64(0))))
+    entry.append_instr(STORE_LOCAL("acc"))
+    entry.append_instr(JUMP("loop"))
+
+    loop = BasicBlock()
+    loop.append_instr(LOAD_LOCAL("i"))
+    loop.append_instr(LOAD_CONST(Word.FromI64(i64(iterations))))
+    loop.append_instr(LT(DataType.I64))
+    loop.append_instr(COND_JUMP("body", "exit"))
+
+    loop_body = BasicBlock()
+
+    for instr in body:
+        loop_body.append_instr(instr)
+
+    loop_body.append_instr(LOAD_LOCAL("i"))
+    loop_body.append_instr(INC(DataType.I64))
+    loop_body.append_instr(STORE_LOCAL("i"))
+    loop_body.append_instr(JUMP("loop"))
+
+    exit_block = BasicBlock()
+    exit_block.append_instr(LOAD_LOCAL("acc"))
+    exit_block.append_instr(CALL("DEBUG_PRINT_I64"))
+    exit_block.append_instr(LOAD_CONST(Word.FromI64(i64(0))))
+    exit_block.append_instr(RET())
+
+    function.add_basic_block("entry", entry)
+    function.add_basic_block("loop", loop)
+    function.add_basic_block("body", loop_body)
+    function.add_basic_block("exit", exit_block)
+    function.entry = "entry"
+
+    program.add_function(function)
+    program.entry = function.name
+
+    return program
+
+BENCHMARKS : Dict[str, List[Instruction]] = {
+    # acc = acc + i * i - (i / 3)
+    "i64 polynomial": [
+        LOAD_LOCAL("acc"),
+        LOAD_LOCAL("i"),
+        LOAD_LOCAL("i"),
+        MUL(DataType.I64),
+        ADD(DataType.I64),
+        LOAD_LOCAL("i"),
+        LOAD_CONST(Word.FromI64(i64(3))),
+        DIV(DataType.I64),
+        SUB(DataType.I64),
+        STORE_LOCAL("acc"),
+    ],
+    # acc = acc + i % 7 + i % 11
+    "i32 remainders": [
+        LOAD_LOCAL("acc"),
+        LOAD_LOCAL("i"),
+        LOAD_CONST(Word.FromI64(i64(7))),
+        MOD(DataType.I32),
+        ADD(DataType.I32),
+        LOAD_LOCAL("i"),
+        LOAD_CONST(Word.FromI64(i64(11))),
+        MOD(DataType.I32),
+        ADD(DataType.I32),
+        STORE_LOCAL("acc"),
+    ],
+    # acc = (i64)((f64)acc + (f64)i * 0.5)
+    "f64 scaling": [
+        LOAD_LOCAL("acc"),
+        CONVERT(DataType.I64, DataType.F64),
+        LOAD_LOCAL("i"),
+        CONVERT(DataType.I64, DataType.F64),
+        LOAD_CONST(Word.FromI64(i64(2))),
+        CONVERT(DataType.I64, DataType.F64),
+        DIV(DataType.F64),
+        ADD(DataType.F64),
+        CONVERT(DataType.F64, DataType.I64),
+        STORE_LOCAL("acc"),
+    ],
+}
+
+def time_run(create_runner: Callable[[], Callable[[], int]]) -> float:
+    start_time = time.perf_counter()
+    create_runner()()
+    return time.perf_counter() - start_time
+
+def main(iterations: int = 100000) -> None:
+    print(f"{'benchmark':<16} {'naive':>10} {'interpret':>10} {'compile':>10} {'speedup':>8}")
+
+    for name, body in BENCHMARKS.items():
+        program = create_loop_program(name, iterations, body)
+
+        naive = time_run(lambda: NaiveInterpreter(program).run)
+        interpreted = time_run(lambda: VirtualMachine(program, output=io.StringIO(), mode=ExecutionMode.INTERPRET).run)
+        compiled = time_run(lambda: VirtualMachine(program, output=io.StringIO(), mode=ExecutionMode.COMPILE).run)
+
+        print(f"{name:<16} {naive:>9.3f}s {interpreted:>9.3f}s {compiled:>9.3f}s {naive / compiled:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -1,38 +1,262 @@
-from typing import Optional
+import hashlib
+import os
+import time
+from pathlib import Path
+from threading import Lock, get_ident, local
+from typing import Dict, List, Optional
 import llvmlite.binding as llvm # type: ignore
 from ctypes import CFUNCTYPE, c_int64
 
+from slate.optimizer import OptimizationOptions, initialize_llvm, optimize
+from slate.slasm.toolchain import get_DefaultCacheDirectory
+
 ExitCode = int
 
-__LLVM_INITED : bool = False
-__LLVM_TARGET_MACHINE : Optional[llvm.TargetMachine] = None
+class ObjectCache:
+    def __init__(self, directory: Path, max_size: int = 64 * 1024 * 1024) -> None:
+        self.__directory = directory
+        self.__max_size = max_size
+        self.__pending_keys : Dict[llvm.ModuleRef, str] = {}
+        self.__lock = Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+        self.__directory.mkdir(parents=True, exist_ok=True)
+
+    def attach(self, engine: llvm.ExecutionEngine, target_id: str) -> None:
+        def getbuffer(module: llvm.ModuleRef) -> Optional[bytes]:
+            # The key must be computed before codegen since codegen may alter the module's IR
+            key = hashlib.sha256(f"{target_id}\n{module}".encode()).hexdigest()
+            buffer = self.load(key)
+
+            if buffer is None:
+                with self.__lock:
+                    self.__pending_keys[module] = key
+
+            return buffer
+
+        def notify(module: llvm.ModuleRef, buffer: bytes) -> None:
+            with self.__lock:
+                key = self.__pending_keys.pop(module, None)
+
+            if key is not None:
+                self.store(key, buffer)
+
+        engine.set_object_cache(notify, getbuffer)
+
+    def load(self, key: str) -> Optional[bytes]:
+        path = self.__directory / f"{key}.o"
+
+        try:
+            buffer = path.read_bytes()
+            os.utime(path) # mark as recently used
+        except FileNotFoundError:
+            with self.__lock:
+                self.__misses += 1
+
+            return None
+
+        with self.__lock:
+            self.__hits += 1
+
+        return buffer
+
+    def store(self, key: str, buffer: bytes) -> None:
+        path = self.__directory / f"{key}.o"
+        temp_path = path.with_name(f"{key}.{os.getpid()}.{get_ident()}.{time.monotonic_ns()}.tmp")
 
-def run_llvm(module: llvm.ModuleRef, entry_func_name: str) -> ExitCode:
-    global __LLVM_INITED, __LLVM_TARGET_MACHINE
+        temp_path.write_bytes(buffer)
+        os.replace(temp_path, path)
 
-    if not __LLVM_INITED:
-        llvm.initialize()
-        llvm.initialize_native_target()
-        llvm.initialize_native_asmprinter()
+        self.__evict()
+
+    def __evict(self) -> None:
+        # Remove least recently used objects until the directory fits within the size bound
+        entries = []
+
+        for path in self.__directory.glob("*.o"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total_size <= self.__max_size:
+                break
+
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+            total_size -= size
+
+    @property
+    def directory(self) -> Path:
+        return self.__directory
+
+    @property
+    def max_size(self) -> int:
+        return self.__max_size
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+class JITSession:
+    def __init__(self, object_cache: Optional[ObjectCache] = None, optimization: Optional[OptimizationOptions] = None) -> None:
+        initialize_llvm()
 
         # Create a target machine representing the host
         target = llvm.Target.from_default_triple()
-        __LLVM_TARGET_MACHINE = target.create_target_machine()
+        cpu_name = llvm.get_host_cpu_name()
+        cpu_features = llvm.get_host_cpu_features().flatten()
+        self.__target_machine = target.create_target_machine(cpu=cpu_name, features=cpu_features)
+
+        # The engine is created once around an empty module; programs are added to it incrementally
+        self.__engine = llvm.create_mcjit_compiler(llvm.parse_assembly(""), self.__target_machine)
+        self.__modules : List[llvm.ModuleRef] = []
+        self.__removed_modules = 0
+        self.__lock = Lock()
+        self.__object_cache = object_cache
+        self.__optimization = optimization
+        self.__last_pass_timings : Optional[str] = None
+
+        if object_cache is not None:
+            object_cache.attach(self.__engine, f"{self.__target_machine.triple}:{cpu_name}:{cpu_features}")
+
+    def add_module(self, module: llvm.ModuleRef) -> None:
+        with self.__lock:
+            if module in self.__modules:
+                raise Exception("Module has already been added to the JIT session!")
+
+            # Optimize before handing the module over so the object cache is keyed by the optimized IR
+            if self.__optimization is not None:
+                self.__last_pass_timings = optimize(module, self.__optimization, self.__target_machine)
+
+            self.__engine.add_module(module)
+            self.__engine.finalize_object()
+            self.__engine.run_static_constructors()
+            self.__modules.append(module)
+
+    def remove_module(self, module: llvm.ModuleRef) -> None:
+        with self.__lock:
+            if module not in self.__modules:
+                raise Exception("Module has not been added to the JIT session!")
+
+            self.__engine.remove_module(module)
+            self.__modules.remove(module)
+            self.__removed_modules += 1
+
+    def get_function_address(self, name: str) -> int:
+        with self.__lock:
+            # MCJIT keeps code of removed modules alive, so only resolve names defined by added modules
+            if any(self.__defines_function(module, name) for module in self.__modules):
+                address = self.__engine.get_function_address(name)
+            else:
+                address = 0
+
+        if address == 0:
+            raise Exception(f"JIT session does not contain a function named {name}")
+
+        return address
+
+    @staticmethod
+    def __defines_function(module: llvm.ModuleRef, name: str) -> bool:
+        try:
+            return not module.get_function(name).is_declaration
+        except NameError:
+            return False
+
+    def run(self, entry_func_name: str) -> ExitCode:
+        # Run the function via ctypes
+        entry_func = CFUNCTYPE(c_int64)(self.get_function_address(entry_func_name))
+
+        exit_code = entry_func()
+        assert isinstance(exit_code, ExitCode)
+
+        return exit_code
+
+    @property
+    def target_machine(self) -> llvm.TargetMachine:
+        return self.__target_machine
+
+    @property
+    def modules(self) -> List[llvm.ModuleRef]:
+        return list(self.__modules)
+
+    @property
+    def removed_modules(self) -> int:
+        return self.__removed_modules
+
+    @property
+    def object_cache(self) -> Optional[ObjectCache]:
+        return self.__object_cache
+
+    @property
+    def optimization(self) -> Optional[OptimizationOptions]:
+        return self.__optimization
+
+    @property
+    def last_pass_timings(self) -> Optional[str]:
+        return self.__last_pass_timings
+
+# MCJIT only frees the code of removed modules along with its engine, so the default session is
+# replaced once this many modules have run in it
+DEFAULT_SESSION_MAX_REMOVED_MODULES = 256
+
+__DEFAULT_SESSIONS = local()
+__DEFAULT_OBJECT_CACHE_LOCK = Lock()
+__DEFAULT_OBJECT_CACHE : Optional[ObjectCache] = None
+__DEFAULT_OBJECT_CACHE_SET : bool = False
+
+def get_default_object_cache() -> Optional[ObjectCache]:
+    global __DEFAULT_OBJECT_CACHE, __DEFAULT_OBJECT_CACHE_SET
+
+    with __DEFAULT_OBJECT_CACHE_LOCK:
+        if not __DEFAULT_OBJECT_CACHE_SET:
+            try:
+                __DEFAULT_OBJECT_CACHE = ObjectCache(get_DefaultCacheDirectory() / "jit")
+            except OSError:
+                __DEFAULT_OBJECT_CACHE = None # run uncached if the cache directory cannot be created
+
+            __DEFAULT_OBJECT_CACHE_SET = True
+
+        return __DEFAULT_OBJECT_CACHE
+
+def set_default_object_cache(object_cache: Optional[ObjectCache]) -> None:
+    # Used by default sessions created from now on; None turns caching off
+    global __DEFAULT_OBJECT_CACHE, __DEFAULT_OBJECT_CACHE_SET
+
+    with __DEFAULT_OBJECT_CACHE_LOCK:
+        __DEFAULT_OBJECT_CACHE = object_cache
+        __DEFAULT_OBJECT_CACHE_SET = True
 
-        __LLVM_INITED = True
+def get_default_session() -> JITSession:
+    # Sessions are per thread so that concurrent callers never share an engine
+    session = getattr(__DEFAULT_SESSIONS, "session", None)
+    object_cache = get_default_object_cache()
 
-    assert __LLVM_TARGET_MACHINE is not None # drops Optional from type
+    if session is None or (not session.modules and (session.removed_modules >= DEFAULT_SESSION_MAX_REMOVED_MODULES or session.object_cache is not object_cache)):
+        __DEFAULT_SESSIONS.session = JITSession(object_cache)
 
-    # Create an execution engine
-    engine = llvm.create_mcjit_compiler(module, __LLVM_TARGET_MACHINE)
-    engine.finalize_object()
-    engine.run_static_constructors()
+    return __DEFAULT_SESSIONS.session
 
-    # Run the function via ctypes
-    entry_func_ptr = engine.get_function_address(entry_func_name)
-    entry_func = CFUNCTYPE(c_int64)(entry_func_ptr)
+def run_llvm(module: llvm.ModuleRef, entry_func_name: str, session: Optional[JITSession] = None) -> ExitCode:
+    if session is None:
+        session = get_default_session()
 
-    exit_code = entry_func()
-    assert isinstance(exit_code, ExitCode)
+    session.add_module(module)
 
-    return exit_code 
+    try:
+        return session.run(entry_func_name)
+    finally:
+        session.remove_module(module)
@@ -1,18 +1,25 @@
 from dataclasses import dataclass
-import subprocess
 import time
-from typing import Any, Dict, List, Optional, cast
+from typing import Any, Dict, List, Optional, Tuple, cast
 from pathlib import Path
 import click
 import xml.etree.ElementTree as ET
 import xml.dom.minidom
 
 from slate.ast import ASTModule
+from slate.slasm.program import Program
+from slate.slasm.visitors import llvm_visitor as slasm_llvm_visitor
 from slate.slasm.visitors import xml_visitor as slasm_xml_visitor
 from slate.slasm.visitors import nasm_visitor as slasm_nasm_visitor
+from slate.slasm import cfg as slasm_cfg
+from slate.slasm import llvm_runtime as slasm_llvm_runtime
+from slate.slasm import peephole as slasm_peephole
+from slate.slasm import toolchain as slasm_toolchain
+from slate.slasm import vm as slasm_vm
 from slate.visitors import slasm_emitter
 
 from . import parser, interpreter
+from .optimizer import OptimizationOptions
 from .visitors import serializer, llvm_emitter, typechecker
 
 @dataclass
@@ -29,14 +36,7 @@ def cli(ctx: click.Context, emit_ast: bool):
     if cli_context is not None:
         cli_context.emit_ast = emit_ast
 
-@cli.command(help="Runs the specified file.")
-@click.option('--emit-slasm', is_flag=True)
-@click.option('-O', '--optimize', is_flag=True)
-@click.argument('file_path', type=click.Path(exists=True, dir_okay=False, path_type=Path), required=True, nargs=1)
-@click.pass_context
-def compile(ctx: click.Context, emit_slasm: bool, optimize: bool, file_path: Path):
-    cli_context = cast(CLIContext, ctx.find_object(CLIContext))
-    
+def __emit_Slasm(cli_context: CLIContext, file_path: Path, emit_slasm: bool, emit_llvm: bool, optimization: OptimizationOptions) -> Program:
     # Parse
     print(f"Parsing {file_path} ...")
     start_time = time.perf_counter()
@@ -78,6 +78,21 @@ def compile(ctx: click.Context, emit_slasm: bool, optimize: bool, file_path: Pat
 
             output_file.write(xml.dom.minidom.parseString(ET.tostring(serialization, 'unicode')).toprettyxml(indent='    '))
 
+    # Emit LLVM
+    if emit_llvm:
+        print(f"\nConverting to LLVM...")
+        start_time = time.perf_counter()
+
+        llvm_module, pass_timings = llvm_emitter.compile_modules(list(modules.values()), optimization)
+
+        with file_path.with_suffix(file_path.suffix + ".ll").open("w") as output_file:
+            output_file.write(str(llvm_module))
+
+        if pass_timings is not None:
+            print(pass_timings)
+
+        print(f"LLVM conversion took {time.perf_counter() - start_time} seconds")
+
     # Convert to slasm
     print(f"\nConverting to slasm...")
     start_time = time.perf_counter()
@@ -86,39 +101,147 @@ def compile(ctx: click.Context, emit_slasm: bool, optimize: bool, file_path: Pat
 
     print(f"Slasm conversion took {time.perf_counter() - start_time} seconds")
 
+    # Optimize slasm
+    if optimization.opt_level > 0:
+        removed_blocks, merged_blocks = slasm_cfg.simplify_Program(slasm_program)
+        print(f"Removed {removed_blocks} unreachable and merged {merged_blocks} basic blocks")
+
+        rewrites = slasm_peephole.optimize_Program(slasm_program)
+
+        for rule_name, count in sorted(rewrites.items()):
+            print(f"Peephole rule {rule_name} rewrote {count} times")
+
     # Emit slasm
     if emit_slasm:
         with file_path.with_suffix(file_path.suffix + ".slasm.xml").open("w") as output_file:
             output_file.write(slasm_xml_visitor.to_string(slasm_xml_visitor.emit_Program(slasm_program)))
 
-    # Run program
+    return slasm_program
+
+def __emit_Assembly(slasm_program: Program, file_path: Path, opt_level: int, jobs: int, platform: slasm_toolchain.Platform, calling_convention: slasm_nasm_visitor.CallingConvention) -> Path:
+    # Emit assembly
+    print(f"\nEmitting assembly...")
+    start_time = time.perf_counter()
+
+    all_native_funcs = {
+        "LINUX_x86_64_SYSCALL1_WITH_RET": slasm_nasm_visitor.GlobalContext.FuncDef(["code", "arg1"], [], True),
+        "LINUX_x86_64_SYSCALL1_NO_RET": slasm_nasm_visitor.GlobalContext.FuncDef(["code", "arg1"], [], False),
+        "C_CALL_3_WITH_RET": slasm_nasm_visitor.GlobalContext.FuncDef(["func", "num_floats", "arg1", "arg2"], [], True),
+        "C_CALL_3_NO_RET": slasm_nasm_visitor.GlobalContext.FuncDef(["func", "num_floats", "arg1", "arg2"], [], False),
+        "DEBUG_PRINT_I64": slasm_nasm_visitor.GlobalContext.FuncDef(["value"], [], False),
+    }
+
+    native_funcs = {name: func_def for name, func_def in all_native_funcs.items() if name in platform.natives}
+
+    asm_file_path = file_path.with_suffix(file_path.suffix + ".asm")
+
+    with asm_file_path.open("w") as file:
+        slasm_nasm_visitor.write_Program(slasm_program, slasm_toolchain.read_Template(platform), native_funcs, file, cache_registers=2 if opt_level > 0 else 0, fuse_operands=opt_level > 0, jobs=jobs, calling_convention=calling_convention)
+
+    print(f"Emitting assembly took {time.perf_counter() - start_time} seconds")
+
+    return asm_file_path
+
+def __emit_Objects(slasm_program: Program, optimization: OptimizationOptions, jobs: int, platform: slasm_toolchain.Platform, freestanding: bool, whole_program: bool) -> List[bytes]:
+    print(f"\nEmitting objects...")
+    start_time = time.perf_counter()
+
+    setup = lambda llvm_module: slasm_llvm_runtime.define_Runtime(llvm_module, platform.natives, slasm_program.entry, freestanding)
+    objects = slasm_llvm_visitor.compile_Objects(slasm_program, setup, optimization, jobs, whole_program)
+
+    print(f"Emitting objects took {time.perf_counter() - start_time} seconds")
+
+    return objects
+
+@cli.command(help="Compiles the specified files.")
+@click.option('--emit-slasm', is_flag=True)
+@click.option('--emit-llvm', is_flag=True)
+@click.option('-O', '--opt-level', type=click.IntRange(0, 3), default=0)
+@click.option('--size-level', type=click.IntRange(0, 2), default=0)
+@click.option('--inline-threshold', type=int, default=None)
+@click.option('--time-passes', is_flag=True)
+@click.option('-j', '--jobs', type=click.IntRange(1), default=1)
+@click.option('--builtin-assembler', is_flag=True, help="Assemble with the built-in ELF64 assembler instead of nasm.")
+@click.option('--cache-dir', type=click.Path(file_okay=False, path_type=Path), default=None, help="Directory of cached objects and executables.")
+@click.option('--no-cache', is_flag=True)
+@click.option('--freestanding', is_flag=True, help="Produce a static Linux executable that does not use the C library.")
+@click.option('--calling-convention', type=click.Choice(['stack', 'sysv']), default='stack', help="Pass arguments on the stack, or the first six in registers as System V does.")
+@click.option('--backend', type=click.Choice(['nasm', 'llvm']), default='nasm', help="Generate assembly for the nasm templates, or object files with LLVM.")
+@click.option('--lto', is_flag=True, help="Optimize the whole program at once with the llvm backend, so calls are inlined across its parts.")
+@click.argument('file_paths', type=click.Path(exists=True, dir_okay=False, path_type=Path), required=True, nargs=-1)
+@click.pass_context
+def compile(ctx: click.Context, emit_slasm: bool, emit_llvm: bool, opt_level: int, size_level: int, inline_threshold: Optional[int], time_passes: bool, jobs: int, builtin_assembler: bool, cache_dir: Optional[Path], no_cache: bool, freestanding: bool, calling_convention: str, backend: str, lto: bool, file_paths: Tuple[Path, ...]):
+    cli_context = cast(CLIContext, ctx.find_object(CLIContext))
+
+    try:
+        platform = slasm_toolchain.get_Platform(freestanding=freestanding)
+
+        if calling_convention not in platform.calling_conventions:
+            raise Exception(f"The {calling_convention} calling convention is not supported on {platform.name}")
+        elif backend == 'llvm' and not platform.llvm_runtime:
+            raise Exception(f"The llvm backend is not supported on {platform.name}")
+    except Exception as e:
+        print(e)
+        exit(-1)
+
+    optimization = OptimizationOptions(opt_level, size_level, inline_threshold, time_passes)
+    targets : List[slasm_toolchain.BuildTarget] = []
+    objects : List[Tuple[List[bytes], Path]] = []
+
+    for file_path in file_paths:
+        slasm_program = __emit_Slasm(cli_context, file_path, emit_slasm, emit_llvm, optimization)
+        executable_path = file_path.with_suffix(file_path.suffix + ".bin")
+
+        if backend == 'llvm':
+            objects.append((__emit_Objects(slasm_program, optimization, jobs, platform, freestanding, lto), executable_path))
+        else:
+            asm_file_path = __emit_Assembly(slasm_program, file_path, opt_level, jobs, platform, slasm_nasm_visitor.CallingConvention[calling_convention.upper()])
+            targets.append(slasm_toolchain.BuildTarget(asm_file_path, file_path.with_suffix(file_path.suffix + ".o"), executable_path))
+
+    # Assemble and link every target, and link the objects from LLVM, reusing the outputs of unchanged inputs
     print(f"\nCompiling...")
     start_time = time.perf_counter()
 
-    with open('slate/slasm/nasm_template.asm', 'r') as template_file:
-        template = template_file.read()
+    cache = slasm_toolchain.BuildCache(None if no_cache else (cache_dir or slasm_toolchain.get_DefaultCacheDirectory()))
+
+    try:
+        timings = slasm_toolchain.build_Targets(targets, platform, cache, jobs, builtin_assembler)
+        timings += [slasm_toolchain.link_Objects(target_objects, executable_path, platform, cache) for target_objects, executable_path in objects]
+    except Exception as e:
+        print(e)
+        exit(-1)
+
+    for timing in timings:
+        print(f"{timing.target}: {timing.step} took {timing.seconds:.4f} seconds{' (cached)' if timing.cached else ''}")
+
+    print(f"Compilation took {time.perf_counter() - start_time} seconds")
 
-        native_funcs = {
-            "LINUX_x86_64_SYSCALL1_WITH_RET": slasm_nasm_visitor.GlobalContext.FuncDef(2, True),
-            "LINUX_x86_64_SYSCALL1_NO_RET": slasm_nasm_visitor.GlobalContext.FuncDef(2, False),
-            "C_CALL_3_WITH_RET": slasm_nasm_visitor.GlobalContext.FuncDef(4, True),
-            "C_CALL_3_NO_RET": slasm_nasm_visitor.GlobalContext.FuncDef(4, False),
-            "DEBUG_PRINT_I64": slasm_nasm_visitor.GlobalContext.FuncDef(1, False),
-        }
+@cli.command(help="Runs the specified file on the slasm virtual machine.")
+@click.argument('file_path', type=click.Path(exists=True, dir_okay=False, path_type=Path), required=True, nargs=1)
+def run(file_path: Path):
+    parsing_context = parser.Context()
+
+    try:
+        parser.parse_file(file_path, parsing_context)
+    except parser.ParseError as e:
+        print(e.get_message_with_trace())
+        exit(-1)
 
-        asm_file_path = file_path.with_suffix(file_path.suffix + ".asm")
-        object_file_path = file_path.with_suffix(file_path.suffix + ".o")
-        executable_file_path = file_path.with_suffix(file_path.suffix + ".bin")
+    modules : List[ASTModule] = []
 
-        with asm_file_path.open("w") as file:
-            file.write(slasm_nasm_visitor.emit_Program(slasm_program, template, native_funcs))
+    for module in parsing_context.modules.values():
+        try:
+            modules.append(typechecker.visit(module))
+        except typechecker.TCError as e:
+            print(e)
+            exit(-1)
 
-        process = subprocess.run(f"nasm -f macho64 {asm_file_path} && gcc -arch x86_64 -o {executable_file_path} {object_file_path} && rm {object_file_path}", shell=True)
-        
-        if process.stdout:
-            print(process.stdout)
+    slasm_program = slasm_emitter.visit(modules, "slasm-vm")
 
-        if process.stderr:
-            print(process.stderr)
+    try:
+        exit_code = slasm_vm.VirtualMachine(slasm_program).run()
+    except slasm_vm.VMError as e:
+        print(e)
+        exit(-1)
 
-        print(f"Compilation took {time.perf_counter() - start_time} seconds")
+    exit(exit_code)
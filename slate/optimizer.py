@@ -0,0 +1,150 @@
+from dataclasses import dataclass
+import itertools
+from threading import Lock
+from typing import Iterable, Optional, Tuple
+import llvmlite.binding as llvm # type: ignore
+from llvmlite import ir # type: ignore
+
+__LLVM_INIT_LOCK = Lock()
+__LLVM_INITED : bool = False
+
+def initialize_llvm() -> None:
+    global __LLVM_INITED
+
+    with __LLVM_INIT_LOCK:
+        if not __LLVM_INITED:
+            llvm.initialize()
+            llvm.initialize_native_target()
+            llvm.initialize_native_asmprinter()
+            llvm.initialize_native_asmparser() # for inline assembly, such as the runtime's syscalls
+
+            __LLVM_INITED = True
+
+@dataclass(frozen=True)
+class OptimizationOptions:
+    opt_level : int = 2
+    size_level : int = 0
+    inline_threshold : Optional[int] = None
+    time_passes : bool = False
+
+    def __post_init__(self) -> None:
+        assert 0 <= self.opt_level <= 3, f"{self.opt_level} is not a valid optimization level"
+        assert 0 <= self.size_level <= 2, f"{self.size_level} is not a valid size level"
+
+def __get_default_inline_threshold(opt_level: int, size_level: int) -> int:
+    # Mirrors the thresholds clang picks for -O1 through -O3, -Os and -Oz
+    if opt_level > 2:
+        return 250
+    elif size_level == 1:
+        return 75
+    elif size_level == 2:
+        return 25
+    else:
+        return 225
+
+def __get_inline_threshold(options: OptimizationOptions) -> Optional[int]:
+    if options.inline_threshold is not None:
+        return options.inline_threshold
+    elif options.opt_level > 0:
+        return __get_default_inline_threshold(options.opt_level, options.size_level)
+
+    return None
+
+def optimize(module: llvm.ModuleRef, options: OptimizationOptions, target_machine: Optional[llvm.TargetMachine] = None) -> Optional[str]:
+    initialize_llvm()
+
+    pmb = llvm.create_pass_manager_builder()
+    pmb.opt_level = options.opt_level
+    pmb.size_level = options.size_level
+    inline_threshold = __get_inline_threshold(options)
+
+    if inline_threshold is not None:
+        pmb.inlining_threshold = inline_threshold
+
+    func_pm = llvm.create_function_pass_manager(module)
+    module_pm = llvm.create_module_pass_manager()
+
+    if target_machine is not None:
+        target_machine.add_analysis_passes(func_pm)
+        target_machine.add_analysis_passes(module_pm)
+
+    pmb.populate(func_pm)
+    pmb.populate(module_pm)
+
+    if options.time_passes:
+        llvm.set_time_passes(True)
+
+    try:
+        func_pm.initialize()
+
+        for func in module.functions:
+            func_pm.run(func)
+
+        func_pm.finalize()
+        module_pm.run(module)
+    finally:
+        if options.time_passes:
+            llvm.set_time_passes(False)
+
+    return llvm.report_and_reset_timings() if options.time_passes else None
+
+def link_Modules(modules: Iterable[llvm.ModuleRef]) -> llvm.ModuleRef:
+    # Linking consumes the modules
+    initialize_llvm()
+    linked_module = llvm.parse_assembly("")
+
+    for module in modules:
+        linked_module.link_in(module)
+
+    return linked_module
+
+def internalize(module: llvm.ModuleRef, preserved: Iterable[str]) -> None:
+    # Definitions that nothing outside the module refers to get internal linkage, so the optimizer
+    # knows all of their uses
+    preserved = set(preserved)
+
+    for value in itertools.chain(module.functions, module.global_variables):
+        if not value.is_declaration and value.name not in preserved:
+            value.linkage = llvm.Linkage.internal
+
+def optimize_WholeProgram(module: llvm.ModuleRef, preserved: Iterable[str], options: OptimizationOptions, target_machine: Optional[llvm.TargetMachine] = None) -> Optional[str]:
+    # For a module holding the whole program, such as one made by link_Modules, of which only the
+    # preserved symbols are used from outside
+    initialize_llvm()
+    internalize(module, preserved)
+    inline_threshold = __get_inline_threshold(options)
+
+    if inline_threshold is not None:
+        # Interprocedural passes run over the whole program before the usual pipeline: constants are
+        # propagated across calls, calls are inlined and definitions left without uses are dropped
+        module_pm = llvm.create_module_pass_manager()
+
+        if target_machine is not None:
+            target_machine.add_analysis_passes(module_pm)
+
+        module_pm.add_ipsccp_pass()
+        module_pm.add_global_optimizer_pass()
+        module_pm.add_dead_arg_elimination_pass()
+        module_pm.add_function_attrs_pass()
+        module_pm.add_function_inlining_pass(inline_threshold)
+        module_pm.add_global_dce_pass()
+        module_pm.add_constant_merge_pass()
+
+        if options.time_passes:
+            llvm.set_time_passes(True)
+
+        try:
+            module_pm.run(module)
+        finally:
+            if options.time_passes:
+                llvm.set_time_passes(False)
+
+    return optimize(module, options, target_machine)
+
+def optimize_ir(ir_module: ir.Module, options: OptimizationOptions, target_machine: Optional[llvm.TargetMachine] = None) -> Tuple[llvm.ModuleRef, Optional[str]]:
+    initialize_llvm()
+
+    module = llvm.parse_assembly(str(ir_module))
+    module.verify()
+
+    return module, optimize(module, options, target_machine)
@@ -0,0 +1,1104 @@
+import re
+import struct
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple, Union
+from slate.slasm.elf import ObjectFile, Relocation, Section, Symbol, R_X86_64_GOTPCREL, R_X86_64_PC32, R_X86_64_PLT32, is_NoBits, is_Section
+
+# Assembles the subset of NASM syntax that the nasm visitor and its templates use into an ELF64
+# relocatable object, which avoids running nasm for every compile
+
+class Register(NamedTuple):
+    number: int
+    size: int # 128 for xmm registers
+
+    @property
+    def is_xmm(self) -> bool:
+        return self.size == 128
+
+    @property
+    def needs_rex(self) -> bool:
+        # spl, bpl, sil and dil are only addressable with a REX prefix
+        return self.size == 8 and 4 <= self.number < 8
+
+class Memory(NamedTuple):
+    size: Optional[int]
+    base: Optional[int] # None for rip-relative symbols
+    index_reg: Optional[int]
+    scale: int
+    disp: int
+    symbol: Optional[str]
+    reloc_type: int
+
+class Immediate(NamedTuple):
+    value: int
+
+class Label(NamedTuple):
+    name: str
+    reloc_type: int
+
+Operand = Union[Register, Memory, Immediate, Label]
+
+class Fixup(NamedTuple):
+    offset: int
+    symbol: str
+    reloc_type: int
+    addend: int
+
+class Fragment(NamedTuple):
+    code: bytes
+    fixups: Tuple[Fixup, ...]
+
+class Branch(NamedTuple):
+    condition: Optional[int] # None for unconditional jumps
+    target: str
+
+class Align(NamedTuple):
+    alignment: int
+
+Item = Union[Fragment, Branch, Align]
+
+def __build_registers() -> Dict[str, Register]:
+    registers : Dict[str, Register] = {}
+    names = ["ax", "cx", "dx", "bx", "sp", "bp", "si", "di"]
+
+    for idx, name in enumerate(names):
+        registers["r" + name] = Register(idx, 64)
+        registers["e" + name] = Register(idx, 32)
+        registers[name] = Register(idx, 16)
+        registers[name[0] + "l" if idx < 4 else name + "l"] = Register(idx, 8)
+
+    for idx in range(8, 16):
+        registers[f"r{idx}"] = Register(idx, 64)
+        registers[f"r{idx}d"] = Register(idx, 32)
+        registers[f"r{idx}w"] = Register(idx, 16)
+        registers[f"r{idx}b"] = Register(idx, 8)
+
+    for idx in range(16):
+        registers[f"xmm{idx}"] = Register(idx, 128)
+
+    return registers
+
+__REGISTERS = __build_registers()
+
+__SIZES : Dict[str, int] = {
+    "byte": 8,
+    "word": 16,
+    "dword": 32,
+    "qword": 64,
+}
+
+__CONDITIONS : Dict[str, int] = {
+    "o": 0x0, "no": 0x1, "b": 0x2, "c": 0x2, "nae": 0x2, "ae": 0x3, "nb": 0x3, "nc": 0x3,
+    "e": 0x4, "z": 0x4, "ne": 0x5, "nz": 0x5, "be": 0x6, "na": 0x6, "a": 0x7, "nbe": 0x7,
+    "s": 0x8, "ns": 0x9, "p": 0xA, "pe": 0xA, "np": 0xB, "po": 0xB,
+    "l": 0xC, "nge": 0xC, "ge": 0xD, "nl": 0xD, "le": 0xE, "ng": 0xE, "g": 0xF, "nle": 0xF,
+}
+
+__WRT_RELOCATIONS : Dict[str, int] = {
+    "plt": R_X86_64_PLT32,
+    "gotpcrel": R_X86_64_GOTPCREL,
+}
+
+__LABEL = re.compile(r"^([A-Za-z_.?$][\w.?$@#~]*):(.*)$")
+__IDENTIFIER = re.compile(r"^[A-Za-z_.?$][\w.?$@#~]*$")
+__WRT = re.compile(r"^(.*?)\s+wrt\s+\.\.(\w+)$", re.IGNORECASE)
+__TERM = re.compile(r"([+-]?)\s*([^+\-\s]+)")
+
+class AssemblyContext:
+    def __init__(self) -> None:
+        self.__sections : Dict[str, List[Item]] = {}
+        self.__labels : Dict[str, Tuple[str, int]] = {}
+        self.__globals : Set[str] = set()
+        self.__externs : Set[str] = set()
+        self.__macros : Dict[str, List[str]] = {}
+        self.__defines : Set[str] = set()
+        self.__encodings : Dict[Tuple[str, str, bool], Item] = {}
+        self.__section = ".text"
+        self.__scope = ""
+        self.default_rel = False
+
+    def qualify(self, name: str) -> str:
+        # Local labels start with a single dot and belong to the preceding non-local label
+        if name.startswith(".") and not name.startswith(".."):
+            return self.__scope + name
+
+        return name
+
+    def define_label(self, name: str) -> None:
+        qualified = self.qualify(name)
+
+        if qualified in self.__labels:
+            raise Exception(f"Label {qualified} is defined more than once")
+
+        if not name.startswith("."):
+            self.__scope = name
+
+        self.__labels[qualified] = (self.__section, len(self.__sections.setdefault(self.__section, [])))
+
+    def define_macro(self, name: str, lines: List[str]) -> None:
+        self.__macros[name] = lines
+
+    def get_macro(self, name: str) -> Optional[List[str]]:
+        return self.__macros.get(name)
+
+    def define(self, name: str) -> None:
+        self.__defines.add(name)
+
+    def is_defined(self, name: str) -> bool:
+        return name in self.__defines
+
+    def set_section(self, name: str) -> None:
+        if not is_Section(name):
+            raise Exception(f"Unsupported section {name}")
+
+        self.__section = name
+
+    def declare_global(self, name: str) -> None:
+        self.__globals.add(name)
+
+    def declare_extern(self, name: str) -> None:
+        self.__externs.add(name)
+
+    def append(self, item: Item) -> None:
+        self.__sections.setdefault(self.__section, []).append(item)
+
+    def get_encoding(self, code: str) -> Optional[Item]:
+        return self.__encodings.get((code, self.__scope if "." in code else "", self.default_rel))
+
+    def set_encoding(self, code: str, item: Item) -> None:
+        self.__encodings[(code, self.__scope if "." in code else "", self.default_rel)] = item
+
+    @property
+    def section(self) -> str:
+        return self.__section
+
+    @property
+    def sections(self) -> Dict[str, List[Item]]:
+        return self.__sections
+
+    @property
+    def labels(self) -> Dict[str, Tuple[str, int]]:
+        return self.__labels
+
+    @property
+    def globals(self) -> Set[str]:
+        return self.__globals
+
+    @property
+    def externs(self) -> Set[str]:
+        return self.__externs
+
+def __strip_comment(line: str) -> str:
+    if '"' not in line and "'" not in line:
+        return line.split(';', 1)[0]
+
+    quote = None
+
+    for idx, char in enumerate(line):
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char == '"' or char == "'":
+            quote = char
+        elif char == ';':
+            return line[:idx]
+
+    return line
+
+def __split_operands(text: str) -> List[str]:
+    operands : List[str] = []
+    quote = None
+    depth = 0
+    start = 0
+
+    for idx, char in enumerate(text):
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char == '"' or char == "'":
+            quote = char
+        elif char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            operands.append(text[start:idx].strip())
+            start = idx + 1
+
+    operands.append(text[start:].strip())
+    return operands
+
+def __parse_number(text: str) -> Optional[int]:
+    # Character constants are little endian, as in nasm
+    if len(text) >= 3 and text[0] == text[-1] and text[0] in ('"', "'") and len(text) <= 10:
+        return int.from_bytes(text[1:-1].encode(), 'little')
+
+    text = text.replace('_', '')
+
+    try:
+        return int(text, 0)
+    except ValueError:
+        pass
+
+    try:
+        return int(text, 10)
+    except ValueError:
+        return None
+
+def __parse_memory(text: str, size: Optional[int], ctx: AssemblyContext) -> Memory:
+    text = text.strip()
+    reloc_type = R_X86_64_PC32
+    wrt = __WRT.match(text)
+
+    if wrt is not None:
+        if wrt[2].lower() != "gotpcrel":
+            raise Exception(f"Unsupported memory operand [{text}]")
+
+        text, reloc_type = wrt[1], R_X86_64_GOTPCREL
+
+    rip_relative = ctx.default_rel
+
+    if text.lower().startswith("rel "):
+        text, rip_relative = text[4:], True
+    elif text.lower().startswith("abs "):
+        text, rip_relative = text[4:], False
+
+    base : Optional[Register] = None
+    index : Optional[Register] = None
+    scale = 1
+    symbol : Optional[str] = None
+    disp = 0
+
+    for sign, term in __TERM.findall(re.sub(r"\s*\*\s*", "*", text)):
+        number = __parse_number(term)
+        scaled = term.lower().split('*')
+
+        if number is not None:
+            disp += -number if sign == "-" else number
+        elif len(scaled) == 2 and scaled[0] in __REGISTERS and scaled[1] in ("1", "2", "4", "8") and index is None and sign != "-":
+            index, scale = __REGISTERS[scaled[0]], int(scaled[1])
+        elif term.lower() in __REGISTERS and base is None and sign != "-":
+            base = __REGISTERS[term.lower()]
+        elif term.lower() in __REGISTERS and index is None and sign != "-":
+            index = __REGISTERS[term.lower()]
+        elif __IDENTIFIER.match(term) and symbol is None and sign != "-":
+            symbol = ctx.qualify(term)
+        else:
+            raise Exception(f"Unsupported memory operand [{text}]")
+
+    if symbol is not None:
+        if base is not None or index is not None or not rip_relative:
+            raise Exception(f"Only rip-relative addressing of symbols is supported: [{text}]")
+
+        return Memory(size, None, None, 1, disp, symbol, reloc_type)
+    elif base is None or base.size != 64 or base.is_xmm:
+        raise Exception(f"Unsupported memory operand [{text}]")
+    elif index is not None and (index.size != 64 or index.is_xmm or index.number == 4):
+        raise Exception(f"Unsupported index register in [{text}]")
+    elif not -2**31 <= disp < 2**31:
+        raise Exception(f"Displacement out of range: [{text}]")
+
+    return Memory(size, base.number, None if index is None else index.number, scale, disp, None, 0)
+
+def __parse_operand(text: str, ctx: AssemblyContext) -> Operand:
+    size : Optional[int] = None
+    parts = text.split(None, 1)
+
+    if len(parts) == 2 and parts[0].lower() in __SIZES:
+        size, text = __SIZES[parts[0].lower()], parts[1].strip()
+
+    if text.startswith('['):
+        if not text.endswith(']'):
+            raise Exception(f"Unterminated memory operand {text}")
+
+        return __parse_memory(text[1:-1], size, ctx)
+    elif text.lower() in __REGISTERS:
+        return __REGISTERS[text.lower()]
+
+    number = __parse_number(text)
+
+    if number is not None:
+        return Immediate(number)
+
+    reloc_type = R_X86_64_PLT32
+    wrt = __WRT.match(text)
+
+    if wrt is not None:
+        if wrt[2].lower() not in __WRT_RELOCATIONS:
+            raise Exception(f"Unsupported operand {text}")
+
+        text, reloc_type = wrt[1], __WRT_RELOCATIONS[wrt[2].lower()]
+
+    if __IDENTIFIER.match(text) is None:
+        raise Exception(f"Unsupported operand {text}")
+
+    return Label(ctx.qualify(text), reloc_type)
+
+def __encode(prefix: bytes, opcode: bytes, reg: int, rm: Union[Register, Memory], w: bool, imm: bytes = b"", force_rex: bool = False) -> Fragment:
+    base = rm.number if isinstance(rm, Register) else rm.base
+    index = None if isinstance(rm, Register) else rm.index_reg
+    rex = 0x40 | (w << 3) | ((reg >> 3) << 2) | (((index or 0) >> 3) << 1) | ((base or 0) >> 3)
+    code = bytearray(prefix)
+    fixups : Tuple[Fixup, ...] = ()
+
+    if rex != 0x40 or force_rex:
+        code.append(rex)
+
+    code += opcode
+
+    if isinstance(rm, Register):
+        code.append(0xC0 | ((reg & 7) << 3) | (rm.number & 7))
+    elif rm.base is None:
+        # The displacement is relative to the end of the instruction, past any immediate
+        assert rm.symbol is not None
+        code.append(((reg & 7) << 3) | 5)
+        fixups = (Fixup(len(code), rm.symbol, rm.reloc_type, rm.disp - 4 - len(imm)),)
+        code += bytes(4)
+    else:
+        low = rm.base & 7
+
+        if rm.disp == 0 and low != 5:
+            mod = 0
+        elif -128 <= rm.disp < 128:
+            mod = 1
+        else:
+            mod = 2
+
+        if rm.index_reg is not None:
+            # A SIB byte holds the scaled index
+            code.append((mod << 6) | ((reg & 7) << 3) | 4)
+            code.append(({1: 0, 2: 1, 4: 2, 8: 3}[rm.scale] << 6) | ((rm.index_reg & 7) << 3) | low)
+        else:
+            code.append((mod << 6) | ((reg & 7) << 3) | low)
+
+            if low == 4:
+                code.append(0x24)
+
+        if mod == 1:
+            code += struct.pack('<b', rm.disp)
+        elif mod == 2:
+            code += struct.pack('<i', rm.disp)
+
+    return Fragment(bytes(code + imm), fixups)
+
+def __operand_size(*operands: Operand) -> int:
+    for operand in operands:
+        if isinstance(operand, Register) and not operand.is_xmm:
+            return operand.size
+
+    for operand in operands:
+        if isinstance(operand, Memory) and operand.size is not None:
+            return operand.size
+
+    raise Exception("Operation size not specified")
+
+def __needs_rex(*operands: Operand) -> bool:
+    return any(isinstance(operand, Register) and operand.needs_rex for operand in operands)
+
+def __size_prefix(size: int) -> bytes:
+    return b"\x66" if size == 16 else b""
+
+def __normalize(value: int, size: int) -> int:
+    # Immediates wider than the operation wrap around, as they do in nasm
+    if not -2**63 <= value < 2**64:
+        raise Exception(f"Immediate {value} is out of range")
+
+    value &= (1 << size) - 1
+
+    if value >= 1 << (size - 1):
+        value -= 1 << size
+
+    return value
+
+def __imm(value: int, size: int) -> bytes:
+    return struct.pack({8: '<B', 16: '<H', 32: '<I', 64: '<Q'}[size], value & ((1 << size) - 1))
+
+def __fits(value: int, bits: int) -> bool:
+    return -2**(bits - 1) <= value < 2**(bits - 1)
+
+def __expect(mnemonic: str, operands: List[Operand], count: int) -> None:
+    if len(operands) != count:
+        raise Exception(f"{mnemonic} expects {count} operands")
+
+def __unsupported(mnemonic: str, operands: List[Operand]) -> Exception:
+    return Exception(f"Unsupported operands for {mnemonic}: {operands}")
+
+def __encode_ALU(mnemonic: str, n: int) -> Callable[[List[Operand]], Item]:
+    # add, or, adc, sbb, and, sub, xor and cmp share their encodings apart from the opcode extension
+    def encode(operands: List[Operand]) -> Item:
+        __expect(mnemonic, operands, 2)
+        dst, src = operands
+        size = __operand_size(dst, src)
+        prefix = __size_prefix(size)
+        byte = size == 8
+
+        if isinstance(src, Register) and isinstance(dst, (Register, Memory)):
+            return __encode(prefix, bytes([n * 8 + (0 if byte else 1)]), src.number, dst, size == 64, force_rex=__needs_rex(dst, src))
+        elif isinstance(dst, Register) and isinstance(src, Memory):
+            return __encode(prefix, bytes([n * 8 + (2 if byte else 3)]), dst.number, src, size == 64, force_rex=__needs_rex(dst))
+        elif isinstance(src, Immediate) and isinstance(dst, (Register, Memory)):
+            value = __normalize(src.value, size)
+            accumulator = isinstance(dst, Register) and dst.number == 0
+
+            if byte:
+                if accumulator:
+                    return Fragment(bytes([n * 8 + 4]) + __imm(value, 8), ())
+
+                return __encode(prefix, b"\x80", n, dst, False, __imm(value, 8), __needs_rex(dst))
+            elif __fits(value, 8):
+                return __encode(prefix, b"\x83", n, dst, size == 64, __imm(value, 8))
+            elif not __fits(value, 32):
+                raise Exception(f"Immediate {src.value} does not fit in 32 bits")
+
+            imm = __imm(value, min(size, 32))
+
+            if accumulator:
+                return Fragment(prefix + (b"\x48" if size == 64 else b"") + bytes([n * 8 + 5]) + imm, ())
+
+            return __encode(prefix, b"\x81", n, dst, size == 64, imm)
+
+        raise __unsupported(mnemonic, operands)
+
+    return encode
+
+def __encode_UNARY(mnemonic: str, opcode: int, n: int) -> Callable[[List[Operand]], Item]:
+    # The F6/F7 and FE/FF groups: not, neg, mul, div, idiv, inc, dec and one operand imul
+    def encode(operands: List[Operand]) -> Item:
+        __expect(mnemonic, operands, 1)
+        operand = operands[0]
+
+        if not isinstance(operand, (Register, Memory)):
+            raise __unsupported(mnemonic, operands)
+
+        size = __operand_size(operand)
+        return __encode(__size_prefix(size), bytes([opcode - 1 if size == 8 else opcode]), n, operand, size == 64, force_rex=__needs_rex(operand))
+
+    return encode
+
+def __encode_SHIFT(mnemonic: str, n: int) -> Callable[[List[Operand]], Item]:
+    def encode(operands: List[Operand]) -> Item:
+        __expect(mnemonic, operands, 2)
+        dst, amt = operands
+
+        if not isinstance(dst, (Register, Memory)):
+            raise __unsupported(mnemonic, operands)
+
+        size = __operand_size(dst)
+        prefix = __size_prefix(size)
+        byte = size == 8
+
+        if isinstance(amt, Immediate):
+            if amt.value == 1:
+                return __encode(prefix, b"\xD0" if byte else b"\xD1", n, dst, size == 64, force_rex=__needs_rex(dst))
+
+            return __encode(prefix, b"\xC0" if byte else b"\xC1", n, dst, size == 64, __imm(amt.value, 8), __needs_rex(dst))
+        elif amt == __REGISTERS["cl"]:
+            return __encode(prefix, b"\xD2" if byte else b"\xD3", n, dst, size == 64, force_rex=__needs_rex(dst))
+
+        raise __unsupported(mnemonic, operands)
+
+    return encode
+
+def __encode_BIT_TEST(mnemonic: str, n: int) -> Callable[[List[Operand]], Item]:
+    def encode(operands: List[Operand]) -> Item:
+        __expect(mnemonic, operands, 2)
+        dst, bit = operands
+
+        if not isinstance(dst, (Register, Memory)) or not isinstance(bit, Immediate):
+            raise __unsupported(mnemonic, operands)
+
+        size = __operand_size(dst)
+        return __encode(__size_prefix(size), b"\x0F\xBA", n, dst, size == 64, __imm(bit.value, 8))
+
+    return encode
+
+def __encode_SETCC(mnemonic: str, condition: int) -> Callable[[List[Operand]], Item]:
+    def encode(operands: List[Operand]) -> Item:
+        __expect(mnemonic, operands, 1)
+        dst = operands[0]
+
+        if not isinstance(dst, (Register, Memory)) or __operand_size(dst) != 8:
+            raise __unsupported(mnemonic, operands)
+
+        return __encode(b"", bytes([0x0F, 0x90 + condition]), 0, dst, False, force_rex=__needs_rex(dst))
+
+    return encode
+
+def __encode_JCC(mnemonic: str, condition: Optional[int]) -> Callable[[List[Operand]], Item]:
+    def encode(operands: List[Operand]) -> Item:
+        __expect(mnemonic, operands, 1)
+        target = operands[0]
+
+        if isinstance(target, Label) and target.reloc_type == R_X86_64_PLT32:
+            return Branch(condition, target.name)
+        elif condition is None and isinstance(target, (Register, Memory)):
+            return __encode(b"", b"\xFF", 4, target, False)
+
+        raise __unsupported(mnemonic, operands)
+
+    return encode
+
+def __encode_CALL(operands: List[Operand]) -> Item:
+    __expect("call", operands, 1)
+    target = operands[0]
+
+    if isinstance(target, Label):
+        if target.reloc_type != R_X86_64_PLT32:
+            raise __unsupported("call", operands)
+
+        # Calls to symbols outside the object go through the PLT so they link into any executable
+        return Fragment(b"\xE8" + bytes(4), (Fixup(1, target.name, R_X86_64_PLT32, -4),))
+    elif isinstance(target, (Register, Memory)):
+        return __encode(b"", b"\xFF", 2, target, False)
+
+    raise __unsupported("call", operands)
+
+def __encode_MOV(operands: List[Operand]) -> Item:
+    __expect("mov", operands, 2)
+    dst, src = operands
+    size = __operand_size(dst, src)
+    prefix = __size_prefix(size)
+    byte = size == 8
+
+    if isinstance(src, Register) and isinstance(dst, (Register, Memory)):
+        return __encode(prefix, b"\x88" if byte else b"\x89", src.number, dst, size == 64, force_rex=__needs_rex(dst, src))
+    elif isinstance(dst, Register) and isinstance(src, Memory):
+        return __encode(prefix, b"\x8A" if byte else b"\x8B", dst.number, src, size == 64, force_rex=__needs_rex(dst))
+    elif isinstance(dst, Register) and isinstance(src, Immediate):
+        value = __normalize(src.value, size)
+        rex = 0x41 if dst.number >= 8 else (0x40 if dst.needs_rex else 0)
+        opcode = bytes([(0xB0 if byte else 0xB8) + (dst.number & 7)])
+
+        if size != 64:
+            return Fragment(prefix + (bytes([rex]) if rex else b"") + opcode + __imm(value, size), ())
+        elif 0 <= value < 2**32:
+            # Writing the low half zero extends, which is what nasm picks for small constants
+            return Fragment((bytes([rex]) if rex else b"") + opcode + __imm(value, 32), ())
+        elif __fits(value, 32):
+            return __encode(b"", b"\xC7", 0, dst, True, __imm(value, 32))
+
+        return Fragment(bytes([0x48 | (dst.number >> 3)]) + opcode + __imm(value, 64), ())
+    elif isinstance(dst, Memory) and isinstance(src, Immediate):
+        value = __normalize(src.value, size)
+
+        if not __fits(value, 32):
+            raise Exception(f"Immediate {src.value} does not fit in 32 bits")
+
+        return __encode(prefix, b"\xC6" if byte else b"\xC7", 0, dst, size == 64, __imm(value, min(size, 32)))
+
+    raise __unsupported("mov", operands)
+
+def __encode_TEST(operands: List[Operand]) -> Item:
+    __expect("test", operands, 2)
+    dst, src = operands
+    size = __operand_size(dst, src)
+    prefix = __size_prefix(size)
+
+    if isinstance(src, Register) and isinstance(dst, (Register, Memory)):
+        return __encode(prefix, b"\x84" if size == 8 else b"\x85", src.number, dst, size == 64, force_rex=__needs_rex(dst, src))
+    elif isinstance(src, Immediate) and isinstance(dst, (Register, Memory)):
+        value = __normalize(src.value, size)
+        return __encode(prefix, b"\xF6" if size == 8 else b"\xF7", 0, dst, size == 64, __imm(value, min(size, 32)), __needs_rex(dst))
+
+    raise __unsupported("test", operands)
+
+def __encode_LEA(operands: List[Operand]) -> Item:
+    __expect("lea", operands, 2)
+    dst, src = operands
+
+    if not isinstance(dst, Register) or not isinstance(src, Memory):
+        raise __unsupported("lea", operands)
+
+    return __encode(__size_prefix(dst.size), b"\x8D", dst.number, src, dst.size == 64)
+
+def __encode_PUSH(operands: List[Operand]) -> Item:
+    __expect("push", operands, 1)
+    src = operands[0]
+
+    if isinstance(src, Register) and src.size == 64:
+        return Fragment((b"\x41" if src.number >= 8 else b"") + bytes([0x50 + (src.number & 7)]), ())
+    elif isinstance(src, Memory):
+        return __encode(b"", b"\xFF", 6, src, False)
+    elif isinstance(src, Immediate):
+        value = __normalize(src.value, 64)
+
+        if __fits(value, 8):
+            return Fragment(b"\x6A" + __imm(value, 8), ())
+        elif __fits(value, 32):
+            return Fragment(b"\x68" + __imm(value, 32), ())
+
+    raise __unsupported("push", operands)
+
+def __encode_POP(operands: List[Operand]) -> Item:
+    __expect("pop", operands, 1)
+    dst = operands[0]
+
+    if isinstance(dst, Register) and dst.size == 64:
+        return Fragment((b"\x41" if dst.number >= 8 else b"") + bytes([0x58 + (dst.number & 7)]), ())
+    elif isinstance(dst, Memory):
+        return __encode(b"", b"\x8F", 0, dst, False)
+
+    raise __unsupported("pop", operands)
+
+def __encode_XCHG(operands: List[Operand]) -> Item:
+    __expect("xchg", operands, 2)
+    dst, src = operands
+
+    if isinstance(dst, Register) and isinstance(src, Register) and dst.size == src.size and dst.size >= 32:
+        if dst.number == 0 or src.number == 0:
+            other = src if dst.number == 0 else dst
+            rex = 0x40 | ((dst.size == 64) << 3) | (other.number >> 3)
+            return Fragment((bytes([rex]) if rex != 0x40 else b"") + bytes([0x90 + (other.number & 7)]), ())
+
+        return __encode(b"", b"\x87", src.number, dst, dst.size == 64)
+
+    raise __unsupported("xchg", operands)
+
+def __encode_IMUL(operands: List[Operand]) -> Item:
+    if len(operands) == 1:
+        return __encode_UNARY("imul", 0xF7, 5)(operands)
+    elif len(operands) == 2 and isinstance(operands[1], Immediate):
+        operands = [operands[0], operands[0], operands[1]]
+
+    dst = operands[0]
+    src = operands[1] if len(operands) > 1 else None
+
+    if not isinstance(dst, Register) or dst.size == 8 or not isinstance(src, (Register, Memory)):
+        raise __unsupported("imul", operands)
+
+    prefix = __size_prefix(dst.size)
+
+    if len(operands) == 2:
+        return __encode(prefix, b"\x0F\xAF", dst.number, src, dst.size == 64)
+
+    imm = operands[2]
+
+    if len(operands) != 3 or not isinstance(imm, Immediate):
+        raise __unsupported("imul", operands)
+
+    value = __normalize(imm.value, dst.size)
+
+    if __fits(value, 8):
+        return __encode(prefix, b"\x6B", dst.number, src, dst.size == 64, __imm(value, 8))
+    elif not __fits(value, 32):
+        raise Exception(f"Immediate {imm.value} does not fit in 32 bits")
+
+    return __encode(prefix, b"\x69", dst.number, src, dst.size == 64, __imm(value, min(dst.size, 32)))
+
+def __encode_EXTEND(mnemonic: str, opcode: int) -> Callable[[List[Operand]], Item]:
+    # movzx and movsx from 8 or 16 bits
+    def encode(operands: List[Operand]) -> Item:
+        __expect(mnemonic, operands, 2)
+        dst, src = operands
+
+        if not isinstance(dst, Register) or not isinstance(src, (Register, Memory)):
+            raise __unsupported(mnemonic, operands)
+
+        if src.size not in (8, 16) or dst.size <= src.size:
+            raise __unsupported(mnemonic, operands)
+
+        return __encode(__size_prefix(dst.size), bytes([0x0F, opcode + (src.size == 16)]), dst.number, src, dst.size == 64, force_rex=__needs_rex(src))
+
+    return encode
+
+def __encode_MOVSXD(operands: List[Operand]) -> Item:
+    __expect("movsxd", operands, 2)
+    dst, src = operands
+
+    if not isinstance(dst, Register) or dst.size != 64 or not isinstance(src, (Register, Memory)) or src.size not in (None, 32):
+        raise __unsupported("movsxd", operands)
+
+    return __encode(b"", b"\x63", dst.number, src, True)
+
+def __encode_FIXED(code: bytes) -> Callable[[List[Operand]], Item]:
+    def encode(operands: List[Operand]) -> Item:
+        if len(operands) != 0:
+            raise Exception(f"Instruction {code.hex()} takes no operands")
+
+        return Fragment(code, ())
+
+    return encode
+
+def __encode_SSE(mnemonic: str, prefix: bytes, opcode: bytes, store_opcode: Optional[bytes] = None) -> Callable[[List[Operand]], Item]:
+    # Scalar and packed operations between an xmm register and an xmm register or memory
+    def encode(operands: List[Operand]) -> Item:
+        __expect(mnemonic, operands, 2)
+        dst, src = operands
+
+        if isinstance(dst, Register) and dst.is_xmm and (isinstance(src, Memory) or (isinstance(src, Register) and src.is_xmm)):
+            return __encode(prefix, opcode, dst.number, src, False)
+        elif store_opcode is not None and isinstance(dst, Memory) and isinstance(src, Register) and src.is_xmm:
+            return __encode(prefix, store_opcode, src.number, dst, False)
+
+        raise __unsupported(mnemonic, operands)
+
+    return encode
+
+def __encode_ROUND(mnemonic: str, opcode: int) -> Callable[[List[Operand]], Item]:
+    def encode(operands: List[Operand]) -> Item:
+        __expect(mnemonic, operands, 3)
+        dst, src, mode = operands
+
+        if not isinstance(dst, Register) or not dst.is_xmm or not isinstance(src, (Register, Memory)) or not isinstance(mode, Immediate):
+            raise __unsupported(mnemonic, operands)
+
+        return __encode(b"\x66", bytes([0x0F, 0x3A, opcode]), dst.number, src, False, __imm(mode.value, 8))
+
+    return encode
+
+def __encode_MOVD(mnemonic: str, size: int) -> Callable[[List[Operand]], Item]:
+    # movd and movq between general purpose and xmm registers
+    def encode(operands: List[Operand]) -> Item:
+        __expect(mnemonic, operands, 2)
+        dst, src = operands
+
+        if isinstance(dst, Register) and dst.is_xmm and isinstance(src, Register) and src.is_xmm and size == 64:
+            return __encode(b"\xF3", b"\x0F\x7E", dst.number, src, False)
+        elif isinstance(dst, Register) and dst.is_xmm and isinstance(src, (Register, Memory)) and src.size in (None, size):
+            return __encode(b"\x66", b"\x0F\x6E", dst.number, src, size == 64)
+        elif isinstance(src, Register) and src.is_xmm and isinstance(dst, (Register, Memory)) and dst.size in (None, size):
+            return __encode(b"\x66", b"\x0F\x7E", src.number, dst, size == 64)
+
+        raise __unsupported(mnemonic, operands)
+
+    return encode
+
+def __encode_CVTSI2F(mnemonic: str, prefix: bytes) -> Callable[[List[Operand]], Item]:
+    def encode(operands: List[Operand]) -> Item:
+        __expect(mnemonic, operands, 2)
+        dst, src = operands
+
+        if not isinstance(dst, Register) or not dst.is_xmm or not isinstance(src, (Register, Memory)) or src.size not in (32, 64):
+            raise __unsupported(mnemonic, operands)
+
+        return __encode(prefix, b"\x0F\x2A", dst.number, src, src.size == 64)
+
+    return encode
+
+def __encode_CVTF2SI(mnemonic: str, prefix: bytes, opcode: bytes) -> Callable[[List[Operand]], Item]:
+    def encode(operands: List[Operand]) -> Item:
+        __expect(mnemonic, operands, 2)
+        dst, src = operands
+
+        if not isinstance(dst, Register) or dst.size not in (32, 64) or not (isinstance(src, Memory) or (isinstance(src, Register) and src.is_xmm)):
+            raise __unsupported(mnemonic, operands)
+
+        return __encode(prefix, opcode, dst.number, src, dst.size == 64)
+
+    return encode
+
+__ENCODERS : Dict[str, Callable[[List[Operand]], Item]] = {
+    **{name: __encode_ALU(name, n) for n, name in enumerate(["add", "or", "adc", "sbb", "and", "sub", "xor", "cmp"])},
+    **{name: __encode_UNARY(name, 0xF7, n) for name, n in [("not", 2), ("neg", 3), ("mul", 4), ("div", 6), ("idiv", 7)]},
+    **{name: __encode_UNARY(name, 0xFF, n) for name, n in [("inc", 0), ("dec", 1)]},
+    **{name: __encode_SHIFT(name, n) for name, n in [("rol", 0), ("ror", 1), ("shl", 4), ("sal", 4), ("shr", 5), ("sar", 7)]},
+    **{name: __encode_BIT_TEST(name, n) for name, n in [("bt", 4), ("bts", 5), ("btr", 6), ("btc", 7)]},
+    **{"set" + name: __encode_SETCC("set" + name, condition) for name, condition in __CONDITIONS.items()},
+    **{"j" + name: __encode_JCC("j" + name, condition) for name, condition in __CONDITIONS.items()},
+    "jmp": __encode_JCC("jmp", None),
+    "call": __encode_CALL,
+    "mov": __encode_MOV,
+    "test": __encode_TEST,
+    "lea": __encode_LEA,
+    "push": __encode_PUSH,
+    "pop": __encode_POP,
+    "xchg": __encode_XCHG,
+    "imul": __encode_IMUL,
+    "movzx": __encode_EXTEND("movzx", 0xB6),
+    "movsx": __encode_EXTEND("movsx", 0xBE),
+    "movsxd": __encode_MOVSXD,
+    "cwd": __encode_FIXED(b"\x66\x99"),
+    "cdq": __encode_FIXED(b"\x99"),
+    "cqo": __encode_FIXED(b"\x48\x99"),
+    "leave": __encode_FIXED(b"\xC9"),
+    "nop": __encode_FIXED(b"\x90"),
+    "ret": __encode_FIXED(b"\xC3"),
+    "syscall": __encode_FIXED(b"\x0F\x05"),
+    "ud2": __encode_FIXED(b"\x0F\x0B"),
+    "movd": __encode_MOVD("movd", 32),
+    "movq": __encode_MOVD("movq", 64),
+    "movss": __encode_SSE("movss", b"\xF3", b"\x0F\x10", b"\x0F\x11"),
+    "movsd": __encode_SSE("movsd", b"\xF2", b"\x0F\x10", b"\x0F\x11"),
+    "movaps": __encode_SSE("movaps", b"", b"\x0F\x28", b"\x0F\x29"),
+    "movapd": __encode_SSE("movapd", b"\x66", b"\x0F\x28", b"\x0F\x29"),
+    **{name + suffix: __encode_SSE(name + suffix, prefix, bytes([0x0F, opcode]))
+        for name, opcode in [("sqrt", 0x51), ("add", 0x58), ("mul", 0x59), ("sub", 0x5C), ("min", 0x5D), ("div", 0x5E), ("max", 0x5F)]
+        for suffix, prefix in [("ss", b"\xF3"), ("sd", b"\xF2")]},
+    **{name + suffix: __encode_SSE(name + suffix, prefix, bytes([0x0F, opcode]))
+        for name, opcode in [("and", 0x54), ("andn", 0x55), ("or", 0x56), ("xor", 0x57)]
+        for suffix, prefix in [("ps", b""), ("pd", b"\x66")]},
+    "ucomiss": __encode_SSE("ucomiss", b"", b"\x0F\x2E"),
+    "ucomisd": __encode_SSE("ucomisd", b"\x66", b"\x0F\x2E"),
+    "comiss": __encode_SSE("comiss", b"", b"\x0F\x2F"),
+    "comisd": __encode_SSE("comisd", b"\x66", b"\x0F\x2F"),
+    "cvtss2sd": __encode_SSE("cvtss2sd", b"\xF3", b"\x0F\x5A"),
+    "cvtsd2ss": __encode_SSE("cvtsd2ss", b"\xF2", b"\x0F\x5A"),
+    "cvtsi2ss": __encode_CVTSI2F("cvtsi2ss", b"\xF3"),
+    "cvtsi2sd": __encode_CVTSI2F("cvtsi2sd", b"\xF2"),
+    "cvttss2si": __encode_CVTF2SI("cvttss2si", b"\xF3", b"\x0F\x2C"),
+    "cvttsd2si": __encode_CVTF2SI("cvttsd2si", b"\xF2", b"\x0F\x2C"),
+    "cvtss2si": __encode_CVTF2SI("cvtss2si", b"\xF3", b"\x0F\x2D"),
+    "cvtsd2si": __encode_CVTF2SI("cvtsd2si", b"\xF2", b"\x0F\x2D"),
+    "roundss": __encode_ROUND("roundss", 0x0A),
+    "roundsd": __encode_ROUND("roundsd", 0x0B),
+}
+
+def __parse_string(text: str) -> bytes:
+    if len(text) < 2 or text[0] != text[-1]:
+        raise Exception(f"Unterminated string {text}")
+
+    return text[1:-1].encode()
+
+def __assemble_DATA(mnemonic: str, text: str, ctx: AssemblyContext) -> None:
+    size = {"db": 1, "dw": 2, "dd": 4, "dq": 8}[mnemonic]
+    data = bytearray()
+
+    for value in __split_operands(text):
+        if value[:1] in ('"', "'"):
+            string = __parse_string(value)
+            data += string + bytes(-len(string) % size)
+            continue
+
+        number = __parse_number(value)
+
+        if number is None:
+            raise Exception(f"Unsupported data value {value}")
+
+        data += __imm(__normalize(number, size * 8), size * 8)
+
+    if is_NoBits(ctx.section):
+        raise Exception(f"Section {ctx.section} cannot contain initialized data")
+
+    ctx.append(Fragment(bytes(data), ()))
+
+def __assemble_RESERVE(mnemonic: str, text: str, ctx: AssemblyContext) -> None:
+    count = __parse_number(text.strip())
+
+    if count is None or count < 0:
+        raise Exception(f"Invalid reservation size {text}")
+
+    ctx.append(Fragment(bytes(count * {"resb": 1, "resw": 2, "resd": 4, "resq": 8}[mnemonic]), ()))
+
+def __assemble_ALIGN(mnemonic: str, text: str, ctx: AssemblyContext) -> None:
+    # Alignment relative to the section start is resolved once offsets are known
+    alignment = __parse_number(text.strip())
+
+    if alignment is None or alignment <= 0 or alignment & (alignment - 1) != 0:
+        raise Exception(f"Invalid alignment {text}")
+
+    ctx.append(Align(alignment))
+
+def __assemble_DIRECTIVE(mnemonic: str, text: str, ctx: AssemblyContext) -> None:
+    args = [arg.strip() for arg in text.split(',') if arg.strip() != ""]
+
+    if mnemonic in ("section", "segment"):
+        ctx.set_section(text.split()[0])
+    elif mnemonic == "global":
+        for arg in args:
+            ctx.declare_global(arg.split(':')[0])
+    elif mnemonic == "extern":
+        for arg in args:
+            ctx.declare_extern(arg.split(':')[0])
+    elif mnemonic == "default":
+        if text.strip().lower() not in ("rel", "abs"):
+            raise Exception(f"Unsupported default {text}")
+
+        ctx.default_rel = text.strip().lower() == "rel"
+    elif mnemonic == "bits":
+        if text.strip() != "64":
+            raise Exception("Only 64-bit code is supported")
+
+__DIRECTIVES : Dict[str, Callable[[str, str, AssemblyContext], None]] = {
+    **{name: __assemble_DIRECTIVE for name in ["section", "segment", "global", "extern", "default", "bits"]},
+    **{name: __assemble_DATA for name in ["db", "dw", "dd", "dq"]},
+    **{name: __assemble_RESERVE for name in ["resb", "resw", "resd", "resq"]},
+    "align": __assemble_ALIGN,
+}
+
+def __assemble_Statement(code: str, ctx: AssemblyContext) -> None:
+    # Generated code repeats the same few instructions, so encodings are reused. Local label names
+    # depend on the enclosing label, which is part of the key.
+    item = ctx.get_encoding(code)
+
+    if item is not None:
+        ctx.append(item)
+        return
+
+    if code.startswith('[') and code.endswith(']'):
+        code = code[1:-1].strip()
+
+    parts = code.split(None, 1)
+    mnemonic = parts[0].lower()
+    rest = parts[1] if len(parts) == 2 else ""
+    macro = ctx.get_macro(parts[0])
+
+    if macro is not None:
+        __assemble_Lines(macro, ctx)
+    elif mnemonic in __DIRECTIVES:
+        __DIRECTIVES[mnemonic](mnemonic, rest, ctx)
+    elif mnemonic in __ENCODERS:
+        operands = [__parse_operand(operand, ctx) for operand in __split_operands(rest)] if rest.strip() != "" else []
+        item = __ENCODERS[mnemonic](operands)
+        ctx.set_encoding(code, item)
+        ctx.append(item)
+    else:
+        raise Exception(f"Unknown instruction or directive {parts[0]}")
+
+def __assemble_Lines(lines: List[str], ctx: AssemblyContext) -> None:
+    macro : Optional[Tuple[str, List[str]]] = None
+    conditions : List[bool] = [] # whether each enclosing %ifdef or %else branch is assembled
+
+    for line_number, line in enumerate(lines):
+        code = __strip_comment(line).strip()
+
+        if macro is not None:
+            if code.lower() == "%endmacro":
+                ctx.define_macro(*macro)
+                macro = None
+            elif code != "":
+                macro[1].append(code)
+
+            continue
+        elif code == "":
+            continue
+
+        try:
+            parts = code.split()
+            directive = parts[0].lower()
+
+            if directive in ("%ifdef", "%ifndef"):
+                if len(parts) != 2:
+                    raise Exception(f"{directive} takes a single name")
+
+                conditions.append(ctx.is_defined(parts[1]) == (directive == "%ifdef"))
+                continue
+            elif directive in ("%else", "%endif"):
+                if len(conditions) == 0:
+                    raise Exception(f"{directive} without %ifdef")
+                elif directive == "%else":
+                    conditions[-1] = not conditions[-1]
+                else:
+                    conditions.pop()
+
+                continue
+            elif not all(conditions):
+                continue
+            elif directive == "%define":
+                if len(parts) != 2:
+                    raise Exception("Only defines without a value are supported")
+
+                ctx.define(parts[1])
+                continue
+            elif directive == "%macro":
+                if len(parts) != 3 or parts[2] != "0":
+                    raise Exception("Only macros without parameters are supported")
+
+                macro = (parts[1], [])
+                continue
+
+            label = __LABEL.match(code)
+
+            if label is not None:
+                ctx.define_label(label[1])
+                code = label[2].strip()
+
+                if code == "":
+                    continue
+
+            __assemble_Statement(code, ctx)
+        except Exception as e:
+            raise Exception(f"Line {line_number + 1}: {line.strip()}: {e}") from e
+
+    if macro is not None:
+        raise Exception(f"Macro {macro[0]} is missing %endmacro")
+    elif len(conditions) != 0:
+        raise Exception("%ifdef is missing %endif")
+
+def __item_size(item: Item, offset: int, is_long: bool) -> int:
+    if isinstance(item, Fragment):
+        return len(item.code)
+    elif isinstance(item, Align):
+        return -offset % item.alignment
+    elif not is_long:
+        return 2
+
+    return 5 if item.condition is None else 6
+
+def __layout_Section(items: List[Item], labels: Dict[str, int]) -> List[int]:
+    # Branches start short and grow to near form until every displacement fits. Growing only moves
+    # code forward, so the loop terminates.
+    is_long = [isinstance(item, Branch) and item.target not in labels for item in items]
+
+    while True:
+        offsets = [0]
+
+        for idx, item in enumerate(items):
+            offsets.append(offsets[-1] + __item_size(item, offsets[-1], is_long[idx]))
+
+        changed = False
+
+        for idx, item in enumerate(items):
+            if isinstance(item, Branch) and not is_long[idx] and not __fits(offsets[labels[item.target]] - (offsets[idx] + 2), 8):
+                is_long[idx] = True
+                changed = True
+
+        if not changed:
+            return offsets
+
+def __link_Section(name: str, items: List[Item], labels: Dict[str, int], symbols: Dict[str, Symbol]) -> Tuple[Section, List[int]]:
+    offsets = __layout_Section(items, labels)
+    data = bytearray()
+    relocations : List[Relocation] = []
+
+    def resolve(fixup: Fixup, position: int) -> None:
+        # Pc-relative references within the section are resolved here, everything else is left to the linker
+        if fixup.symbol in labels and fixup.reloc_type in (R_X86_64_PC32, R_X86_64_PLT32):
+            data[position:position + 4] = struct.pack('<i', offsets[labels[fixup.symbol]] + fixup.addend - position)
+        elif fixup.symbol in symbols:
+            relocations.append(Relocation(position, fixup.symbol, fixup.reloc_type, fixup.addend))
+        else:
+            raise Exception(f"Symbol {fixup.symbol} is not defined")
+
+    for idx, item in enumerate(items):
+        offset = offsets[idx]
+
+        if isinstance(item, Fragment):
+            data += item.code
+
+            for fixup in item.fixups:
+                resolve(fixup, offset + fixup.offset)
+        elif isinstance(item, Align):
+            data += (b"\x90" if name == ".text" else b"\x00") * (offsets[idx + 1] - offset)
+        elif offsets[idx + 1] - offset == 2:
+            data += bytes([0xEB if item.condition is None else 0x70 + item.condition, (offsets[labels[item.target]] - offset - 2) & 0xFF])
+        else:
+            data += b"\xE9" if item.condition is None else bytes([0x0F, 0x80 + item.condition])
+            data += bytes(4)
+            resolve(Fixup(0, item.target, R_X86_64_PLT32, -4), len(data) - 4)
+
+    if is_NoBits(name):
+        return Section(name, b"", offsets[-1], []), offsets
+
+    return Section(name, bytes(data), len(data), relocations), offsets
+
+def assemble_Source(source: str) -> ObjectFile:
+    ctx = AssemblyContext()
+    __assemble_Lines(source.split('\n'), ctx)
+
+    for name in ctx.globals:
+        if name not in ctx.labels and name not in ctx.externs:
+            raise Exception(f"Global symbol {name} is not defined")
+
+    # Every label is a symbol, though its value is only known once its section is laid out
+    symbols = {label: Symbol(label, section, 0, label in ctx.globals) for label, (section, _) in ctx.labels.items()}
+    symbols.update({name: Symbol(name, None, 0, True) for name in sorted(ctx.externs) if name not in ctx.labels})
+    sections : List[Section] = []
+
+    for name, items in ctx.sections.items():
+        labels = {label: idx for label, (section, idx) in ctx.labels.items() if section == name}
+        section, offsets = __link_Section(name, items, labels, symbols)
+        sections.append(section)
+
+        for label, idx in labels.items():
+            symbols[label] = symbols[label]._replace(value=offsets[idx])
+
+    return ObjectFile(sections, list(symbols.values()))
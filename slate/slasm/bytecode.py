@@ -0,0 +1,458 @@
+import mmap
+import struct
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union, cast
+
+from slate.slasm.function import BasicBlock, Function
+from slate.slasm.layout import FrameLayout
+from slate.slasm.instruction import *
+from slate.slasm.program import Program
+from slate.slasm.slasm import DataType, Word
+from slate.utilities import i64, ui64, uint
+
+# File layout (all little-endian):
+#   header
+#   string records (offset, size) followed by the utf-8 string blob
+#   constant pool of 8-byte words
+#   data records (label, offset, size) followed by the data blob
+#   global records (name)
+#   function records, name records (params then locals per function), block records
+#   instruction records (opcode, a, b, x, y)
+MAGIC = b"SLBC"
+VERSION = 1
+NO_INDEX = 0xFFFFFFFF
+
+HEADER = struct.Struct("<4sHH12I")
+STRING = struct.Struct("<II")
+CONST = struct.Struct("<Q")
+DATA = struct.Struct("<III")
+GLOBAL = struct.Struct("<I")
+FUNCTION = struct.Struct("<7IB3x")
+NAME = struct.Struct("<I")
+BLOCK = struct.Struct("<III")
+INSTRUCTION = struct.Struct("<BBBxII")
+
+# opcode, a, b, x, y
+RawInstruction = Tuple[int, int, int, int, int]
+
+class __Writer:
+    def __init__(self) -> None:
+        self.strings : Dict[str, int] = {}
+        self.consts : Dict[int, int] = {}
+
+    def string(self, value: str) -> int:
+        if value not in self.strings:
+            self.strings[value] = len(self.strings)
+
+        return self.strings[value]
+
+    def const(self, value: int) -> int:
+        if value not in self.consts:
+            self.consts[value] = len(self.consts)
+
+        return self.consts[value]
+
+def __encode_Instruction(instr: Instruction, writer: __Writer, layout: FrameLayout, blocks: Dict[str, int]) -> RawInstruction:
+    opcode = instr.opcode.value
+
+    if isinstance(instr, LOAD_CONST):
+        return opcode, 0, 0, writer.const(instr.value.as_ui64()), 0
+    elif isinstance(instr, LOAD_FUNC_ADDR):
+        return opcode, 0, 0, writer.string(instr.func_name), 0
+    elif isinstance(instr, (LOAD_GLOBAL, STORE_GLOBAL)):
+        return opcode, 0, 0, writer.string(instr.name), 0
+    elif isinstance(instr, CALL):
+        return opcode, 0, 0, writer.string(instr.target), 0
+    elif isinstance(instr, (LOAD_LOCAL, STORE_LOCAL)):
+        return opcode, 0, 0, layout.get_local_slot(instr.name), 0
+    elif isinstance(instr, (LOAD_PARAM, STORE_PARAM)):
+        return opcode, 0, 0, layout.get_param_slot(instr.name), 0
+    elif isinstance(instr, (LOAD_MEM, STORE_MEM)):
+        return opcode, 0, 0, writer.const(Word.FromI64(instr.offset).as_ui64()), 0
+    elif isinstance(instr, (ADD, SUB, MUL, DIV, MOD, INC, DEC, EQ, NEQ, GT, LT, GTEQ, LTEQ, NEG)):
+        return opcode, instr.data_type.value, 0, 0, 0
+    elif isinstance(instr, CONVERT):
+        return opcode, instr.from_dt.value, instr.to_dt.value, 0, 0
+    elif isinstance(instr, (SHL, SHR)):
+        return opcode, instr.amt, 0, 0, 0
+    elif isinstance(instr, JUMP):
+        return opcode, 0, 0, blocks[instr.target], 0
+    elif isinstance(instr, COND_JUMP):
+        return opcode, 0, 0, blocks[instr.true_target], blocks[instr.false_target]
+    elif isinstance(instr, INDIRECT_CALL):
+        return opcode, int(instr.returns_value), 0, int(instr.num_params), 0
+    elif isinstance(instr, (NOOP, POP, OR, AND, XOR, NOT, RET)):
+        return opcode, 0, 0, 0, 0
+
+    raise NotImplementedError(instr.opcode)
+
+def write_Program(program: Program, file: BinaryIO) -> None:
+    writer = __Writer()
+    functions = bytearray()
+    names = bytearray()
+    blocks = bytearray()
+    instrs = bytearray()
+    num_names = num_blocks = num_instrs = 0
+
+    for function in program.functions:
+        layout = function.layout
+        params = layout.params
+        locals = layout.locals
+        block_indices = {label: idx for idx, (label, _) in enumerate(function.basic_blocks)}
+
+        functions += FUNCTION.pack(writer.string(function.name), num_names, len(params), len(locals), num_blocks, len(block_indices), block_indices[function.entry], function.returns_value)
+
+        for name in params + locals:
+            names += NAME.pack(writer.string(name))
+            num_names += 1
+
+        for label, bb in function.basic_blocks:
+            block_instrs = [__encode_Instruction(instr, writer, layout, block_indices) for instr in bb]
+            blocks += BLOCK.pack(writer.string(label), num_instrs, len(block_instrs))
+            num_blocks += 1
+
+            for raw in block_instrs:
+                instrs += INSTRUCTION.pack(*raw)
+                num_instrs += 1
+
+    data_records = bytearray()
+    data_blob = bytearray()
+
+    for label, data in program.data:
+        data_records += DATA.pack(writer.string(label), len(data_blob), len(data))
+        data_blob += data
+
+    global_records = b"".join(GLOBAL.pack(writer.string(name)) for name in sorted(program.globals))
+
+    target = writer.string(program.target)
+    entry = writer.string(program.entry) if program.has_entry else NO_INDEX
+
+    string_records = bytearray()
+    string_blob = bytearray()
+
+    for value in writer.strings:
+        encoded = value.encode()
+        string_records += STRING.pack(len(string_blob), len(encoded))
+        string_blob += encoded
+
+    file.write(HEADER.pack(MAGIC, VERSION, 0, target, entry, len(writer.strings), len(string_blob), len(writer.consts), len(program.data), len(data_blob), len(program.globals), len(program.functions), num_names, num_blocks, num_instrs))
+    file.write(string_records)
+    file.write(string_blob)
+    file.write(b"".join(CONST.pack(value) for value in writer.consts))
+    file.write(data_records)
+    file.write(data_blob)
+    file.write(global_records)
+    file.write(functions)
+    file.write(names)
+    file.write(blocks)
+    file.write(instrs)
+
+class BytecodeBlock:
+    __slots__ = ("label", "__view", "__start", "__count")
+
+    def __init__(self, label: str, view: memoryview, start: int, count: int) -> None:
+        self.label = label
+        self.__view = view
+        self.__start = start
+        self.__count = count
+
+    def is_terminated(self) -> bool:
+        return self.__count != 0 and self[-1][0] in (OpCode.JUMP.value, OpCode.COND_JUMP.value, OpCode.RET.value)
+
+    def __iter__(self) -> Iterator[RawInstruction]:
+        start = self.__start * INSTRUCTION.size
+        return cast(Iterator[RawInstruction], INSTRUCTION.iter_unpack(self.__view[start:start + self.__count * INSTRUCTION.size]))
+
+    def __getitem__(self, idx: int) -> RawInstruction:
+        if idx < 0:
+            idx += self.__count
+
+        if not 0 <= idx < self.__count:
+            raise IndexError(idx)
+
+        return cast(RawInstruction, INSTRUCTION.unpack_from(self.__view, (self.__start + idx) * INSTRUCTION.size))
+
+    def __len__(self) -> int:
+        return self.__count
+
+class BytecodeFunction:
+    def __init__(self, name: str, params: List[str], locals: List[str], returns_value: bool, basic_blocks: List[BytecodeBlock], entry: int) -> None:
+        self.__name = name
+        self.__params = params
+        self.__locals = locals
+        self.__layout = FrameLayout(params, locals)
+        self.__returns_value = returns_value
+        self.__basic_blocks = basic_blocks
+        self.__entry = entry
+
+    def get_block_label(self, idx: int) -> str:
+        return self.__basic_blocks[idx].label
+
+    def get_param_name(self, idx: int) -> str:
+        return self.__params[idx]
+
+    def get_local_name(self, idx: int) -> str:
+        return self.__locals[idx]
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def num_params(self) -> int:
+        return len(self.__params)
+
+    @property
+    def num_locals(self) -> int:
+        return len(self.__locals)
+
+    @property
+    def returns_value(self) -> bool:
+        return self.__returns_value
+
+    @property
+    def entry(self) -> str:
+        return self.__basic_blocks[self.__entry].label
+
+    @property
+    def basic_blocks(self) -> List[Tuple[str, BytecodeBlock]]:
+        return [(block.label, block) for block in self.__basic_blocks]
+
+    @property
+    def params(self) -> List[str]:
+        return list(self.__params)
+
+    @property
+    def locals(self) -> List[str]:
+        return list(self.__locals)
+
+    @property
+    def layout(self) -> FrameLayout:
+        return self.__layout
+
+__TYPED_INSTRUCTIONS : Dict[OpCode, Any] = {
+    OpCode.ADD: ADD,
+    OpCode.SUB: SUB,
+    OpCode.MUL: MUL,
+    OpCode.DIV: DIV,
+    OpCode.MOD: MOD,
+    OpCode.INC: INC,
+    OpCode.DEC: DEC,
+    OpCode.EQ: EQ,
+    OpCode.NEQ: NEQ,
+    OpCode.GT: GT,
+    OpCode.LT: LT,
+    OpCode.GTEQ: GTEQ,
+    OpCode.LTEQ: LTEQ,
+    OpCode.NEG: NEG,
+}
+
+__OPERANDLESS_INSTRUCTIONS : Dict[OpCode, Any] = {
+    OpCode.NOOP: NOOP,
+    OpCode.POP: POP,
+    OpCode.OR: OR,
+    OpCode.AND: AND,
+    OpCode.XOR: XOR,
+    OpCode.NOT: NOT,
+    OpCode.RET: RET,
+}
+
+def decode_Instruction(raw: RawInstruction, reader: 'BytecodeReader', function: BytecodeFunction) -> Instruction:
+    opcode, a, b, x, y = raw
+    op = OpCode(opcode)
+
+    if op == OpCode.LOAD_CONST:
+        return LOAD_CONST(Word.FromUI64(ui64(reader.get_const(x))))
+    elif op == OpCode.LOAD_FUNC_ADDR:
+        return LOAD_FUNC_ADDR(reader.get_string(x))
+    elif op == OpCode.LOAD_GLOBAL:
+        return LOAD_GLOBAL(reader.get_string(x))
+    elif op == OpCode.STORE_GLOBAL:
+        return STORE_GLOBAL(reader.get_string(x))
+    elif op == OpCode.CALL:
+        return CALL(reader.get_string(x))
+    elif op == OpCode.LOAD_LOCAL:
+        return LOAD_LOCAL(function.get_local_name(x))
+    elif op == OpCode.STORE_LOCAL:
+        return STORE_LOCAL(function.get_local_name(x))
+    elif op == OpCode.LOAD_PARAM:
+        return LOAD_PARAM(function.get_param_name(x))
+    elif op == OpCode.STORE_PARAM:
+        return STORE_PARAM(function.get_param_name(x))
+    elif op == OpCode.LOAD_MEM:
+        return LOAD_MEM(Word.FromUI64(ui64(reader.get_const(x))).as_i64())
+    elif op == OpCode.STORE_MEM:
+        return STORE_MEM(Word.FromUI64(ui64(reader.get_const(x))).as_i64())
+    elif op in __TYPED_INSTRUCTIONS:
+        return __TYPED_INSTRUCTIONS[op](DataType(a))
+    elif op == OpCode.CONVERT:
+        return CONVERT(DataType(a), DataType(b))
+    elif op == OpCode.SHL:
+        return SHL(cast(ShiftAmount, a))
+    elif op == OpCode.SHR:
+        return SHR(cast(ShiftAmount, a))
+    elif op == OpCode.JUMP:
+        return JUMP(function.get_block_label(x))
+    elif op == OpCode.COND_JUMP:
+        return COND_JUMP(function.get_block_label(x), function.get_block_label(y))
+    elif op == OpCode.INDIRECT_CALL:
+        return INDIRECT_CALL(uint(x), a != 0)
+
+    return __OPERANDLESS_INSTRUCTIONS[op]()
+
+class BytecodeReader:
+    def __init__(self, buffer: Union[bytes, bytearray, memoryview, mmap.mmap]) -> None:
+        self.__mmap = buffer if isinstance(buffer, mmap.mmap) else None
+        self.__view = memoryview(buffer)
+
+        if len(self.__view) < HEADER.size:
+            raise Exception("Buffer is too small to contain slasm bytecode!")
+
+        magic, version, _, target, entry, num_strings, strings_size, num_consts, num_data, data_size, num_globals, num_functions, num_names, num_blocks, num_instrs = HEADER.unpack_from(self.__view, 0)
+
+        if magic != MAGIC:
+            raise Exception("Buffer does not contain slasm bytecode!")
+        elif version != VERSION:
+            raise Exception(f"Unsupported slasm bytecode version {version}")
+
+        # Only section offsets are computed up front; strings, constants and instructions are decoded on demand
+        offset = HEADER.size
+        self.__strings_offset = offset
+        self.__string_blob_offset = offset = offset + num_strings * STRING.size
+        self.__consts_offset = offset = offset + strings_size
+        self.__data_offset = offset = offset + num_consts * CONST.size
+        self.__data_blob_offset = offset = offset + num_data * DATA.size
+        self.__globals_offset = offset = offset + data_size
+        self.__functions_offset = offset = offset + num_globals * GLOBAL.size
+        self.__names_offset = offset = offset + num_functions * FUNCTION.size
+        self.__blocks_offset = offset = offset + num_names * NAME.size
+        self.__instrs_offset = offset = offset + num_blocks * BLOCK.size
+        end = offset + num_instrs * INSTRUCTION.size
+
+        if len(self.__view) < end:
+            raise Exception("Slasm bytecode is truncated!")
+
+        self.__instrs = self.__view[self.__instrs_offset:end]
+
+        self.__num_strings = num_strings
+        self.__num_consts = num_consts
+        self.__num_data = num_data
+        self.__num_globals = num_globals
+        self.__num_functions = num_functions
+        self.__target = target
+        self.__entry = entry
+        self.__string_cache : Dict[int, str] = {}
+        self.__functions : Optional[List[BytecodeFunction]] = None
+
+    @staticmethod
+    def open(path: Path) -> 'BytecodeReader':
+        with path.open("rb") as file:
+            return BytecodeReader(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def close(self) -> None:
+        self.__functions = None
+        self.__instrs.release()
+        self.__view.release()
+
+        if self.__mmap is not None:
+            self.__mmap.close()
+
+    def __enter__(self) -> 'BytecodeReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def get_string(self, idx: int) -> str:
+        if idx not in self.__string_cache:
+            if not 0 <= idx < self.__num_strings:
+                raise Exception(f"Slasm bytecode does not contain a string with index {idx}")
+
+            offset, size = STRING.unpack_from(self.__view, self.__strings_offset + idx * STRING.size)
+            start = self.__string_blob_offset + offset
+            self.__string_cache[idx] = bytes(self.__view[start:start + size]).decode()
+
+        return self.__string_cache[idx]
+
+    def get_const(self, idx: int) -> int:
+        if not 0 <= idx < self.__num_consts:
+            raise Exception(f"Slasm bytecode does not contain a constant with index {idx}")
+
+        return CONST.unpack_from(self.__view, self.__consts_offset + idx * CONST.size)[0]
+
+    def load_Function(self, function: BytecodeFunction) -> Function:
+        loaded = Function(function.name, function.params, function.locals, function.returns_value)
+
+        for label, block in function.basic_blocks:
+            bb = BasicBlock()
+
+            for raw in block:
+                bb.append_instr(decode_Instruction(raw, self, function))
+
+            loaded.add_basic_block(label, bb)
+
+        loaded.entry = function.entry
+        return loaded
+
+    def load_Program(self) -> Program:
+        program = Program(self.target, set(self.globals))
+
+        for label, data in self.data:
+            program.add_data(label, data)
+
+        for function in self.functions:
+            program.add_function(self.load_Function(function))
+
+        if self.__entry != NO_INDEX:
+            program.entry = self.entry
+
+        return program
+
+    def __read_functions(self) -> List[BytecodeFunction]:
+        functions = []
+
+        for idx in range(self.__num_functions):
+            name, names_start, num_params, num_locals, blocks_start, num_blocks, entry, returns_value = FUNCTION.unpack_from(self.__view, self.__functions_offset + idx * FUNCTION.size)
+            names = [self.get_string(NAME.unpack_from(self.__view, self.__names_offset + (names_start + i) * NAME.size)[0]) for i in range(num_params + num_locals)]
+            blocks = []
+
+            for block_idx in range(blocks_start, blocks_start + num_blocks):
+                label, instrs_start, num_instrs = BLOCK.unpack_from(self.__view, self.__blocks_offset + block_idx * BLOCK.size)
+                blocks.append(BytecodeBlock(self.get_string(label), self.__instrs, instrs_start, num_instrs))
+
+            functions.append(BytecodeFunction(self.get_string(name), names[:num_params], names[num_params:], returns_value != 0, blocks, entry))
+
+        return functions
+
+    @property
+    def target(self) -> str:
+        return self.get_string(self.__target)
+
+    @property
+    def entry(self) -> str:
+        if self.__entry == NO_INDEX:
+            raise Exception("Program's entry has not been set!")
+
+        return self.get_string(self.__entry)
+
+    @property
+    def globals(self) -> List[str]:
+        return [self.get_string(GLOBAL.unpack_from(self.__view, self.__globals_offset + idx * GLOBAL.size)[0]) for idx in range(self.__num_globals)]
+
+    @property
+    def data(self) -> List[Tuple[str, bytes]]:
+        data = []
+
+        for idx in range(self.__num_data):
+            label, offset, size = DATA.unpack_from(self.__view, self.__data_offset + idx * DATA.size)
+            start = self.__data_blob_offset + offset
+            data.append((self.get_string(label), bytes(self.__view[start:start + size])))
+
+        return data
+
+    @property
+    def functions(self) -> List[BytecodeFunction]:
+        if self.__functions is None:
+            self.__functions = self.__read_functions()
+
+        return list(self.__functions)
@@ -0,0 +1,193 @@
+from typing import Dict, List, Optional, Tuple
+from slate.slasm.function import BasicBlock, Function
+from slate.slasm.instruction import *
+from slate.slasm.program import Program
+
+def get_successors(bb: BasicBlock) -> List[str]:
+    if len(bb) == 0:
+        return []
+
+    terminator = bb[-1]
+
+    if isinstance(terminator, JUMP):
+        return [terminator.target]
+    elif isinstance(terminator, COND_JUMP):
+        # Both targets may be the same block, but it is only a single edge
+        return list(dict.fromkeys([terminator.true_target, terminator.false_target]))
+
+    return []
+
+class CFG:
+    def __init__(self, function: Function) -> None:
+        self.__entry = function.entry
+        self.__successors : Dict[str, List[str]] = {}
+        self.__predecessors : Dict[str, List[str]] = {label: [] for label, _ in function.basic_blocks}
+
+        for label, bb in function.basic_blocks:
+            self.__successors[label] = get_successors(bb)
+
+            for successor in self.__successors[label]:
+                if successor not in self.__predecessors:
+                    raise Exception(f"Function '{function.name}' does not contain a basic block labelled '{successor}'")
+
+                self.__predecessors[successor].append(label)
+
+        # Iterative depth-first search, since recursion would overflow on long block chains
+        postorder : List[str] = []
+        visited = set([self.__entry])
+        stack : List[Tuple[str, int]] = [(self.__entry, 0)]
+
+        while len(stack) != 0:
+            label, idx = stack.pop()
+            successors = self.__successors[label]
+
+            if idx < len(successors):
+                stack.append((label, idx + 1))
+
+                if successors[idx] not in visited:
+                    visited.add(successors[idx])
+                    stack.append((successors[idx], 0))
+            else:
+                postorder.append(label)
+
+        self.__reverse_postorder = postorder[::-1]
+        self.__rpo_numbers = {label: idx for idx, label in enumerate(self.__reverse_postorder)}
+
+    def get_successors(self, label: str) -> List[str]:
+        return list(self.__successors[label])
+
+    def get_predecessors(self, label: str) -> List[str]:
+        return list(self.__predecessors[label])
+
+    def is_reachable(self, label: str) -> bool:
+        return label in self.__rpo_numbers
+
+    def get_rpo_number(self, label: str) -> int:
+        return self.__rpo_numbers[label]
+
+    @property
+    def entry(self) -> str:
+        return self.__entry
+
+    @property
+    def labels(self) -> List[str]:
+        return list(self.__successors)
+
+    @property
+    def reverse_postorder(self) -> List[str]:
+        return list(self.__reverse_postorder)
+
+class DominatorTree:
+    def __init__(self, cfg: CFG) -> None:
+        # Cooper, Harvey and Kennedy's iterative algorithm over the reverse postorder
+        rpo = cfg.reverse_postorder
+        idoms : Dict[str, str] = {cfg.entry: cfg.entry}
+
+        def intersect(a: str, b: str) -> str:
+            while a != b:
+                while cfg.get_rpo_number(a) > cfg.get_rpo_number(b):
+                    a = idoms[a]
+                while cfg.get_rpo_number(b) > cfg.get_rpo_number(a):
+                    b = idoms[b]
+
+            return a
+
+        changed = True
+
+        while changed:
+            changed = False
+
+            for label in rpo[1:]:
+                processed = [pred for pred in cfg.get_predecessors(label) if pred in idoms]
+                new_idom = processed[0]
+
+                for pred in processed[1:]:
+                    new_idom = intersect(pred, new_idom)
+
+                if idoms.get(label) != new_idom:
+                    idoms[label] = new_idom
+                    changed = True
+
+        self.__root = cfg.entry
+        self.__idoms = {label: idom for label, idom in idoms.items() if label != cfg.entry}
+        self.__children : Dict[str, List[str]] = {label: [] for label in rpo}
+        self.__depths = {cfg.entry: 0}
+
+        for label in rpo[1:]:
+            self.__children[self.__idoms[label]].append(label)
+            self.__depths[label] = self.__depths[self.__idoms[label]] + 1
+
+    def get_idom(self, label: str) -> Optional[str]:
+        return self.__idoms.get(label)
+
+    def get_children(self, label: str) -> List[str]:
+        return list(self.__children[label])
+
+    def dominates(self, a: str, b: str) -> bool:
+        if b not in self.__depths or a not in self.__depths:
+            return False
+
+        while self.__depths[b] > self.__depths[a]:
+            b = self.__idoms[b]
+
+        return a == b
+
+    @property
+    def root(self) -> str:
+        return self.__root
+
+def get_CFG(function: Function) -> CFG:
+    return function.get_analysis("cfg", CFG)
+
+def get_DominatorTree(function: Function) -> DominatorTree:
+    return function.get_analysis("dominator_tree", lambda function: DominatorTree(get_CFG(function)))
+
+def eliminate_dead_blocks(function: Function) -> int:
+    cfg = get_CFG(function)
+    dead_blocks = [label for label in cfg.labels if not cfg.is_reachable(label)]
+
+    for label in dead_blocks:
+        function.remove_basic_block(label)
+
+    return len(dead_blocks)
+
+def merge_blocks(function: Function) -> int:
+    cfg = get_CFG(function)
+    predecessors = {label: cfg.get_predecessors(label) for label in cfg.labels}
+    merged = 0
+
+    # Fold blocks into their only predecessor when that predecessor unconditionally jumps to them
+    for label in cfg.reverse_postorder:
+        if label not in predecessors:
+            continue
+
+        bb = function.get_basic_block(label)
+
+        while len(bb) != 0 and isinstance(bb[-1], JUMP):
+            successor = bb[-1].target
+
+            if successor == label or successor == function.entry or predecessors[successor] != [label]:
+                break
+
+            bb.set_instrs(list(bb)[:-1] + list(function.remove_basic_block(successor)))
+            del predecessors[successor]
+
+            for target in get_successors(bb):
+                predecessors[target] = [label if pred == successor else pred for pred in predecessors[target]]
+
+            merged += 1
+
+    return merged
+
+def simplify_Function(function: Function) -> Tuple[int, int]:
+    return eliminate_dead_blocks(function), merge_blocks(function)
+
+def simplify_Program(program: Program) -> Tuple[int, int]:
+    removed = merged = 0
+
+    for function in program.functions:
+        function_removed, function_merged = simplify_Function(function)
+        removed += function_removed
+        merged += function_merged
+
+    return removed, merged
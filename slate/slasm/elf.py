@@ -0,0 +1,139 @@
+import struct
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+
+# Relocation types of the x86-64 System V psABI
+R_X86_64_64 = 1
+R_X86_64_PC32 = 2
+R_X86_64_PLT32 = 4
+R_X86_64_GOTPCREL = 9
+
+class Relocation(NamedTuple):
+    offset: int
+    symbol: str
+    type: int
+    addend: int
+
+class Section(NamedTuple):
+    name: str
+    data: bytes
+    size: int
+    relocations: List[Relocation]
+
+class Symbol(NamedTuple):
+    name: str
+    section: Optional[str] # None for undefined (external) symbols
+    value: int
+    is_global: bool
+
+class ObjectFile(NamedTuple):
+    sections: List[Section]
+    symbols: List[Symbol]
+
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_RELA = 4
+SHT_NOBITS = 8
+
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+SHF_INFO_LINK = 0x40
+
+__SECTION_KINDS : Dict[str, Tuple[int, int, int]] = {
+    # (type, flags, alignment)
+    ".text": (SHT_PROGBITS, SHF_ALLOC | SHF_EXECINSTR, 16),
+    ".data": (SHT_PROGBITS, SHF_ALLOC | SHF_WRITE, 8),
+    ".rodata": (SHT_PROGBITS, SHF_ALLOC, 8),
+    ".bss": (SHT_NOBITS, SHF_ALLOC | SHF_WRITE, 8),
+}
+
+def is_Section(name: str) -> bool:
+    return name in __SECTION_KINDS
+
+def is_NoBits(name: str) -> bool:
+    return __SECTION_KINDS[name][0] == SHT_NOBITS
+
+class StringTable:
+    def __init__(self) -> None:
+        self.__data = bytearray(b"\0")
+        self.__offsets : Dict[str, int] = {"": 0}
+
+    def add(self, string: str) -> int:
+        if string not in self.__offsets:
+            self.__offsets[string] = len(self.__data)
+            self.__data += string.encode() + b"\0"
+
+        return self.__offsets[string]
+
+    @property
+    def data(self) -> bytes:
+        return bytes(self.__data)
+
+def __pad(buffer: bytearray, alignment: int) -> None:
+    buffer += bytes(-len(buffer) % alignment)
+
+def write_ObjectFile(object_file: ObjectFile, file: BinaryIO) -> None:
+    # Section header indices: the null section, the object's sections, their relocations, then the
+    # stack note and the symbol and string tables
+    section_indices = {section.name: idx + 1 for idx, section in enumerate(object_file.sections)}
+    relocated = [section for section in object_file.sections if len(section.relocations) != 0]
+    note_idx = len(object_file.sections) + len(relocated) + 1
+    symtab_idx, strtab_idx, shstrtab_idx = note_idx + 1, note_idx + 2, note_idx + 3
+
+    # ELF requires local symbols to precede global ones
+    symbols = [symbol for symbol in object_file.symbols if not symbol.is_global] + \
+              [symbol for symbol in object_file.symbols if symbol.is_global]
+    symbol_indices = {symbol.name: idx + 1 for idx, symbol in enumerate(symbols)}
+    num_locals = 1 + len(symbols) - len([symbol for symbol in symbols if symbol.is_global])
+
+    strtab = StringTable()
+    symtab = bytearray(bytes(24))
+
+    for symbol in symbols:
+        shndx = 0 if symbol.section is None else section_indices[symbol.section]
+        symtab += struct.pack('<IBBHQQ', strtab.add(symbol.name), (1 if symbol.is_global else 0) << 4, 0, shndx, symbol.value, 0)
+
+    shstrtab = StringTable()
+    buffer = bytearray(64)
+    headers = [bytes(64)]
+
+    def add_section(name: str, type: int, flags: int, data: bytes, size: int, alignment: int, link: int = 0, info: int = 0, entry_size: int = 0) -> None:
+        __pad(buffer, alignment)
+        headers.append(struct.pack('<IIQQQQIIQQ', shstrtab.add(name), type, flags, 0, len(buffer), size, link, info, alignment, entry_size))
+
+        if type != SHT_NOBITS:
+            buffer.extend(data)
+
+    for section in object_file.sections:
+        type, flags, alignment = __SECTION_KINDS[section.name]
+        add_section(section.name, type, flags, section.data, section.size, alignment)
+
+    for section in relocated:
+        rela = bytearray()
+
+        for relocation in section.relocations:
+            if relocation.symbol not in symbol_indices:
+                raise Exception(f"Relocation in {section.name} refers to unknown symbol {relocation.symbol}")
+
+            rela += struct.pack('<QQq', relocation.offset, (symbol_indices[relocation.symbol] << 32) | relocation.type, relocation.addend)
+
+        add_section(".rela" + section.name, SHT_RELA, SHF_INFO_LINK, bytes(rela), len(rela), 8, symtab_idx, section_indices[section.name], 24)
+
+    # An empty note keeps linkers from making the stack executable
+    add_section(".note.GNU-stack", SHT_PROGBITS, 0, b"", 0, 1)
+    add_section(".symtab", SHT_SYMTAB, 0, bytes(symtab), len(symtab), 8, strtab_idx, num_locals, 24)
+    add_section(".strtab", SHT_STRTAB, 0, strtab.data, len(strtab.data), 1)
+    shstrtab.add(".shstrtab")
+    add_section(".shstrtab", SHT_STRTAB, 0, shstrtab.data, len(shstrtab.data), 1)
+
+    __pad(buffer, 8)
+    section_header_offset = len(buffer)
+
+    for header in headers:
+        buffer += header
+
+    buffer[0:64] = b"\x7fELF" + bytes([2, 1, 1, 0]) + bytes(8) + \
+                   struct.pack('<HHIQQQIHHHHHH', 1, 62, 1, 0, 0, section_header_offset, 0, 64, 0, 0, 64, len(headers), shstrtab_idx)
+
+    file.write(bytes(buffer))
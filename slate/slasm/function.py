@@ -1,6 +1,9 @@
-from typing import Dict, Iterator, List, Optional, Set, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
 
 from slate.slasm.instruction import Instruction, OpCode
+from slate.slasm.layout import FrameLayout
+
+T = TypeVar('T')
 
 class BasicBlock:
     __TERMINATING_INSTRUCTIONS = set([
@@ -11,12 +14,31 @@ class BasicBlock:
 
     def __init__(self) -> None:
         self.__instructions : List[Instruction] = []
+        self.__listeners : List[Callable[[], None]] = []
 
     def append_instr(self, instr: Instruction) -> None:
         if self.is_terminated():
             raise Exception("Cannot append an instruction to a terminated block!")
 
         self.__instructions.append(instr)
+        self.__notify()
+
+    def set_instrs(self, instrs: List[Instruction]) -> None:
+        if any(instr.opcode in BasicBlock.__TERMINATING_INSTRUCTIONS for instr in instrs[:-1]):
+            raise Exception("Only the last instruction of a block may terminate it!")
+
+        self.__instructions = list(instrs)
+        self.__notify()
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        self.__listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]) -> None:
+        self.__listeners.remove(listener)
+
+    def __notify(self) -> None:
+        for listener in self.__listeners:
+            listener()
 
     def is_terminated(self) -> bool:
         return len(self.__instructions) != 0 and self.__instructions[-1].opcode in BasicBlock.__TERMINATING_INSTRUCTIONS
@@ -27,20 +49,54 @@ class BasicBlock:
     def __getitem__(self, idx: int) -> Instruction:
         return self.__instructions[idx]
 
+    def __len__(self) -> int:
+        return len(self.__instructions)
+
 class Function:
-    def __init__(self, name: str, params: Set[str], locals: Set[str], returns_value: bool) -> None:
+    def __init__(self, name: str, params: Iterable[str], locals: Iterable[str], returns_value: bool) -> None:
         self.__name = name
-        self.__params = set(params)
-        self.__locals = set(locals)
+        # Params and locals keep their declaration order, which determines their frame slots
+        self.__layout = FrameLayout(params, locals)
         self.__returns_value = returns_value
         self.__basic_blocks : Dict[str, BasicBlock] = {}
         self.__entry : Optional[str] = None
+        self.__analyses : Dict[str, Any] = {}
 
     def add_basic_block(self, name: str, basic_block: BasicBlock) -> None:
         if name in self.__basic_blocks:
             raise Exception(f"Basic block with name {name} already exists!")
 
         self.__basic_blocks[name] = basic_block
+        basic_block.add_listener(self.invalidate_analyses)
+        self.invalidate_analyses()
+
+    def remove_basic_block(self, name: str) -> BasicBlock:
+        if name not in self.__basic_blocks:
+            raise Exception(f"Basic block with name {name} does not exist!")
+        elif name == self.__entry:
+            raise Exception(f"Cannot remove the entry basic block {name}!")
+
+        basic_block = self.__basic_blocks.pop(name)
+        basic_block.remove_listener(self.invalidate_analyses)
+        self.invalidate_analyses()
+
+        return basic_block
+
+    def get_basic_block(self, name: str) -> BasicBlock:
+        if name not in self.__basic_blocks:
+            raise Exception(f"Basic block with name {name} does not exist!")
+
+        return self.__basic_blocks[name]
+
+    def get_analysis(self, name: str, compute: Callable[['Function'], T]) -> T:
+        # Analyses are cached until the function or any of its blocks is mutated
+        if name not in self.__analyses:
+            self.__analyses[name] = compute(self)
+
+        return self.__analyses[name]
+
+    def invalidate_analyses(self) -> None:
+        self.__analyses.clear()
 
     def contains_nonterminated_basic_block(self) -> bool:
         return not all([bb.is_terminated() for bb in self.__basic_blocks.values()])
@@ -51,11 +107,11 @@ class Function:
 
     @property
     def num_params(self) -> int:
-        return len(self.__params)
+        return self.__layout.num_params
 
     @property
     def num_locals(self) -> int:
-        return len(self.__locals)
+        return self.__layout.num_locals
 
     @property
     def returns_value(self) -> bool:
@@ -74,15 +130,20 @@ class Function:
             raise Exception(f"Basic block with name {basic_block_name} does not exist!")
 
         self.__entry = basic_block_name
+        self.invalidate_analyses()
 
     @property
     def basic_blocks(self) -> List[Tuple[str, BasicBlock]]:
         return list(self.__basic_blocks.items())
 
     @property
-    def params(self) -> Set[str]:
-        return set(self.__params)
+    def params(self) -> List[str]:
+        return self.__layout.params
+
+    @property
+    def locals(self) -> List[str]:
+        return self.__layout.locals
 
     @property
-    def locals(self) -> Set[str]:
-        return set(self.__locals)
+    def layout(self) -> FrameLayout:
+        return self.__layout
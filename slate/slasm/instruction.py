@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from enum import Enum, auto
-from typing import Literal, Union
+from typing import Dict, Literal, NamedTuple, Tuple, Union
 
 from slate.slasm.slasm import DataType, Word
 from slate.utilities import i64, ui64, uint
@@ -286,9 +286,11 @@ class NOT(_Instruction):
     def opcode(self) -> OpCode:
         return OpCode.NOT
 
+ShiftAmount = Literal[0, 1, 2, 3, 4, 5, 6, 7, 8]
+
 @dataclass(frozen=True)
 class SHL(_Instruction):
-    amt : Literal[0, 1, 2, 3, 4, 5, 6, 7, 8]
+    amt : ShiftAmount
 
     @property
     def opcode(self) -> OpCode:
@@ -296,7 +298,7 @@ class SHL(_Instruction):
 
 @dataclass(frozen=True)
 class SHR(_Instruction):
-    amt : Literal[0, 1, 2, 3, 4, 5, 6, 7, 8]
+    amt : ShiftAmount
     
     @property
     def opcode(self) -> OpCode:
@@ -390,4 +392,58 @@ Instruction = Union[
     CALL,
     INDIRECT_CALL,
     RET
-]
\ No newline at end of file
+]
+
+Signature = NamedTuple('Signature', [('num_params', int), ('returns_value', bool)])
+
+__STACK_EFFECTS : Dict[OpCode, Tuple[int, int]] = {
+    OpCode.NOOP: (0, 0),
+    OpCode.LOAD_CONST: (0, 1),
+    OpCode.LOAD_LOCAL: (0, 1),
+    OpCode.LOAD_PARAM: (0, 1),
+    OpCode.LOAD_GLOBAL: (0, 1),
+    OpCode.LOAD_MEM: (1, 1),
+    OpCode.LOAD_FUNC_ADDR: (0, 1),
+    OpCode.POP: (1, 0),
+    OpCode.STORE_LOCAL: (1, 0),
+    OpCode.STORE_PARAM: (1, 0),
+    OpCode.STORE_GLOBAL: (1, 0),
+    OpCode.STORE_MEM: (2, 0),
+    OpCode.ADD: (2, 1),
+    OpCode.SUB: (2, 1),
+    OpCode.MUL: (2, 1),
+    OpCode.DIV: (2, 1),
+    OpCode.MOD: (2, 1),
+    OpCode.INC: (1, 1),
+    OpCode.DEC: (1, 1),
+    OpCode.EQ: (2, 1),
+    OpCode.NEQ: (2, 1),
+    OpCode.GT: (2, 1),
+    OpCode.LT: (2, 1),
+    OpCode.GTEQ: (2, 1),
+    OpCode.LTEQ: (2, 1),
+    OpCode.NEG: (1, 1),
+    OpCode.OR: (2, 1),
+    OpCode.AND: (2, 1),
+    OpCode.XOR: (2, 1),
+    OpCode.NOT: (1, 1),
+    OpCode.SHL: (1, 1),
+    OpCode.SHR: (1, 1),
+    OpCode.CONVERT: (1, 1),
+    OpCode.JUMP: (0, 0),
+    OpCode.COND_JUMP: (1, 0),
+}
+
+def get_stack_effect(instr: Instruction, signatures: Dict[str, Signature]) -> Tuple[int, int]:
+    if isinstance(instr, CALL):
+        if instr.target not in signatures:
+            raise Exception(f"No signature is known for function {instr.target}")
+
+        signature = signatures[instr.target]
+        return signature.num_params, 1 if signature.returns_value else 0
+    elif isinstance(instr, INDIRECT_CALL):
+        return instr.num_params + 1, 1 if instr.returns_value else 0
+    elif isinstance(instr, RET):
+        raise Exception("The stack effect of RET depends on the function returning!")
+
+    return __STACK_EFFECTS[instr.opcode]
@@ -0,0 +1,47 @@
+from typing import Dict, Iterable, List
+
+class FrameLayout:
+    def __init__(self, params: Iterable[str], locals: Iterable[str]) -> None:
+        self.__params = list(params)
+        self.__locals = list(locals)
+        self.__param_slots = {name: idx for idx, name in enumerate(self.__params)}
+        self.__local_slots = {name: idx for idx, name in enumerate(self.__locals)}
+
+        if len(self.__param_slots) != len(self.__params):
+            raise Exception("Function params must have unique names!")
+        elif len(self.__local_slots) != len(self.__locals):
+            raise Exception("Function locals must have unique names!")
+
+    def get_param_slot(self, name: str) -> int:
+        if name not in self.__param_slots:
+            raise Exception(f"Function does not contain a param named {name}")
+
+        return self.__param_slots[name]
+
+    def get_local_slot(self, name: str) -> int:
+        if name not in self.__local_slots:
+            raise Exception(f"Function does not contain a local named {name}")
+
+        return self.__local_slots[name]
+
+    def has_param(self, name: str) -> bool:
+        return name in self.__param_slots
+
+    def has_local(self, name: str) -> bool:
+        return name in self.__local_slots
+
+    @property
+    def params(self) -> List[str]:
+        return list(self.__params)
+
+    @property
+    def locals(self) -> List[str]:
+        return list(self.__locals)
+
+    @property
+    def num_params(self) -> int:
+        return len(self.__params)
+
+    @property
+    def num_locals(self) -> int:
+        return len(self.__locals)
@@ -0,0 +1,234 @@
+from typing import Iterable
+from llvmlite import ir # type: ignore
+
+# The LLVM counterpart of the runtime in the Linux nasm templates: DEBUG_PRINT_I64 formats into a
+# buffer that __slate_flush_output writes to stdout. Whoever runs the program flushes at exit, which
+# the entry points of define_Runtime do for executables.
+
+OUTPUT_BUFFER_SIZE = 65536
+FLUSH_FUNC_NAME = "__slate_flush_output"
+
+__DIGIT_PAIRS = "".join(f"{idx:02}" for idx in range(100)).encode()
+
+__I8 = ir.IntType(8)
+__I16 = ir.IntType(16)
+__I64 = ir.IntType(64)
+
+def __const(value: int) -> ir.Constant:
+    return ir.Constant(__I64, value)
+
+def __define_Global(llvm_module: ir.Module, name: str, type: ir.Type, initializer: ir.Constant) -> ir.GlobalVariable:
+    llvm_global = ir.GlobalVariable(llvm_module, type, name)
+    llvm_global.linkage = "internal"
+    llvm_global.initializer = initializer
+
+    return llvm_global
+
+def __define_Flush(llvm_module: ir.Module, buffer: ir.GlobalVariable, length: ir.GlobalVariable) -> ir.Function:
+    flush_func = ir.Function(llvm_module, ir.FunctionType(ir.VoidType(), []), FLUSH_FUNC_NAME)
+    builder = ir.IRBuilder(flush_func.append_basic_block("entry"))
+    check_block = flush_func.append_basic_block("check")
+    write_block = flush_func.append_basic_block("write")
+    advance_block = flush_func.append_basic_block("advance")
+    done_block = flush_func.append_basic_block("done")
+
+    total = builder.load(length)
+    builder.branch(check_block)
+
+    # write(1, buffer + written, total - written), repeated after partial writes and abandoned on errors
+    builder.position_at_end(check_block)
+    written = builder.phi(__I64)
+    builder.cbranch(builder.icmp_unsigned("<", written, total), write_block, done_block)
+
+    builder.position_at_end(write_block)
+    address = builder.gep(buffer, [__const(0), written])
+    write_type = ir.FunctionType(__I64, [__I64, __I64, address.type, __I64])
+    result = builder.asm(write_type, "syscall", "={rax},{rax},{rdi},{rsi},{rdx},~{rcx},~{r11},~{memory}", [__const(1), __const(1), address, builder.sub(total, written)], True)
+    builder.cbranch(builder.icmp_signed(">", result, __const(0)), advance_block, done_block)
+
+    builder.position_at_end(advance_block)
+    next_written = builder.add(written, result)
+    builder.branch(check_block)
+
+    written.add_incoming(__const(0), flush_func.entry_basic_block)
+    written.add_incoming(next_written, advance_block)
+
+    builder.position_at_end(done_block)
+    builder.store(__const(0), length)
+    builder.ret_void()
+
+    return flush_func
+
+def __define_Print(llvm_module: ir.Module, buffer: ir.GlobalVariable, length: ir.GlobalVariable, digit_pairs: ir.GlobalVariable, flush_func: ir.Function) -> None:
+    print_func = ir.Function(llvm_module, ir.FunctionType(ir.VoidType(), [__I64]), "DEBUG_PRINT_I64")
+    builder = ir.IRBuilder(print_func.append_basic_block("entry"))
+    flush_block = print_func.append_basic_block("flush")
+    format_block = print_func.append_basic_block("format")
+    pairs_block = print_func.append_basic_block("pairs")
+    pair_block = print_func.append_basic_block("pair")
+    last_block = print_func.append_basic_block("last")
+    last_pair_block = print_func.append_basic_block("last_pair")
+    last_digit_block = print_func.append_basic_block("last_digit")
+    sign_block = print_func.append_basic_block("sign")
+    minus_block = print_func.append_basic_block("minus")
+    append_block = print_func.append_basic_block("append")
+
+    # The number is formatted backwards into the first half of a scratch area, ending with a newline
+    scratch = builder.alloca(ir.ArrayType(__I8, 64))
+    value = print_func.args[0]
+    builder.cbranch(builder.icmp_unsigned(">", builder.load(length), __const(OUTPUT_BUFFER_SIZE - 32)), flush_block, format_block)
+
+    builder.position_at_end(flush_block)
+    builder.call(flush_func, [])
+    builder.branch(format_block)
+
+    # Negating INT64_MIN leaves the right unsigned value
+    builder.position_at_end(format_block)
+    builder.store(ir.Constant(__I8, ord("\n")), builder.gep(scratch, [__const(0), __const(31)]))
+    negative = builder.icmp_signed("<", value, __const(0))
+    magnitude = builder.select(negative, builder.neg(value), value)
+    builder.branch(pairs_block)
+
+    def store_pair(pair: ir.Value, position: ir.Value) -> None:
+        digits = builder.load(builder.bitcast(builder.gep(digit_pairs, [__const(0), builder.mul(pair, __const(2))]), __I16.as_pointer()), align=1)
+        builder.store(digits, builder.bitcast(builder.gep(scratch, [__const(0), position]), __I16.as_pointer()), align=1)
+
+    # Two digits at a time while at least three remain
+    builder.position_at_end(pairs_block)
+    number = builder.phi(__I64)
+    position = builder.phi(__I64)
+    builder.cbranch(builder.icmp_unsigned(">=", number, __const(100)), pair_block, last_block)
+
+    builder.position_at_end(pair_block)
+    quotient = builder.udiv(number, __const(100))
+    pair_position = builder.sub(position, __const(2))
+    store_pair(builder.sub(number, builder.mul(quotient, __const(100))), pair_position)
+    builder.branch(pairs_block)
+
+    number.add_incoming(magnitude, format_block)
+    number.add_incoming(quotient, pair_block)
+    position.add_incoming(__const(31), format_block)
+    position.add_incoming(pair_position, pair_block)
+
+    builder.position_at_end(last_block)
+    builder.cbranch(builder.icmp_unsigned(">=", number, __const(10)), last_pair_block, last_digit_block)
+
+    builder.position_at_end(last_pair_block)
+    last_pair_position = builder.sub(position, __const(2))
+    store_pair(number, last_pair_position)
+    builder.branch(sign_block)
+
+    builder.position_at_end(last_digit_block)
+    last_digit_position = builder.sub(position, __const(1))
+    builder.store(builder.trunc(builder.add(number, __const(ord("0"))), __I8), builder.gep(scratch, [__const(0), last_digit_position]))
+    builder.branch(sign_block)
+
+    builder.position_at_end(sign_block)
+    start = builder.phi(__I64)
+    start.add_incoming(last_pair_position, last_pair_block)
+    start.add_incoming(last_digit_position, last_digit_block)
+    builder.cbranch(negative, minus_block, append_block)
+
+    builder.position_at_end(minus_block)
+    minus_position = builder.sub(start, __const(1))
+    builder.store(ir.Constant(__I8, ord("-")), builder.gep(scratch, [__const(0), minus_position]))
+    builder.branch(append_block)
+
+    builder.position_at_end(append_block)
+    text_start = builder.phi(__I64)
+    text_start.add_incoming(start, sign_block)
+    text_start.add_incoming(minus_position, minus_block)
+
+    # A fixed 32 bytes are copied, which the check above leaves room for, so that the copy is inlined
+    # rather than calling memcpy, which freestanding executables lack
+    text_length = builder.sub(__const(32), text_start)
+    offset = builder.load(length)
+    memcpy = llvm_module.declare_intrinsic("llvm.memcpy", [__I8.as_pointer(), __I8.as_pointer(), __I64])
+    builder.call(memcpy, [builder.gep(buffer, [__const(0), offset]), builder.gep(scratch, [__const(0), text_start]), __const(32), ir.Constant(ir.IntType(1), 0)])
+    builder.store(builder.add(offset, text_length), length)
+    builder.ret_void()
+
+def define_OutputRuntime(llvm_module: ir.Module) -> None:
+    # Usable as the setup callback of llvm_visitor, or from one that declares further natives
+    buffer = __define_Global(llvm_module, "__slate_output_buffer", ir.ArrayType(__I8, OUTPUT_BUFFER_SIZE), ir.Constant(ir.ArrayType(__I8, OUTPUT_BUFFER_SIZE), None))
+    length = __define_Global(llvm_module, "__slate_output_length", __I64, __const(0))
+    digit_pairs = __define_Global(llvm_module, "__slate_digit_pairs", ir.ArrayType(__I8, len(__DIGIT_PAIRS)), ir.Constant(ir.ArrayType(__I8, len(__DIGIT_PAIRS)), bytearray(__DIGIT_PAIRS)))
+    digit_pairs.global_constant = True
+
+    __define_Print(llvm_module, buffer, length, digit_pairs, __define_Flush(llvm_module, buffer, length))
+
+def __define_Syscall(llvm_module: ir.Module, name: str, returns_value: bool, flush_func: ir.Function) -> None:
+    func = ir.Function(llvm_module, ir.FunctionType(__I64 if returns_value else ir.VoidType(), [__I64, __I64]), name)
+    builder = ir.IRBuilder(func.append_basic_block("entry"))
+
+    # Write buffered output first, the syscall may be exit
+    builder.call(flush_func, [])
+    result = builder.asm(ir.FunctionType(__I64, [__I64, __I64]), "syscall", "={rax},{rax},{rdi},~{rcx},~{r11},~{memory}", list(func.args), True)
+
+    if returns_value:
+        builder.ret(result)
+    else:
+        builder.ret_void()
+
+def __define_CCall(llvm_module: ir.Module, name: str, returns_value: bool, flush_func: ir.Function) -> None:
+    func = ir.Function(llvm_module, ir.FunctionType(__I64 if returns_value else ir.VoidType(), [__I64] * 4), name)
+    builder = ir.IRBuilder(func.append_basic_block("entry"))
+    address, _, arg1, arg2 = func.args
+
+    # Write buffered output before the C library writes its own. The C function is called as a
+    # variadic one, so al holds the number of vector registers used, which is none.
+    builder.call(flush_func, [])
+    c_func_type = ir.FunctionType(__I64, [__I64, __I64], var_arg=True)
+    result = builder.call(builder.inttoptr(address, c_func_type.as_pointer()), [arg1, arg2])
+
+    if returns_value:
+        builder.ret(result)
+    else:
+        builder.ret_void()
+
+__NATIVE_DEFINERS = {
+    "LINUX_x86_64_SYSCALL1_WITH_RET": (__define_Syscall, True),
+    "LINUX_x86_64_SYSCALL1_NO_RET": (__define_Syscall, False),
+    "C_CALL_3_WITH_RET": (__define_CCall, True),
+    "C_CALL_3_NO_RET": (__define_CCall, False),
+}
+
+__MAIN_FUNC_NAME = "__slate_main"
+
+def __define_Main(llvm_module: ir.Module, name: str, entry_func_name: str, flush_func: ir.Function) -> None:
+    # Runs the entry function and writes out buffered output, returning the exit code
+    entry_func = ir.Function(llvm_module, ir.FunctionType(__I64, []), entry_func_name)
+    main_func = ir.Function(llvm_module, ir.FunctionType(ir.IntType(32), []), name)
+    builder = ir.IRBuilder(main_func.append_basic_block("entry"))
+
+    exit_code = builder.call(entry_func, [])
+    builder.call(flush_func, [])
+    builder.ret(builder.trunc(exit_code, ir.IntType(32)))
+
+def __define_Start(llvm_module: ir.Module) -> None:
+    # The kernel enters _start with a 16-byte aligned stack rather than a return address, which
+    # compiled functions do not expect, so it is written in assembly
+    start_func = ir.Function(llvm_module, ir.FunctionType(ir.VoidType(), []), "_start")
+    start_func.attributes.add("naked")
+    start_func.attributes.add("noreturn")
+    builder = ir.IRBuilder(start_func.append_basic_block("entry"))
+
+    builder.asm(ir.FunctionType(ir.VoidType(), []), f"xorl %ebp, %ebp\nandq $$-16, %rsp\ncallq {__MAIN_FUNC_NAME}\nmovl %eax, %edi\nmovl $$60, %eax\nsyscall", "~{memory}", [], True)
+    builder.unreachable()
+
+def define_Runtime(llvm_module: ir.Module, natives: Iterable[str], entry_func_name: str, freestanding: bool) -> None:
+    # Everything an executable needs besides the program: the output runtime, the other natives and
+    # an entry point, either main for the C library to call or a _start of its own
+    define_OutputRuntime(llvm_module)
+    flush_func = llvm_module.get_global(FLUSH_FUNC_NAME)
+
+    for name in natives:
+        if name in __NATIVE_DEFINERS:
+            definer, returns_value = __NATIVE_DEFINERS[name]
+            definer(llvm_module, name, returns_value, flush_func)
+
+    if freestanding:
+        __define_Main(llvm_module, __MAIN_FUNC_NAME, entry_func_name, flush_func)
+        __define_Start(llvm_module)
+    else:
+        __define_Main(llvm_module, "main", entry_func_name, flush_func)
@@ -46,10 +46,15 @@ _main:
     push rbp
     mov rbp, rsp
 
+    ; slasm functions use rbx as a scratch register, but it is callee-saved in C
+    push rbx
+    sub rsp, 8
+
     ; call entry function
     call #ENTRY_FUNC_NAME#
 
-    ; delete stack frame
+    ; restore rbx and delete stack frame
+    mov rbx, [rbp - 8]
     mov rsp, rbp
     pop rbp
 
@@ -0,0 +1,206 @@
+; SLASM_VERSION #SLASM_VERSION#
+; TARGET #TARGET#
+
+[BITS 64]
+
+#CALLING_CONVENTION#
+
+%macro LINUX_x86_64_SYSCALL1 0
+    call __slate_flush_output ; write buffered output first, the syscall may be exit
+%ifdef SLASM_CALLS_SYSV
+    mov rax, rdi        ; set syscall code
+    mov rdi, rsi        ; set first argument
+%else
+    mov rax, [rsp + 8]  ; set syscall code
+    mov rdi, [rsp + 16] ; set first argument
+%endif
+    syscall             ; perform syscall
+    ret                 ; return
+%endmacro
+
+%macro C_CALL_3 0
+    call __slate_flush_output ; write buffered output before the C library writes its own
+%ifdef SLASM_CALLS_SYSV
+    ; the stack is already aligned, so move the arguments into place and jump to the C function,
+    ; which returns straight to the caller
+    mov r11, rdi            ; function address
+    mov rax, rsi            ; number of floating-point arguments
+    mov rdi, rdx            ; set first argument
+    mov rsi, rcx            ; set second argument
+    jmp r11                 ; perform C function call
+%else
+    push rbp                ; store old base pointer
+    mov rbp, rsp            ; set new base pointer
+    mov rsi, [rbp + 40]     ; set third argument
+    mov rdi, [rbp + 32]     ; set second argument
+    mov rax, [rbp + 24]     ; set first argument
+    and  rsp, -16           ; align stack to 16-byte boundary
+    call [rbp + 16]         ; perform C function call        
+    mov rsp, rbp            ; clean up stack
+    pop rbp                 ; restore old base pointer
+    ret                     ; return
+%endif
+%endmacro
+
+    section .data
+#DATA#
+
+    section .rodata
+    ; two ASCII digits for each number below 100
+    __slate_digit_pairs: db "00010203040506070809101112131415161718192021222324252627282930313233343536373839404142434445464748495051525354555657585960616263646566676869707172737475767778798081828384858687888990919293949596979899"
+
+    section .bss
+    ; output of DEBUG_PRINT_I64, written out when full, before native calls and at exit
+    __slate_output_length: resq 1
+    __slate_output_buffer: resb 65536
+#GLOBALS#
+
+    section .text
+    
+    default rel
+    global main
+
+LINUX_x86_64_SYSCALL1_WITH_RET: LINUX_x86_64_SYSCALL1
+LINUX_x86_64_SYSCALL1_NO_RET: LINUX_x86_64_SYSCALL1
+C_CALL_3_WITH_RET: C_CALL_3
+C_CALL_3_NO_RET: C_CALL_3
+
+main:
+    ; create stack frame
+    push rbp
+    mov rbp, rsp
+
+    ; slasm functions use rbx as a scratch register, but it is callee-saved in C
+    push rbx
+    sub rsp, 8
+
+    ; call entry function (the stack is 16-byte aligned) and write out buffered output
+    call #ENTRY_FUNC_NAME#
+    call __slate_flush_output
+
+    ; restore rbx and delete stack frame
+    mov rbx, [rbp - 8]
+    mov rsp, rbp
+    pop rbp
+
+    ; return (note that rax already contains the exit code from previous call instruction)
+    ret
+
+__slate_flush_output:
+    ; preserve registers, since natives flush with their arguments already loaded
+    push rax
+    push rcx
+    push rdx
+    push rsi
+    push rdi
+    push r11
+
+    ; write(1, buffer, length), repeated after partial writes and abandoned on errors
+    lea rsi, [__slate_output_buffer]
+    mov rdx, [__slate_output_length]
+
+  .next_write:
+    test rdx, rdx
+    jz .done
+    mov eax, 1
+    mov edi, 1
+    syscall
+    test rax, rax
+    jle .done
+    add rsi, rax
+    sub rdx, rax
+    jmp .next_write
+
+  .done:
+    mov qword [__slate_output_length], 0
+    pop r11
+    pop rdi
+    pop rsi
+    pop rdx
+    pop rcx
+    pop rax
+    ret
+
+DEBUG_PRINT_I64:
+    ; make room for the longest number (a sign, 20 digits and a newline) and the 24-byte copy below
+    cmp qword [__slate_output_length], 65504 ; 65536 - 32
+    jbe .format
+    call __slate_flush_output
+
+  .format:
+    ; load number and format it backwards into a scratch area that ends with a newline
+%ifdef SLASM_CALLS_SYSV
+    mov rax, rdi
+%else
+    mov rax, [rsp + 8]
+%endif
+    sub rsp, 32
+    lea rsi, [rsp + 31]
+    mov byte [rsi], 10
+
+    ; negating INT64_MIN leaves the right unsigned value
+    mov r8, rax
+    test rax, rax
+    jns .pairs
+    neg rax
+
+  .pairs:
+    lea r9, [__slate_digit_pairs]
+    mov r10, 0x28F5C28F5C28F5C3
+
+  .next_pair:
+    ; two digits at a time, dividing by 100 through a multiplication: q = ((n >> 2) * r10) >> 66
+    cmp rax, 100
+    jb .last_digits
+    mov rcx, rax
+    shr rax, 2
+    mul r10
+    shr rdx, 2
+    imul rax, rdx, 100
+    sub rcx, rax
+    mov rax, rdx
+    movzx edx, word [r9 + rcx*2]
+    sub rsi, 2
+    mov [rsi], dx
+    jmp .next_pair
+
+  .last_digits:
+    cmp rax, 10
+    jb .last_digit
+    movzx edx, word [r9 + rax*2]
+    sub rsi, 2
+    mov [rsi], dx
+    jmp .sign
+
+  .last_digit:
+    add al, '0'
+    dec rsi
+    mov [rsi], al
+
+  .sign:
+    test r8, r8
+    jns .append
+    dec rsi
+    mov byte [rsi], '-'
+
+  .append:
+    ; copy a fixed 24 bytes, of which the text is a prefix, and advance the length by the text's length
+    lea rdi, [__slate_output_buffer]
+    mov rdx, [__slate_output_length]
+    add rdi, rdx
+    mov rax, [rsi]
+    mov [rdi], rax
+    mov rax, [rsi + 8]
+    mov [rdi + 8], rax
+    mov rax, [rsi + 16]
+    mov [rdi + 16], rax
+    lea rax, [rsp + 32]
+    sub rax, rsi
+    add rdx, rax
+    mov [__slate_output_length], rdx
+
+    ; release scratch area and return
+    add rsp, 32
+    ret
+
+#SLASM_FUNCS#
\ No newline at end of file
@@ -0,0 +1,32 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Sequence, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+def split_Shards(items: Sequence[T], jobs: int) -> List[List[T]]:
+    # Several contiguous shards per worker balance uneven function sizes while keeping the order
+    num_shards = min(len(items), max(1, jobs) * 4)
+
+    if num_shards == 0:
+        return []
+
+    size, extra = divmod(len(items), num_shards)
+    shards : List[List[T]] = []
+    start = 0
+
+    for idx in range(num_shards):
+        end = start + size + (1 if idx < extra else 0)
+        shards.append(list(items[start:end]))
+        start = end
+
+    return shards
+
+def map_Shards(worker: Callable[[T], R], shards: Sequence[T], jobs: int) -> List[R]:
+    # Results come back in shard order regardless of which worker finishes first. The worker and
+    # its arguments must be picklable when more than one job is used.
+    if jobs <= 1 or len(shards) <= 1:
+        return [worker(shard) for shard in shards]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(worker, shards))
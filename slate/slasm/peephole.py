@@ -0,0 +1,171 @@
+import struct
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, cast
+from slate.slasm.function import BasicBlock, Function
+from slate.slasm.instruction import *
+from slate.slasm.program import Program
+from slate.slasm.slasm import DataType, Word
+
+# A rewrite receives the instructions matched by the pattern and returns their replacement,
+# or None when the rule's extra conditions (equal names, constant values, ...) do not hold
+Rewrite = Callable[[Sequence[Instruction]], Optional[List[Instruction]]]
+
+class PeepholeRule(NamedTuple):
+    name : str
+    pattern : Tuple[OpCode, ...]
+    rewrite : Rewrite
+
+class PeepholeRegistry:
+    def __init__(self) -> None:
+        self.__rules : Dict[OpCode, List[PeepholeRule]] = {}
+        self.__max_length = 0
+
+    def add(self, name: str, pattern: Tuple[OpCode, ...], rewrite: Rewrite) -> None:
+        if len(pattern) == 0:
+            raise Exception(f"Peephole rule {name} has an empty pattern!")
+
+        # Rules are indexed by the first opcode so only plausible candidates are tried at each position
+        self.__rules.setdefault(pattern[0], []).append(PeepholeRule(name, pattern, rewrite))
+        self.__max_length = max(self.__max_length, len(pattern))
+
+    def register(self, name: str, *pattern: OpCode) -> Callable[[Rewrite], Rewrite]:
+        def decorator(rewrite: Rewrite) -> Rewrite:
+            self.add(name, pattern, rewrite)
+            return rewrite
+
+        return decorator
+
+    def get_rules(self, opcode: OpCode) -> List[PeepholeRule]:
+        return self.__rules.get(opcode, [])
+
+    def copy(self) -> 'PeepholeRegistry':
+        registry = PeepholeRegistry()
+
+        for rules in self.__rules.values():
+            for rule in rules:
+                registry.add(rule.name, rule.pattern, rule.rewrite)
+
+        return registry
+
+    @property
+    def rules(self) -> List[PeepholeRule]:
+        return [rule for rules in self.__rules.values() for rule in rules]
+
+    @property
+    def max_length(self) -> int:
+        return self.__max_length
+
+DEFAULT_REGISTRY = PeepholeRegistry()
+
+@DEFAULT_REGISTRY.register("remove_noop", OpCode.NOOP)
+def __rewrite_NOOP(instrs: Sequence[Instruction]) -> Optional[List[Instruction]]:
+    return []
+
+@DEFAULT_REGISTRY.register("dead_load", OpCode.LOAD_CONST, OpCode.POP)
+@DEFAULT_REGISTRY.register("dead_load", OpCode.LOAD_LOCAL, OpCode.POP)
+@DEFAULT_REGISTRY.register("dead_load", OpCode.LOAD_PARAM, OpCode.POP)
+@DEFAULT_REGISTRY.register("dead_load", OpCode.LOAD_GLOBAL, OpCode.POP)
+@DEFAULT_REGISTRY.register("dead_load", OpCode.LOAD_FUNC_ADDR, OpCode.POP)
+def __rewrite_dead_load(instrs: Sequence[Instruction]) -> Optional[List[Instruction]]:
+    return []
+
+@DEFAULT_REGISTRY.register("redundant_store", OpCode.LOAD_LOCAL, OpCode.STORE_LOCAL)
+@DEFAULT_REGISTRY.register("redundant_store", OpCode.LOAD_PARAM, OpCode.STORE_PARAM)
+@DEFAULT_REGISTRY.register("redundant_store", OpCode.LOAD_GLOBAL, OpCode.STORE_GLOBAL)
+def __rewrite_redundant_store(instrs: Sequence[Instruction]) -> Optional[List[Instruction]]:
+    load, store = cast(Tuple[Union[LOAD_LOCAL, LOAD_PARAM, LOAD_GLOBAL], Union[STORE_LOCAL, STORE_PARAM, STORE_GLOBAL]], instrs)
+    return [] if load.name == store.name else None
+
+@DEFAULT_REGISTRY.register("repeated_store", OpCode.STORE_LOCAL, OpCode.LOAD_LOCAL, OpCode.STORE_LOCAL)
+@DEFAULT_REGISTRY.register("repeated_store", OpCode.STORE_PARAM, OpCode.LOAD_PARAM, OpCode.STORE_PARAM)
+def __rewrite_repeated_store(instrs: Sequence[Instruction]) -> Optional[List[Instruction]]:
+    # Storing a value, reloading it and storing it again leaves the same value behind
+    first, load, second = cast(Tuple[Union[STORE_LOCAL, STORE_PARAM], Union[LOAD_LOCAL, LOAD_PARAM], Union[STORE_LOCAL, STORE_PARAM]], instrs)
+    return [first] if first.name == load.name == second.name else None
+
+__INT_BITS : Dict[DataType, int] = {
+    DataType.I8: 8,
+    DataType.UI8: 8,
+    DataType.I16: 16,
+    DataType.UI16: 16,
+    DataType.I32: 32,
+    DataType.UI32: 32,
+    DataType.I64: 64,
+    DataType.UI64: 64,
+}
+
+def __get_step(value: Word, dt: DataType) -> Optional[int]:
+    # Returns +1 or -1 when the constant, read as dt, is one or minus one
+    if dt == DataType.F64:
+        decoded = struct.unpack('<d', value.bytes)[0]
+    elif dt == DataType.F32:
+        decoded = struct.unpack('<f', value.bytes[:4])[0]
+    else:
+        mask = 2**__INT_BITS[dt] - 1
+        bits = value.as_ui64() & mask
+        decoded = 1 if bits == 1 else -1 if bits == mask else None
+
+    return int(decoded) if decoded in (1, -1) else None
+
+@DEFAULT_REGISTRY.register("add_one", OpCode.LOAD_CONST, OpCode.ADD)
+@DEFAULT_REGISTRY.register("add_one", OpCode.LOAD_CONST, OpCode.SUB)
+def __rewrite_add_one(instrs: Sequence[Instruction]) -> Optional[List[Instruction]]:
+    const, arith = cast(Tuple[LOAD_CONST, Union[ADD, SUB]], instrs)
+    step = __get_step(const.value, arith.data_type)
+
+    if step is None:
+        return None
+    elif isinstance(arith, SUB):
+        step = -step
+
+    return [INC(arith.data_type) if step == 1 else DEC(arith.data_type)]
+
+def optimize_BasicBlock(bb: BasicBlock, registry: PeepholeRegistry = DEFAULT_REGISTRY) -> Dict[str, int]:
+    instrs = list(bb)
+    counts : Dict[str, int] = {}
+    idx = 0
+
+    # A single sweep that steps back after every rewrite reaches the fixed point, since a rewrite
+    # can only create new matches that overlap the instructions it produced
+    while idx < len(instrs):
+        for rule in registry.get_rules(instrs[idx].opcode):
+            end = idx + len(rule.pattern)
+
+            if end > len(instrs) or any(instr.opcode != opcode for instr, opcode in zip(instrs[idx:end], rule.pattern)):
+                continue
+
+            replacement = rule.rewrite(instrs[idx:end])
+
+            if replacement is None:
+                continue
+
+            instrs[idx:end] = replacement
+            counts[rule.name] = counts.get(rule.name, 0) + 1
+            idx = max(0, idx - registry.max_length + 1)
+            break
+        else:
+            idx += 1
+
+    if len(counts) != 0:
+        bb.set_instrs(instrs)
+
+    return counts
+
+def __merge_counts(counts: Dict[str, int], other: Dict[str, int]) -> None:
+    for name, count in other.items():
+        counts[name] = counts.get(name, 0) + count
+
+def optimize_Function(function: Function, registry: PeepholeRegistry = DEFAULT_REGISTRY) -> Dict[str, int]:
+    counts : Dict[str, int] = {}
+
+    for _, bb in function.basic_blocks:
+        __merge_counts(counts, optimize_BasicBlock(bb, registry))
+
+    return counts
+
+def optimize_Program(program: Program, registry: PeepholeRegistry = DEFAULT_REGISTRY) -> Dict[str, int]:
+    counts : Dict[str, int] = {}
+
+    for function in program.functions:
+        __merge_counts(counts, optimize_Function(function, registry))
+
+    return counts
@@ -1,6 +1,8 @@
-from typing import Dict, List, Optional, Set, Tuple
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Set, Tuple
 
 from slate.slasm.function import Function
+from slate.slasm.instruction import Signature
 from slate.slasm.slasm import Word
 
 class Program:
@@ -29,6 +31,27 @@ class Program:
     def contains_nonterminated_basic_block(self) -> bool:
         return any([func.contains_nonterminated_basic_block() for func in self.__functions.values()])
 
+    def is_valid(self, native_signatures: Dict[str, Signature]) -> bool:
+        from slate.slasm.verifier import VerificationError, verify_Program
+
+        try:
+            verify_Program(self, native_signatures)
+        except VerificationError:
+            return False
+
+        return True
+
+    def write_bytecode(self, file: BinaryIO) -> None:
+        from slate.slasm.bytecode import write_Program
+        write_Program(self, file)
+
+    @staticmethod
+    def read_bytecode(path: Path) -> 'Program':
+        from slate.slasm.bytecode import BytecodeReader
+
+        with BytecodeReader.open(path) as reader:
+            return reader.load_Program()
+
     @property
     def target(self) -> str:
         return self.__target
@@ -49,6 +72,10 @@ class Program:
     def data(self) -> List[Tuple[str, bytes]]:
         return list(self.__data.items())
 
+    @property
+    def has_entry(self) -> bool:
+        return self.__entry is not None
+
     @property
     def entry(self) -> str:
         if self.__entry is None:
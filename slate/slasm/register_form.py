@@ -0,0 +1,226 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+from slate.slasm.function import Function
+from slate.slasm.layout import FrameLayout
+from slate.slasm.instruction import *
+from slate.slasm.program import Program
+from slate.slasm.verifier import get_FrameInfo, get_signatures
+
+Register = int
+
+@dataclass(frozen=True)
+class MOVE:
+    dest : Register
+    src : Register
+
+# Sources are listed in stack order, so the last source is the value that was on top of the stack
+@dataclass(frozen=True)
+class Operation:
+    instr : Instruction
+    dest : Optional[Register]
+    srcs : Tuple[Register, ...]
+
+    @property
+    def opcode(self) -> OpCode:
+        return self.instr.opcode
+
+RegisterInstruction = Union[MOVE, Operation]
+
+class RegisterFunction:
+    def __init__(self, name: str, layout: FrameLayout, returns_value: bool, num_registers: int, basic_blocks: Dict[str, List[RegisterInstruction]], entry: str) -> None:
+        self.__name = name
+        self.__layout = layout
+        self.__returns_value = returns_value
+        self.__num_registers = num_registers
+        self.__basic_blocks = dict(basic_blocks)
+        self.__entry = entry
+
+    def get_param_register(self, name: str) -> Register:
+        return self.__layout.get_param_slot(name)
+
+    def get_local_register(self, name: str) -> Register:
+        return self.__layout.num_params + self.__layout.get_local_slot(name)
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def params(self) -> List[str]:
+        return self.__layout.params
+
+    @property
+    def locals(self) -> List[str]:
+        return self.__layout.locals
+
+    @property
+    def num_params(self) -> int:
+        return self.__layout.num_params
+
+    @property
+    def returns_value(self) -> bool:
+        return self.__returns_value
+
+    @property
+    def num_registers(self) -> int:
+        return self.__num_registers
+
+    @property
+    def basic_blocks(self) -> List[Tuple[str, List[RegisterInstruction]]]:
+        return list(self.__basic_blocks.items())
+
+    @property
+    def entry(self) -> str:
+        return self.__entry
+
+    @property
+    def num_instructions(self) -> int:
+        return sum(len(instrs) for instrs in self.__basic_blocks.values())
+
+class __BlockConverter:
+    def __init__(self, first_temp: Register, slots: List[Register], next_temp: Register) -> None:
+        self.instrs : List[RegisterInstruction] = []
+        self.stack : List[Register] = []
+        self.__first_temp = first_temp
+        self.__next_temp = next_temp
+        self.__free_temps : List[Register] = []
+        self.__slots = slots
+
+    def is_temp(self, reg: Register) -> bool:
+        return reg >= self.__first_temp
+
+    def new_temp(self) -> Register:
+        if len(self.__free_temps) != 0:
+            return self.__free_temps.pop()
+
+        reg = self.__next_temp
+        self.__next_temp += 1
+        return reg
+
+    def free(self, *regs: Register) -> None:
+        for reg in regs:
+            if self.is_temp(reg) and reg not in self.stack and reg not in self.__free_temps:
+                self.__free_temps.append(reg)
+
+    def pop(self) -> Register:
+        return self.stack.pop()
+
+    def emit(self, instr: Instruction, num_srcs: int, has_dest: bool) -> None:
+        srcs = tuple(reversed([self.pop() for _ in range(num_srcs)]))
+        self.free(*srcs)
+
+        dest = self.new_temp() if has_dest else None
+        self.instrs.append(Operation(instr, dest, srcs))
+
+        if dest is not None:
+            self.stack.append(dest)
+
+    def preserve(self, reg: Register) -> None:
+        # Copy values still on the stack out of a register that is about to be overwritten
+        if reg in self.stack:
+            temp = self.new_temp()
+            self.instrs.append(MOVE(temp, reg))
+            self.stack = [temp if entry == reg else entry for entry in self.stack]
+
+    def assign(self, dest: Register) -> None:
+        src = self.pop()
+        self.preserve(dest)
+
+        if src == dest:
+            return
+
+        last = self.instrs[-1] if len(self.instrs) != 0 else None
+
+        # Retarget the instruction that produced the value instead of copying it
+        if self.is_temp(src) and isinstance(last, Operation) and last.dest == src:
+            self.instrs[-1] = Operation(last.instr, dest, last.srcs)
+        elif self.is_temp(src) and isinstance(last, MOVE) and last.dest == src:
+            self.instrs[-1] = MOVE(dest, last.src)
+        else:
+            self.instrs.append(MOVE(dest, src))
+
+        self.free(src)
+
+    def spill(self) -> None:
+        # Values live across block boundaries are passed in the stack slot registers
+        targets = self.__slots[:len(self.stack)]
+
+        for idx, (entry, target) in enumerate(zip(self.stack, targets)):
+            if entry != target and entry in targets:
+                temp = self.new_temp()
+                self.instrs.append(MOVE(temp, entry))
+                self.stack[idx] = temp
+
+        for entry, target in zip(self.stack, targets):
+            if entry != target:
+                self.instrs.append(MOVE(target, entry))
+
+        self.stack = list(targets)
+
+    @property
+    def next_temp(self) -> Register:
+        return self.__next_temp
+
+def convert_Function(function: Function, signatures: Dict[str, Signature]) -> RegisterFunction:
+    layout = function.layout
+    num_params = layout.num_params
+    depths = get_FrameInfo(function, signatures).entry_depths
+    max_depth = max(depths.values(), default=0)
+
+    # Registers are laid out as params, locals, stack slots and then temporaries
+    slots = [num_params + layout.num_locals + i for i in range(max_depth)]
+    first_temp = num_params + layout.num_locals + len(slots)
+    num_registers = first_temp
+    basic_blocks : Dict[str, List[RegisterInstruction]] = {}
+
+    for label, bb in function.basic_blocks:
+        converter = __BlockConverter(first_temp, slots, first_temp)
+        converter.stack = slots[:depths.get(label, 0)]
+
+        for instr in bb:
+            if isinstance(instr, NOOP):
+                pass
+            elif isinstance(instr, LOAD_LOCAL):
+                converter.stack.append(num_params + layout.get_local_slot(instr.name))
+            elif isinstance(instr, LOAD_PARAM):
+                converter.stack.append(layout.get_param_slot(instr.name))
+            elif isinstance(instr, STORE_LOCAL):
+                converter.assign(num_params + layout.get_local_slot(instr.name))
+            elif isinstance(instr, STORE_PARAM):
+                converter.assign(layout.get_param_slot(instr.name))
+            elif isinstance(instr, POP):
+                converter.free(converter.pop())
+            elif isinstance(instr, JUMP):
+                converter.spill()
+                converter.instrs.append(Operation(instr, None, ()))
+            elif isinstance(instr, COND_JUMP):
+                condition = converter.pop()
+
+                if condition in slots:
+                    temp = converter.new_temp()
+                    converter.instrs.append(MOVE(temp, condition))
+                    condition = temp
+
+                converter.spill()
+                converter.instrs.append(Operation(instr, None, (condition,)))
+            elif isinstance(instr, RET):
+                converter.emit(instr, 1 if function.returns_value else 0, False)
+            elif isinstance(instr, (LOAD_CONST, LOAD_FUNC_ADDR, LOAD_GLOBAL)):
+                converter.emit(instr, 0, True)
+            elif isinstance(instr, CALL):
+                pops, pushes = get_stack_effect(instr, signatures)
+                converter.emit(instr, pops, pushes != 0)
+            elif isinstance(instr, INDIRECT_CALL):
+                converter.emit(instr, instr.num_params + 1, instr.returns_value)
+            else:
+                pops, pushes = get_stack_effect(instr, signatures)
+                converter.emit(instr, pops, pushes != 0)
+
+        basic_blocks[label] = converter.instrs
+        num_registers = max(num_registers, converter.next_temp)
+
+    return RegisterFunction(function.name, layout, function.returns_value, num_registers, basic_blocks, function.entry)
+
+def convert_Program(program: Program, native_signatures: Dict[str, Signature]) -> Dict[str, RegisterFunction]:
+    signatures = get_signatures(program, native_signatures)
+    return {function.name: convert_Function(function, signatures) for function in program.functions}
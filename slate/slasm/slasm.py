@@ -24,6 +24,15 @@ class Word:
         assert len(bs) == Word.SIZE()
         self.bytes = bs
 
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Word) and self.bytes == other.bytes
+
+    def __hash__(self) -> int:
+        return hash(self.bytes)
+
+    def __repr__(self) -> str:
+        return f"Word({self.as_hex()})"
+
     def as_hex(self, endianness: Literal['little', 'big'] = 'big') -> str:
         return "0x" + (self.bytes.hex() if endianness == 'little' else self.bytes[::-1].hex())
 
@@ -0,0 +1,176 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+from slate.slasm.assembler import assemble_Source
+from slate.slasm.elf import write_ObjectFile
+
+class Platform(NamedTuple):
+    name: str
+    object_format: str
+    template: str
+    linker: Tuple[str, ...]
+    natives: Tuple[str, ...]
+    calling_conventions: Tuple[str, ...] # those the template's natives can take arguments in
+    llvm_runtime: bool # whether the LLVM backend's runtime, which makes Linux syscalls, runs here
+
+__SYSCALL_NATIVES = ("LINUX_x86_64_SYSCALL1_WITH_RET", "LINUX_x86_64_SYSCALL1_NO_RET", "DEBUG_PRINT_I64")
+__C_NATIVES = __SYSCALL_NATIVES + ("C_CALL_3_WITH_RET", "C_CALL_3_NO_RET")
+
+__PLATFORMS = {
+    "linux": Platform("linux", "elf64", "nasm_template_linux.asm", ("gcc",), __C_NATIVES, ("stack", "sysv"), True),
+    "darwin": Platform("darwin", "macho64", "nasm_template.asm", ("gcc", "-arch", "x86_64"), __C_NATIVES, ("stack",), False),
+}
+
+# Static executables with their own _start and syscall-only runtime, so there is no dynamic loader
+# or C library to initialize
+__FREESTANDING_PLATFORM = Platform("linux-freestanding", "elf64", "nasm_template_freestanding.asm", ("ld", "-static", "-z", "noexecstack"), __SYSCALL_NATIVES, ("stack", "sysv"), True)
+
+def get_Platform(name: str = sys.platform, freestanding: bool = False) -> Platform:
+    key = "linux" if name.startswith("linux") else name
+
+    if key not in __PLATFORMS:
+        raise Exception(f"Unsupported platform {name}")
+    elif freestanding:
+        if key != "linux":
+            raise Exception(f"Freestanding executables are not supported on {name}")
+
+        return __FREESTANDING_PLATFORM
+
+    return __PLATFORMS[key]
+
+def read_Template(platform: Platform) -> str:
+    return (Path(__file__).parent / platform.template).read_text()
+
+def get_DefaultCacheDirectory() -> Path:
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "slate"
+
+class BuildTarget(NamedTuple):
+    asm_path: Path
+    object_path: Path
+    executable_path: Path
+
+class StepTiming(NamedTuple):
+    target: Path
+    step: str
+    seconds: float
+    cached: bool
+
+class BuildCache:
+    # Maps content hashes of tool inputs to the files the tools produced. Entries are written under
+    # a temporary name and renamed, so concurrent builds never see partial files.
+    def __init__(self, directory: Optional[Path]) -> None:
+        self.__directory = directory
+
+    def get_key(self, *parts: bytes) -> str:
+        hash = hashlib.sha256()
+
+        for part in parts:
+            hash.update(len(part).to_bytes(8, 'little'))
+            hash.update(part)
+
+        return hash.hexdigest()
+
+    def __get_path(self, key: str) -> Optional[Path]:
+        return None if self.__directory is None else self.__directory / key[:2] / key
+
+    def fetch(self, key: str, destination: Path) -> bool:
+        path = self.__get_path(key)
+
+        if path is None or not path.exists():
+            return False
+
+        shutil.copy2(path, destination)
+        return True
+
+    def store(self, key: str, source: Path) -> None:
+        path = self.__get_path(key)
+
+        if path is None:
+            return
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{key}.{os.getpid()}.{time.monotonic_ns()}.tmp")
+        shutil.copy2(source, temp_path)
+        os.replace(temp_path, path)
+
+def __run_Tool(args: Sequence[str]) -> None:
+    try:
+        process = subprocess.run(list(args), capture_output=True, text=True)
+    except FileNotFoundError:
+        raise Exception(f"Could not find {args[0]}, which is needed to build")
+
+    if process.returncode != 0:
+        raise Exception(f"{' '.join(args)} failed with exit code {process.returncode}\n{process.stdout}{process.stderr}")
+
+def __assemble(target: BuildTarget, platform: Platform, cache: BuildCache, builtin_assembler: bool) -> Tuple[StepTiming, str]:
+    start_time = time.perf_counter()
+    source = target.asm_path.read_bytes()
+    command = ["slate-builtin", "elf64"] if builtin_assembler else ["nasm", "-f", platform.object_format]
+    key = cache.get_key(*[arg.encode() for arg in command], source)
+    cached = cache.fetch(key, target.object_path)
+
+    if not cached:
+        if builtin_assembler:
+            if platform.object_format != "elf64":
+                raise Exception(f"The built-in assembler cannot produce {platform.object_format} objects")
+
+            with target.object_path.open("wb") as file:
+                write_ObjectFile(assemble_Source(source.decode()), file)
+        else:
+            __run_Tool(command + ["-o", str(target.object_path), str(target.asm_path)])
+
+        cache.store(key, target.object_path)
+
+    return StepTiming(target.executable_path, "assemble", time.perf_counter() - start_time, cached), key
+
+def __link(target: BuildTarget, platform: Platform, cache: BuildCache, object_key: str) -> StepTiming:
+    # Tools produce the same object for the same input, so the object's key stands in for its contents
+    start_time = time.perf_counter()
+    key = cache.get_key(*[arg.encode() for arg in platform.linker], object_key.encode())
+    cached = cache.fetch(key, target.executable_path)
+
+    if not cached:
+        __run_Tool(list(platform.linker) + ["-o", str(target.executable_path), str(target.object_path)])
+        cache.store(key, target.executable_path)
+
+    return StepTiming(target.executable_path, "link", time.perf_counter() - start_time, cached)
+
+def __build_Target(target: BuildTarget, platform: Platform, cache: BuildCache, builtin_assembler: bool) -> List[StepTiming]:
+    assemble_timing, object_key = __assemble(target, platform, cache, builtin_assembler)
+    link_timing = __link(target, platform, cache, object_key)
+    target.object_path.unlink()
+
+    return [assemble_timing, link_timing]
+
+def link_Objects(objects: Sequence[bytes], executable_path: Path, platform: Platform, cache: BuildCache) -> StepTiming:
+    # Links objects produced in memory, such as by the LLVM backend, which are written out for the linker
+    start_time = time.perf_counter()
+    key = cache.get_key(*[arg.encode() for arg in platform.linker], *objects)
+    cached = cache.fetch(key, executable_path)
+
+    if not cached:
+        with TemporaryDirectory() as temp_dir:
+            object_paths = [Path(temp_dir) / f"{idx}.o" for idx in range(len(objects))]
+
+            for path, object in zip(object_paths, objects):
+                path.write_bytes(object)
+
+            __run_Tool(list(platform.linker) + ["-o", str(executable_path)] + [str(path) for path in object_paths])
+
+        cache.store(key, executable_path)
+
+    return StepTiming(executable_path, "link", time.perf_counter() - start_time, cached)
+
+def build_Targets(targets: Sequence[BuildTarget], platform: Platform, cache: BuildCache, jobs: int = 1, builtin_assembler: bool = False) -> List[StepTiming]:
+    # Each target is assembled and then linked, while up to jobs targets are built at once. The tools
+    # run as separate processes, so threads are enough to overlap them.
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [executor.submit(__build_Target, target, platform, cache, builtin_assembler) for target in targets]
+        return [timing for future in futures for timing in future.result()]
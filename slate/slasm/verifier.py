@@ -0,0 +1,100 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+from slate.slasm.function import Function
+from slate.slasm.instruction import *
+from slate.slasm.program import Program
+
+class VerificationError(Exception):
+    def __init__(self, msg: str) -> None:
+        super().__init__(msg)
+
+@dataclass(frozen=True)
+class FrameInfo:
+    entry_depths : Dict[str, int]
+    exit_depths : Dict[str, int]
+    max_stack_height : int
+
+def __check_operands(instr: Instruction, function: Function, label: str, signatures: Dict[str, Signature], globals: Optional[Set[str]]) -> None:
+    if isinstance(instr, (LOAD_LOCAL, STORE_LOCAL)) and not function.layout.has_local(instr.name):
+        raise VerificationError(f"Basic block '{label}' of function '{function.name}' uses undeclared local '{instr.name}'")
+    elif isinstance(instr, (LOAD_PARAM, STORE_PARAM)) and not function.layout.has_param(instr.name):
+        raise VerificationError(f"Basic block '{label}' of function '{function.name}' uses undeclared param '{instr.name}'")
+    elif isinstance(instr, (LOAD_GLOBAL, STORE_GLOBAL)) and globals is not None and instr.name not in globals:
+        raise VerificationError(f"Basic block '{label}' of function '{function.name}' uses undeclared global '{instr.name}'")
+    elif isinstance(instr, CALL) and instr.target not in signatures:
+        raise VerificationError(f"Basic block '{label}' of function '{function.name}' calls unknown function '{instr.target}'")
+    elif isinstance(instr, LOAD_FUNC_ADDR) and instr.func_name not in signatures:
+        raise VerificationError(f"Basic block '{label}' of function '{function.name}' takes the address of unknown function '{instr.func_name}'")
+
+def verify_Function(function: Function, signatures: Dict[str, Signature], globals: Optional[Set[str]] = None) -> FrameInfo:
+    blocks = dict(function.basic_blocks)
+    entry_depths = {function.entry: 0}
+    exit_depths : Dict[str, int] = {}
+    max_stack_height = 0
+    worklist = [function.entry]
+
+    while len(worklist) != 0:
+        label = worklist.pop()
+        bb = blocks[label]
+        depth = entry_depths[label]
+        successors : List[str] = []
+
+        if not bb.is_terminated():
+            raise VerificationError(f"Basic block '{label}' of function '{function.name}' is not terminated")
+
+        for instr in bb:
+            __check_operands(instr, function, label, signatures, globals)
+
+            if isinstance(instr, RET):
+                pops, pushes = (1 if function.returns_value else 0), 0
+            else:
+                pops, pushes = get_stack_effect(instr, signatures)
+
+            if depth < pops:
+                raise VerificationError(f"Stack underflow at {instr.opcode.name} in basic block '{label}' of function '{function.name}'")
+
+            depth += pushes - pops
+            max_stack_height = max(max_stack_height, depth)
+
+            if isinstance(instr, JUMP):
+                successors = [instr.target]
+            elif isinstance(instr, COND_JUMP):
+                successors = [instr.true_target, instr.false_target]
+
+        exit_depths[label] = depth
+
+        for successor in successors:
+            if successor not in blocks:
+                raise VerificationError(f"Function '{function.name}' does not contain a basic block labelled '{successor}'")
+            elif successor not in entry_depths:
+                entry_depths[successor] = depth
+                worklist.append(successor)
+            elif entry_depths[successor] != depth:
+                raise VerificationError(f"Basic block '{successor}' of function '{function.name}' is entered with stack depths {entry_depths[successor]} and {depth}")
+
+    return FrameInfo(entry_depths, exit_depths, max_stack_height)
+
+def get_FrameInfo(function: Function, signatures: Dict[str, Signature]) -> FrameInfo:
+    # Cached on the function until it is mutated
+    return function.get_analysis("frame_info", lambda function: verify_Function(function, signatures))
+
+def get_signatures(program: Program, native_signatures: Dict[str, Signature]) -> Dict[str, Signature]:
+    signatures = dict(native_signatures)
+
+    for function in program.functions:
+        signatures[function.name] = Signature(function.num_params, function.returns_value)
+
+    return signatures
+
+def verify_Program(program: Program, native_signatures: Dict[str, Signature]) -> Dict[str, FrameInfo]:
+    signatures = get_signatures(program, native_signatures)
+    globals = program.globals
+    frame_infos : Dict[str, FrameInfo] = {}
+
+    if program.has_entry and program.entry not in signatures:
+        raise VerificationError(f"Program's entry {program.entry} is not a function")
+
+    for function in program.functions:
+        frame_infos[function.name] = function.get_analysis("frame_info", lambda function: verify_Function(function, signatures, globals))
+
+    return frame_infos
@@ -1,11 +1,11 @@
 import json
-from typing import Any, Callable, Dict
-from slate.slasm.function import Function
+from typing import Any, Callable, Dict, Iterator, TextIO, Tuple
+from slate.slasm.function import BasicBlock, Function
 from slate.slasm.instruction import *
 from slate.slasm.program import Program
-from slate.slasm.slasm import VERSION
+from slate.slasm.slasm import VERSION, DataType, Word
 
-def __emit_NOOP(instr: NOOP) -> Any:
+def __emit_OPERANDLESS(instr: Union[NOOP, POP, OR, AND, XOR, NOT, RET]) -> Any:
     return {"opcode": instr.opcode.name}
 
 def __emit_LOAD_CONST(instr: LOAD_CONST) -> Any:
@@ -14,17 +14,72 @@ def __emit_LOAD_CONST(instr: LOAD_CONST) -> Any:
 def __emit_LOAD_FUNC_ADDR(instr: LOAD_FUNC_ADDR) -> Any:
     return {"opcode": instr.opcode.name, "func_name": instr.func_name}
 
+def __emit_NAMED(instr: Union[LOAD_LOCAL, LOAD_PARAM, LOAD_GLOBAL, STORE_LOCAL, STORE_PARAM, STORE_GLOBAL]) -> Any:
+    return {"opcode": instr.opcode.name, "name": instr.name}
+
+def __emit_MEM(instr: Union[LOAD_MEM, STORE_MEM]) -> Any:
+    return {"opcode": instr.opcode.name, "offset": int(instr.offset)}
+
+def __emit_TYPED(instr: Union[ADD, SUB, MUL, DIV, MOD, INC, DEC, EQ, NEQ, GT, LT, GTEQ, LTEQ, NEG]) -> Any:
+    return {"opcode": instr.opcode.name, "type": instr.data_type.name}
+
+def __emit_SHIFT(instr: Union[SHL, SHR]) -> Any:
+    return {"opcode": instr.opcode.name, "amt": instr.amt}
+
+def __emit_CONVERT(instr: CONVERT) -> Any:
+    return {"opcode": instr.opcode.name, "from_type": instr.from_dt.name, "to_type": instr.to_dt.name}
+
+def __emit_JUMP(instr: JUMP) -> Any:
+    return {"opcode": instr.opcode.name, "target": instr.target}
+
+def __emit_COND_JUMP(instr: COND_JUMP) -> Any:
+    return {"opcode": instr.opcode.name, "true_target": instr.true_target, "false_target": instr.false_target}
+
 def __emit_CALL(instr: CALL) -> Any:
     return {"opcode": instr.opcode.name, "target": instr.target}
 
-def __emit_RET(instr: RET) -> Any:
-    return {"opcode": instr.opcode.name}
+def __emit_INDIRECT_CALL(instr: INDIRECT_CALL) -> Any:
+    return {"opcode": instr.opcode.name, "num_params": int(instr.num_params), "returns_value": instr.returns_value}
 
 __TRANSLATORS : Dict[Any, Callable[..., Any]] = {
-    OpCode.NOOP: __emit_NOOP,
+    OpCode.NOOP: __emit_OPERANDLESS,
     OpCode.LOAD_CONST: __emit_LOAD_CONST,
+    OpCode.LOAD_LOCAL: __emit_NAMED,
+    OpCode.LOAD_PARAM: __emit_NAMED,
+    OpCode.LOAD_GLOBAL: __emit_NAMED,
+    OpCode.LOAD_MEM: __emit_MEM,
+    OpCode.LOAD_FUNC_ADDR: __emit_LOAD_FUNC_ADDR,
+    OpCode.POP: __emit_OPERANDLESS,
+    OpCode.STORE_LOCAL: __emit_NAMED,
+    OpCode.STORE_PARAM: __emit_NAMED,
+    OpCode.STORE_GLOBAL: __emit_NAMED,
+    OpCode.STORE_MEM: __emit_MEM,
+    OpCode.ADD: __emit_TYPED,
+    OpCode.SUB: __emit_TYPED,
+    OpCode.MUL: __emit_TYPED,
+    OpCode.DIV: __emit_TYPED,
+    OpCode.MOD: __emit_TYPED,
+    OpCode.INC: __emit_TYPED,
+    OpCode.DEC: __emit_TYPED,
+    OpCode.EQ: __emit_TYPED,
+    OpCode.NEQ: __emit_TYPED,
+    OpCode.GT: __emit_TYPED,
+    OpCode.LT: __emit_TYPED,
+    OpCode.GTEQ: __emit_TYPED,
+    OpCode.LTEQ: __emit_TYPED,
+    OpCode.NEG: __emit_TYPED,
+    OpCode.OR: __emit_OPERANDLESS,
+    OpCode.AND: __emit_OPERANDLESS,
+    OpCode.XOR: __emit_OPERANDLESS,
+    OpCode.NOT: __emit_OPERANDLESS,
+    OpCode.SHL: __emit_SHIFT,
+    OpCode.SHR: __emit_SHIFT,
+    OpCode.CONVERT: __emit_CONVERT,
+    OpCode.JUMP: __emit_JUMP,
+    OpCode.COND_JUMP: __emit_COND_JUMP,
     OpCode.CALL: __emit_CALL,
-    OpCode.RET: __emit_RET,
+    OpCode.INDIRECT_CALL: __emit_INDIRECT_CALL,
+    OpCode.RET: __emit_OPERANDLESS,
 }
 
 def emit_Instruction(instr: Instruction) -> Any:
@@ -43,27 +98,252 @@ def emit_Function(function: Function) -> Any:
         "basic_blocks": {label:[emit_Instruction(instr) for instr in bb] for label, bb in function.basic_blocks}
     }
 
-def emit_Program(program: Program) -> Any:
+def __emit_header(program: Program) -> Dict[str, Any]:
     return {
         "slasm_version": VERSION(),
         "target": program.target,
-        "entry": program.entry,
+        "entry": program.entry if program.has_entry else None,
         "globals": list(program.globals),
-        "functions": {func.name:emit_Function(func) for func in program.functions}
+        "data": {label:data.hex() for label, data in program.data},
     }
 
-def load_Program(json_value: Any) -> Program:
+def emit_Program(program: Program) -> Any:
+    json_value = __emit_header(program)
+    json_value["functions"] = {func.name:emit_Function(func) for func in program.functions}
+
+    return json_value
+
+def write_Program(program: Program, file: TextIO) -> None:
+    # Functions are serialized one at a time so the whole document never has to be built in memory
+    header = json.dumps(__emit_header(program))
+    file.write(header[:-1] + ', "functions": {')
+
+    for idx, func in enumerate(program.functions):
+        if idx != 0:
+            file.write(", ")
+
+        file.write(f"{json.dumps(func.name)}: {json.dumps(emit_Function(func))}")
+
+    file.write("}}")
+
+def __load_TYPED(cls: Any) -> Callable[[Any], Instruction]:
+    return lambda json_value: cls(DataType[json_value["type"]])
+
+def __load_OPERANDLESS(cls: Any) -> Callable[[Any], Instruction]:
+    return lambda json_value: cls()
+
+def __load_LOAD_CONST(json_value: Any) -> Instruction:
+    return LOAD_CONST(Word.FromUI64(ui64(int(json_value["value"], 16))))
+
+def __load_CONVERT(json_value: Any) -> Instruction:
+    return CONVERT(DataType[json_value["from_type"]], DataType[json_value["to_type"]])
+
+def __load_INDIRECT_CALL(json_value: Any) -> Instruction:
+    return INDIRECT_CALL(uint(json_value["num_params"]), bool(json_value["returns_value"]))
+
+__LOADERS : Dict[Any, Callable[[Any], Instruction]] = {
+    OpCode.NOOP: __load_OPERANDLESS(NOOP),
+    OpCode.LOAD_CONST: __load_LOAD_CONST,
+    OpCode.LOAD_LOCAL: lambda json_value: LOAD_LOCAL(json_value["name"]),
+    OpCode.LOAD_PARAM: lambda json_value: LOAD_PARAM(json_value["name"]),
+    OpCode.LOAD_GLOBAL: lambda json_value: LOAD_GLOBAL(json_value["name"]),
+    OpCode.LOAD_MEM: lambda json_value: LOAD_MEM(i64(json_value["offset"])),
+    OpCode.LOAD_FUNC_ADDR: lambda json_value: LOAD_FUNC_ADDR(json_value["func_name"]),
+    OpCode.POP: __load_OPERANDLESS(POP),
+    OpCode.STORE_LOCAL: lambda json_value: STORE_LOCAL(json_value["name"]),
+    OpCode.STORE_PARAM: lambda json_value: STORE_PARAM(json_value["name"]),
+    OpCode.STORE_GLOBAL: lambda json_value: STORE_GLOBAL(json_value["name"]),
+    OpCode.STORE_MEM: lambda json_value: STORE_MEM(i64(json_value["offset"])),
+    OpCode.ADD: __load_TYPED(ADD),
+    OpCode.SUB: __load_TYPED(SUB),
+    OpCode.MUL: __load_TYPED(MUL),
+    OpCode.DIV: __load_TYPED(DIV),
+    OpCode.MOD: __load_TYPED(MOD),
+    OpCode.INC: __load_TYPED(INC),
+    OpCode.DEC: __load_TYPED(DEC),
+    OpCode.EQ: __load_TYPED(EQ),
+    OpCode.NEQ: __load_TYPED(NEQ),
+    OpCode.GT: __load_TYPED(GT),
+    OpCode.LT: __load_TYPED(LT),
+    OpCode.GTEQ: __load_TYPED(GTEQ),
+    OpCode.LTEQ: __load_TYPED(LTEQ),
+    OpCode.NEG: __load_TYPED(NEG),
+    OpCode.OR: __load_OPERANDLESS(OR),
+    OpCode.AND: __load_OPERANDLESS(AND),
+    OpCode.XOR: __load_OPERANDLESS(XOR),
+    OpCode.NOT: __load_OPERANDLESS(NOT),
+    OpCode.SHL: lambda json_value: SHL(json_value["amt"]),
+    OpCode.SHR: lambda json_value: SHR(json_value["amt"]),
+    OpCode.CONVERT: __load_CONVERT,
+    OpCode.JUMP: lambda json_value: JUMP(json_value["target"]),
+    OpCode.COND_JUMP: lambda json_value: COND_JUMP(json_value["true_target"], json_value["false_target"]),
+    OpCode.CALL: lambda json_value: CALL(json_value["target"]),
+    OpCode.INDIRECT_CALL: __load_INDIRECT_CALL,
+    OpCode.RET: __load_OPERANDLESS(RET),
+}
+
+def load_Instruction(json_value: Any) -> Instruction:
+    opcode = OpCode[json_value["opcode"]]
+
+    if opcode not in __LOADERS:
+        raise NotImplementedError(opcode)
+
+    return __LOADERS[opcode](json_value)
+
+def load_Function(json_value: Any) -> Function:
     assert isinstance(json_value, dict)
 
-    program = Program(json_value["target"])
+    function = Function(json_value["name"], json_value["params"], json_value["locals"], json_value["returns_value"])
+
+    for label, instrs in json_value["basic_blocks"].items():
+        bb = BasicBlock()
+
+        for instr in instrs:
+            bb.append_instr(load_Instruction(instr))
+
+        function.add_basic_block(label, bb)
+
+    function.entry = json_value["entry"]
 
-    for item in json_value["globals"].values():
-        pass
+    return function
+
+def __load_header(json_value: Dict[str, Any]) -> Program:
+    if json_value.get("slasm_version") != VERSION():
+        raise Exception(f"Unsupported slasm version {json_value.get('slasm_version')}")
+
+    program = Program(json_value["target"], set(json_value["globals"]))
+
+    for label, data in json_value["data"].items():
+        program.add_data(label, bytes.fromhex(data))
+
+    return program
+
+def load_Program(json_value: Any) -> Program:
+    assert isinstance(json_value, dict)
+
+    program = __load_header(json_value)
 
     for item in json_value["functions"].values():
-        pass
+        program.add_function(load_Function(item))
+
+    if json_value["entry"] is not None:
+        program.entry = json_value["entry"]
+
+    return program
+
+class __StreamReader:
+    def __init__(self, file: TextIO, chunk_size: int) -> None:
+        self.__file = file
+        self.__chunk_size = chunk_size
+        self.__decoder = json.JSONDecoder()
+        self.__buffer = ""
+        self.__pos = 0
+        self.__eof = False
+
+    def __fill(self, min_size: int) -> bool:
+        if self.__eof:
+            return False
+
+        # Drop consumed input so only the value being decoded is kept in memory
+        self.__buffer = self.__buffer[self.__pos:]
+        self.__pos = 0
+
+        chunk = self.__file.read(max(self.__chunk_size, min_size))
+        self.__eof = len(chunk) == 0
+        self.__buffer += chunk
+
+        return not self.__eof
+
+    def peek(self) -> str:
+        while True:
+            while self.__pos < len(self.__buffer) and self.__buffer[self.__pos].isspace():
+                self.__pos += 1
+
+            if self.__pos < len(self.__buffer):
+                return self.__buffer[self.__pos]
+            elif not self.__fill(0):
+                raise Exception("Unexpected end of slasm JSON document")
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise Exception(f"Expected '{char}' in slasm JSON document but found '{self.peek()}'")
+
+        self.__pos += 1
+
+    def accept(self, char: str) -> bool:
+        if self.peek() != char:
+            return False
+
+        self.__pos += 1
+        return True
+
+    def value(self) -> Any:
+        self.peek()
+
+        while True:
+            try:
+                value, end = self.__decoder.raw_decode(self.__buffer, self.__pos)
+
+                # A number may continue into the next chunk
+                if end < len(self.__buffer) or self.__eof:
+                    self.__pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.__eof:
+                    raise
+
+            # Grow geometrically so large values are decoded a bounded number of times
+            self.__fill(len(self.__buffer) - self.__pos)
+
+    def members(self) -> Iterator[str]:
+        self.expect("{")
+
+        if self.accept("}"):
+            return
+
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+
+            if self.accept("}"):
+                return
+
+            self.expect(",")
+
+def iter_Program(file: TextIO, chunk_size: int = 1024 * 1024) -> Iterator[Tuple[str, Any]]:
+    reader = __StreamReader(file, chunk_size)
+
+    for key in reader.members():
+        if key == "functions":
+            for _ in reader.members():
+                yield "function", load_Function(reader.value())
+        else:
+            yield key, reader.value()
+
+def iter_Functions(file: TextIO, chunk_size: int = 1024 * 1024) -> Iterator[Function]:
+    for key, value in iter_Program(file, chunk_size):
+        if key == "function":
+            yield value
+
+def read_Program(file: TextIO, chunk_size: int = 1024 * 1024) -> Program:
+    header : Dict[str, Any] = {}
+    program = None
+
+    for key, value in iter_Program(file, chunk_size):
+        if key != "function":
+            header[key] = value
+        else:
+            if program is None:
+                program = __load_header(header)
+
+            program.add_function(value)
+
+    if program is None:
+        program = __load_header(header)
 
-    program.entry = json_value["entry"]
+    if header.get("entry") is not None:
+        program.entry = header["entry"]
 
     return program
 
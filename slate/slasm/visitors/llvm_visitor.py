@@ -1,8 +1,13 @@
-from typing import Any, Callable, Dict, List, NamedTuple, Optional, cast
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union, cast
+from slate.optimizer import OptimizationOptions, initialize_llvm, link_Modules, optimize, optimize_WholeProgram, optimize_ir
+from slate.slasm.cfg import get_CFG
 from slate.slasm.function import Function
 from slate.slasm.instruction import *
+from slate.slasm.parallel import map_Shards, split_Shards
 from slate.slasm.program import Program
-from slate.slasm.slasm import Word
+from slate.slasm.register_form import MOVE, Operation, RegisterFunction, RegisterInstruction, convert_Function, convert_Program
+from slate.slasm.verifier import get_signatures
+from slate.slasm.slasm import DataType, Word
 
 from llvmlite import ir # type: ignore
 import llvmlite.binding as llvm # type: ignore
@@ -15,6 +20,7 @@ class GlobalContext:
     
     def __init__(self, llvm_module: ir.Module) -> None:
         self.__llvm_module = llvm_module
+        self.__func_defs : Dict[str, 'GlobalContext.FuncDef'] = {}
 
     def get_global(self, name: str) -> ir.Value:
         llvm_global = self.__llvm_module.get_global(name)
@@ -23,18 +29,21 @@ class GlobalContext:
         return llvm_global 
 
     def get_function(self, name: str) -> FuncDef:
-        llvm_func = self.__llvm_module.get_global(name)
-        assert isinstance(llvm_func, ir.Function)
+        if name not in self.__func_defs:
+            llvm_func = self.__llvm_module.get_global(name)
+            assert isinstance(llvm_func, ir.Function)
 
-        return GlobalContext.FuncDef(llvm_func, len(llvm_func.args), llvm_func.return_value.type == ir.VoidType())
+            self.__func_defs[name] = GlobalContext.FuncDef(llvm_func, len(llvm_func.args), llvm_func.return_value.type != ir.VoidType())
+
+        return self.__func_defs[name]
 
 class FunctionContext:
-    def __init__(self, func_name: str, global_ctx: GlobalContext) -> None:
-        self.__func_name = func_name
+    def __init__(self, function: Function, global_ctx: GlobalContext) -> None:
+        self.__function = function
         self.__global_ctx = global_ctx
-        self.__params : List[ir.Value] = []
-        self.__locals : List[ir.Value] = []
+        self.__variables : List[ir.Value] = []
         self.__stack : List[ir.Value] = []
+        self.__blocks : Dict[str, ir.Block] = {}
 
     def push_value_onto_stack(self, value: ir.Value) -> None:
         self.__stack.append(value)
@@ -42,22 +51,47 @@ class FunctionContext:
     def pop_value_from_stack(self) -> ir.Value:
         return self.__stack.pop()
 
+    def pop_operands(self, count: int) -> List[ir.Value]:
+        # Operands are returned in stack order, so the last one was on top of the stack
+        operands = self.__stack[len(self.__stack) - count:]
+        del self.__stack[len(self.__stack) - count:]
+
+        return operands
+
+    def add_basic_block(self, label: str, block: ir.Block) -> None:
+        self.__blocks[label] = block
+
     def get_basic_block(self, label: str) -> ir.Block:
-        for block in cast(List[ir.Block], self.global_ctx.get_function(self.func_name).llvm_func.basic_blocks):
-            if block.name == label:
-                return block
+        if label not in self.__blocks:
+            raise Exception(f"Function '{self.func_name}' does not contain a basic block labelled '{label}'")
+
+        return self.__blocks[label]
+
+    def get_variable_idx(self, instr: Union[LOAD_PARAM, LOAD_LOCAL, STORE_PARAM, STORE_LOCAL]) -> int:
+        # Params come first, followed by locals
+        layout = self.__function.layout
+
+        if isinstance(instr, (LOAD_PARAM, STORE_PARAM)):
+            return layout.get_param_slot(instr.name)
+
+        return layout.num_params + layout.get_local_slot(instr.name)
+
+    def get_variable(self, idx: int) -> ir.Value:
+        return self.__variables[idx]
 
-        raise Exception(f"Functoin '{self.func_name}' does not contain a basic block labelled '{label}'")
+    def set_variable(self, idx: int, value: ir.Value) -> None:
+        self.__variables[idx] = value
 
-    def get_param(self, idx: int) -> ir.Value:
-        return self.__params[idx]
+    def enter_block(self, values: List[ir.Value]) -> None:
+        self.__variables = values[:self.num_variables]
+        self.__stack = values[self.num_variables:]
 
-    def get_local(self, idx: int) -> ir.Value:
-        return self.__locals[idx]
+    def exit_block(self) -> List[ir.Value]:
+        return self.__variables + self.__stack
 
     @property
     def func_name(self) -> str:
-        return self.__func_name
+        return self.__function.name
 
     @property
     def global_ctx(self) -> GlobalContext:
@@ -67,71 +101,578 @@ class FunctionContext:
     def num_params(self) -> int:
         return self.global_ctx.get_function(self.func_name).num_params
 
+    @property
+    def num_variables(self) -> int:
+        return self.__function.num_params + self.__function.num_locals
+
     @property
     def returns_value(self) -> bool:
         return self.global_ctx.get_function(self.func_name).returns_value
 
-def __emit_LOAD_CONST(instr: LOAD_CONST, llvm_builder: ir.IRBuilder, ctx: FunctionContext) -> None:
-    ctx.push_value_onto_stack(ir.Constant(LLVMTypeWord, instr.value.as_ui64()))
+def __emit_NOOP(instr: NOOP, llvm_builder: ir.IRBuilder, ctx: FunctionContext) -> None:
+    pass
+
+def __emit_LOAD_VARIABLE(instr: Union[LOAD_PARAM, LOAD_LOCAL], llvm_builder: ir.IRBuilder, ctx: FunctionContext) -> None:
+    ctx.push_value_onto_stack(ctx.get_variable(ctx.get_variable_idx(instr)))
+
+def __emit_STORE_VARIABLE(instr: Union[STORE_PARAM, STORE_LOCAL], llvm_builder: ir.IRBuilder, ctx: FunctionContext) -> None:
+    ctx.set_variable(ctx.get_variable_idx(instr), ctx.pop_value_from_stack())
 
-def __emit_LOAD_FUNC_ADDR(instr: LOAD_FUNC_ADDR, llvm_builder: ir.IRBuilder, ctx: FunctionContext) -> None:
-    ctx.push_value_onto_stack(ctx.global_ctx.get_function(instr.func_name))
+def __emit_POP(instr: POP, llvm_builder: ir.IRBuilder, ctx: FunctionContext) -> None:
+    ctx.pop_value_from_stack()
+
+def __emit_JUMP(instr: JUMP, llvm_builder: ir.IRBuilder, ctx: FunctionContext) -> None:
+    llvm_builder.branch(ctx.get_basic_block(instr.target))
+
+def __emit_COND_JUMP(instr: COND_JUMP, llvm_builder: ir.IRBuilder, ctx: FunctionContext) -> None:
+    condition = llvm_builder.icmp_unsigned("!=", ctx.pop_value_from_stack(), ir.Constant(LLVMTypeWord, 0))
+
+    # Phis need an incoming value per edge, so two edges to the same block are folded into one
+    if instr.true_target == instr.false_target:
+        llvm_builder.branch(ctx.get_basic_block(instr.true_target))
+    else:
+        llvm_builder.cbranch(condition, ctx.get_basic_block(instr.true_target), ctx.get_basic_block(instr.false_target))
 
 def __emit_CALL(instr: CALL, llvm_builder: ir.IRBuilder, ctx: FunctionContext) -> None:
-    target_func_def = ctx.global_ctx.get_function(instr.target)
-    call_value = llvm_builder.call(target_func_def.llvm_func, [ctx.pop_value_from_stack() for _ in range(target_func_def.num_params)])
-    
-    if target_func_def.returns_value:
+    call_value = build_Value(instr, llvm_builder, ctx.global_ctx, ctx.pop_operands(ctx.global_ctx.get_function(instr.target).num_params))
+
+    if call_value is not None:
         ctx.push_value_onto_stack(call_value)
 
 def __emit_RET(instr: RET, llvm_builder: ir.IRBuilder, ctx: FunctionContext) -> None:
-    if ctx.returns_value:
-        llvm_builder.ret(ctx.pop_value_from_stack())
+    value = ctx.pop_value_from_stack() if ctx.returns_value else None
+    last = llvm_builder.block.instructions[-1] if len(llvm_builder.block.instructions) != 0 else None
+
+    # A call whose result is returned straight away is marked for the code generator to turn into a jump
+    if isinstance(last, ir.CallInstr) and (last is value or (value is None and last.type == ir.VoidType())):
+        last.tail = True
+
+    if value is not None:
+        llvm_builder.ret(value)
     else:
         llvm_builder.ret_void()
 
 __TRANSLATORS : Dict[Any, Callable[..., None]] = {
-    OpCode.LOAD_CONST: __emit_LOAD_CONST,
-    OpCode.LOAD_FUNC_ADDR: __emit_LOAD_FUNC_ADDR,
+    OpCode.NOOP: __emit_NOOP,
+    OpCode.LOAD_LOCAL: __emit_LOAD_VARIABLE,
+    OpCode.LOAD_PARAM: __emit_LOAD_VARIABLE,
+    OpCode.STORE_LOCAL: __emit_STORE_VARIABLE,
+    OpCode.STORE_PARAM: __emit_STORE_VARIABLE,
+    OpCode.POP: __emit_POP,
+    OpCode.JUMP: __emit_JUMP,
+    OpCode.COND_JUMP: __emit_COND_JUMP,
     OpCode.CALL: __emit_CALL,
     OpCode.RET: __emit_RET,
 }
 
 def emit_Instruction(instr: Instruction, llvm_builder: ir.IRBuilder, ctx: FunctionContext) -> None:
-    if instr.opcode not in __TRANSLATORS:
-        raise NotImplementedError(instr.opcode)
+    if instr.opcode in __TRANSLATORS:
+        __TRANSLATORS[instr.opcode](instr, llvm_builder, ctx)
+        return
 
-    __TRANSLATORS[instr.opcode](instr, llvm_builder, ctx)
+    # Everything else computes a value from the operands on top of the stack
+    pops, _ = get_stack_effect(instr, {})
+    value = build_Value(instr, llvm_builder, ctx.global_ctx, ctx.pop_operands(pops))
+
+    if value is not None:
+        ctx.push_value_onto_stack(value)
 
 def emit_Function(function: Function, ctx: GlobalContext) -> None:
+    # The virtual stack, params and locals are tracked as SSA values through the blocks in reverse
+    # postorder, with phis where blocks join. Unreachable blocks are left out.
     llvm_func = ctx.get_function(function.name).llvm_func
+    func_ctx = FunctionContext(function, ctx)
+    cfg = get_CFG(function)
+    labels = cfg.reverse_postorder
+    blocks = dict(function.basic_blocks)
+
+    predecessors : Dict[str, List[Optional[str]]] = {label: [pred for pred in cfg.get_predecessors(label) if cfg.is_reachable(pred)] for label in labels}
+    llvm_blocks : Dict[Optional[str], ir.Block] = {}
+
+    # The function's start is a predecessor of the entry keyed by None. LLVM's entry block cannot have
+    # predecessors, so a loop back to the entry is entered through a prologue.
+    if len(predecessors[function.entry]) != 0:
+        llvm_blocks[None] = llvm_func.append_basic_block("")
+
+    predecessors[function.entry].append(None)
+
+    for label in labels:
+        llvm_blocks[label] = llvm_func.append_basic_block(label)
+        func_ctx.add_basic_block(label, llvm_blocks[label])
+
+    if None in llvm_blocks:
+        ir.IRBuilder(llvm_blocks[None]).branch(llvm_blocks[function.entry])
+
+    # Locals start out as zero. Params and locals that are never stored to keep their initial values
+    # throughout, so they never need phis.
+    initial_values = list(llvm_func.args) + [ir.Constant(LLVMTypeWord, 0)] * function.num_locals
+    assigned = {func_ctx.get_variable_idx(instr) for label in labels for instr in blocks[label] if isinstance(instr, (STORE_PARAM, STORE_LOCAL))}
+    exit_values : Dict[Optional[str], List[ir.Value]] = {None: initial_values}
+    incomplete_phis : List[Tuple[ir.PhiInstr, str, int]] = []
+
+    for label in labels:
+        llvm_builder = ir.IRBuilder(llvm_blocks[label])
+        preds = predecessors[label]
+
+        # Predecessors that have not been emitted yet are reached through back edges, and their values
+        # are filled in afterwards
+        emitted_preds = [pred for pred in preds if pred in exit_values]
+        values : List[ir.Value] = []
+
+        for idx in range(len(exit_values[emitted_preds[0]])):
+            incoming = [exit_values[pred][idx] for pred in emitted_preds]
+
+            if idx < func_ctx.num_variables and idx not in assigned:
+                values.append(initial_values[idx])
+            elif len(emitted_preds) == len(preds) and all(value is incoming[0] for value in incoming):
+                values.append(incoming[0])
+            else:
+                phi = llvm_builder.phi(LLVMTypeWord)
+                incomplete_phis.append((phi, label, idx))
+                values.append(phi)
+
+        func_ctx.enter_block(values)
+
+        for instr in blocks[label]:
+            emit_Instruction(instr, llvm_builder, func_ctx)
 
-    # Forward declare basic blocks
-    for label, _ in function.basic_blocks:
-        llvm_func.append_basic_block(label)
-
-    # Append instructions
-    func_ctx = FunctionContext(function.name, ctx)
+        exit_values[label] = func_ctx.exit_block()
 
-    for label, bb in function.basic_blocks:
-        llvm_builder = ir.IRBuilder(func_ctx.get_basic_block(label))
-
-        for instr in bb:
-            emit_Instruction(instr, llvm_builder, func_ctx)
+    for phi, label, idx in incomplete_phis:
+        for pred in predecessors[label]:
+            phi.add_incoming(exit_values[pred][idx], llvm_blocks[pred])
 
 def emit_Program(program: Program, setup_callback: Callable[[ir.Module], None]) -> ir.Module:
     llvm_module = ir.Module(name="")
     setup_callback(llvm_module)
 
     global_ctx = GlobalContext(llvm_module)
+    declare_Program(program, llvm_module)
 
-    # Forward declare functions
-    for function in program.functions:
-        llvm_func_type = ir.FunctionType(LLVMTypeWord if function.returns_value else ir.VoidType(), [LLVMTypeWord] * function.num_params)
-        ir.Function(llvm_module, llvm_func_type, function.name)
-
-    # Populate functions
     for function in program.functions:
         emit_Function(function, global_ctx)
 
     return llvm_module
+
+__INT_TYPES : Dict[DataType, Tuple[ir.IntType, bool]] = {
+    DataType.I8: (ir.IntType(8), True),
+    DataType.UI8: (ir.IntType(8), False),
+    DataType.I16: (ir.IntType(16), True),
+    DataType.UI16: (ir.IntType(16), False),
+    DataType.I32: (ir.IntType(32), True),
+    DataType.UI32: (ir.IntType(32), False),
+    DataType.I64: (ir.IntType(64), True),
+    DataType.UI64: (ir.IntType(64), False),
+}
+
+def __is_float(dt: DataType) -> bool:
+    return dt == DataType.F32 or dt == DataType.F64
+
+def __is_signed(dt: DataType) -> bool:
+    return __is_float(dt) or __INT_TYPES[dt][1]
+
+def __get_type(dt: DataType) -> ir.Type:
+    if dt == DataType.F32:
+        return ir.FloatType()
+    elif dt == DataType.F64:
+        return ir.DoubleType()
+
+    return __INT_TYPES[dt][0]
+
+def __from_word(word: ir.Value, dt: DataType, builder: ir.IRBuilder) -> ir.Value:
+    if dt == DataType.F32:
+        return builder.bitcast(builder.trunc(word, ir.IntType(32)), ir.FloatType())
+    elif dt == DataType.F64:
+        return builder.bitcast(word, ir.DoubleType())
+    elif __INT_TYPES[dt][0].width < 64:
+        return builder.trunc(word, __INT_TYPES[dt][0])
+
+    return word
+
+def __to_word(value: ir.Value, dt: DataType, builder: ir.IRBuilder) -> ir.Value:
+    if dt == DataType.F32:
+        return builder.zext(builder.bitcast(value, ir.IntType(32)), LLVMTypeWord)
+    elif dt == DataType.F64:
+        return builder.bitcast(value, LLVMTypeWord)
+    elif __INT_TYPES[dt][0].width < 64:
+        return builder.sext(value, LLVMTypeWord) if __INT_TYPES[dt][1] else builder.zext(value, LLVMTypeWord)
+
+    return value
+
+__ARITHMETIC_BUILDERS : Dict[OpCode, Tuple[str, str, str]] = {
+    OpCode.ADD: ("add", "add", "fadd"),
+    OpCode.SUB: ("sub", "sub", "fsub"),
+    OpCode.MUL: ("mul", "mul", "fmul"),
+    OpCode.DIV: ("sdiv", "udiv", "fdiv"),
+    OpCode.MOD: ("srem", "urem", "frem"),
+}
+
+__COMPARISON_OPERATORS : Dict[OpCode, str] = {
+    OpCode.EQ: "==",
+    OpCode.NEQ: "!=",
+    OpCode.GT: ">",
+    OpCode.LT: "<",
+    OpCode.GTEQ: ">=",
+    OpCode.LTEQ: "<=",
+}
+
+def __build_LOAD_CONST(instr: LOAD_CONST, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    return ir.Constant(LLVMTypeWord, instr.value.as_ui64())
+
+def __build_LOAD_FUNC_ADDR(instr: LOAD_FUNC_ADDR, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    return builder.ptrtoint(ctx.get_function(instr.func_name).llvm_func, LLVMTypeWord)
+
+def __build_LOAD_GLOBAL(instr: LOAD_GLOBAL, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    return builder.load(ctx.get_global(instr.name))
+
+def __build_STORE_GLOBAL(instr: STORE_GLOBAL, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    builder.store(operands[0], ctx.get_global(instr.name))
+    return None
+
+def __get_address(address: ir.Value, offset: i64, builder: ir.IRBuilder) -> ir.Value:
+    return builder.inttoptr(builder.add(address, ir.Constant(LLVMTypeWord, int(offset))), LLVMTypeWord.as_pointer())
+
+def __build_LOAD_MEM(instr: LOAD_MEM, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    return builder.load(__get_address(operands[0], instr.offset, builder))
+
+def __build_STORE_MEM(instr: STORE_MEM, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    value, address = operands
+    builder.store(value, __get_address(address, instr.offset, builder))
+    return None
+
+def __build_ARITHMETIC(instr: Union[ADD, SUB, MUL, DIV, MOD], builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    dt = instr.data_type
+    signed_op, unsigned_op, float_op = __ARITHMETIC_BUILDERS[instr.opcode]
+    op = float_op if __is_float(dt) else signed_op if __is_signed(dt) else unsigned_op
+    lhs, rhs = [__from_word(operand, dt, builder) for operand in operands]
+
+    return __to_word(getattr(builder, op)(lhs, rhs), dt, builder)
+
+def __build_COMPARISON(instr: Union[EQ, NEQ, GT, LT, GTEQ, LTEQ], builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    dt = instr.data_type
+    op = __COMPARISON_OPERATORS[instr.opcode]
+    lhs, rhs = [__from_word(operand, dt, builder) for operand in operands]
+
+    if __is_float(dt):
+        # NaNs compare unequal to everything, including themselves
+        result = builder.fcmp_unordered(op, lhs, rhs) if instr.opcode == OpCode.NEQ else builder.fcmp_ordered(op, lhs, rhs)
+    elif __is_signed(dt):
+        result = builder.icmp_signed(op, lhs, rhs)
+    else:
+        result = builder.icmp_unsigned(op, lhs, rhs)
+
+    return builder.zext(result, LLVMTypeWord)
+
+def __build_INC_DEC(instr: Union[INC, DEC], builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    dt = instr.data_type
+    value = __from_word(operands[0], dt, builder)
+    one = ir.Constant(__get_type(dt), 1.0 if __is_float(dt) else 1)
+
+    if instr.opcode == OpCode.INC:
+        result = builder.fadd(value, one) if __is_float(dt) else builder.add(value, one)
+    else:
+        result = builder.fsub(value, one) if __is_float(dt) else builder.sub(value, one)
+
+    return __to_word(result, dt, builder)
+
+def __build_NEG(instr: NEG, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    dt = instr.data_type
+    value = __from_word(operands[0], dt, builder)
+    result = builder.fsub(ir.Constant(__get_type(dt), -0.0), value) if __is_float(dt) else builder.neg(value)
+
+    return __to_word(result, dt, builder)
+
+def __build_OR(instr: OR, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    return builder.or_(*operands)
+
+def __build_AND(instr: AND, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    return builder.and_(*operands)
+
+def __build_XOR(instr: XOR, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    return builder.xor(*operands)
+
+def __build_NOT(instr: NOT, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    return builder.not_(operands[0])
+
+def __build_SHL(instr: SHL, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    return builder.shl(operands[0], ir.Constant(LLVMTypeWord, instr.amt))
+
+def __build_SHR(instr: SHR, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    return builder.lshr(operands[0], ir.Constant(LLVMTypeWord, instr.amt))
+
+def __build_CONVERT(instr: CONVERT, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    from_dt, to_dt = instr.from_dt, instr.to_dt
+    value = __from_word(operands[0], from_dt, builder)
+    to_type = __get_type(to_dt)
+
+    if __is_float(from_dt) and __is_float(to_dt):
+        if from_dt == to_dt:
+            result = value
+        else:
+            result = builder.fpext(value, to_type) if to_dt == DataType.F64 else builder.fptrunc(value, to_type)
+    elif __is_float(from_dt):
+        result = builder.fptosi(value, to_type) if __is_signed(to_dt) else builder.fptoui(value, to_type)
+    elif __is_float(to_dt):
+        result = builder.sitofp(value, to_type) if __is_signed(from_dt) else builder.uitofp(value, to_type)
+    elif to_type.width < value.type.width:
+        result = builder.trunc(value, to_type)
+    elif to_type.width > value.type.width:
+        result = builder.sext(value, to_type) if __is_signed(from_dt) else builder.zext(value, to_type)
+    else:
+        result = value
+
+    return __to_word(result, to_dt, builder)
+
+def __build_CALL(instr: CALL, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    target_func_def = ctx.get_function(instr.target)
+    call_value = builder.call(target_func_def.llvm_func, list(reversed(operands)))
+
+    return call_value if target_func_def.returns_value else None
+
+def __build_INDIRECT_CALL(instr: INDIRECT_CALL, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    func_type = ir.FunctionType(LLVMTypeWord if instr.returns_value else ir.VoidType(), [LLVMTypeWord] * instr.num_params)
+    func_ptr = builder.inttoptr(operands[-1], func_type.as_pointer())
+    call_value = builder.call(func_ptr, list(reversed(operands[:-1])))
+
+    return call_value if instr.returns_value else None
+
+__VALUE_BUILDERS : Dict[Any, Callable[..., Optional[ir.Value]]] = {
+    OpCode.LOAD_CONST: __build_LOAD_CONST,
+    OpCode.LOAD_FUNC_ADDR: __build_LOAD_FUNC_ADDR,
+    OpCode.LOAD_GLOBAL: __build_LOAD_GLOBAL,
+    OpCode.LOAD_MEM: __build_LOAD_MEM,
+    OpCode.STORE_GLOBAL: __build_STORE_GLOBAL,
+    OpCode.STORE_MEM: __build_STORE_MEM,
+    OpCode.ADD: __build_ARITHMETIC,
+    OpCode.SUB: __build_ARITHMETIC,
+    OpCode.MUL: __build_ARITHMETIC,
+    OpCode.DIV: __build_ARITHMETIC,
+    OpCode.MOD: __build_ARITHMETIC,
+    OpCode.INC: __build_INC_DEC,
+    OpCode.DEC: __build_INC_DEC,
+    OpCode.EQ: __build_COMPARISON,
+    OpCode.NEQ: __build_COMPARISON,
+    OpCode.GT: __build_COMPARISON,
+    OpCode.LT: __build_COMPARISON,
+    OpCode.GTEQ: __build_COMPARISON,
+    OpCode.LTEQ: __build_COMPARISON,
+    OpCode.NEG: __build_NEG,
+    OpCode.OR: __build_OR,
+    OpCode.AND: __build_AND,
+    OpCode.XOR: __build_XOR,
+    OpCode.NOT: __build_NOT,
+    OpCode.SHL: __build_SHL,
+    OpCode.SHR: __build_SHR,
+    OpCode.CONVERT: __build_CONVERT,
+    OpCode.CALL: __build_CALL,
+    OpCode.INDIRECT_CALL: __build_INDIRECT_CALL,
+}
+
+def build_Value(instr: Instruction, builder: ir.IRBuilder, ctx: GlobalContext, operands: List[ir.Value]) -> Optional[ir.Value]:
+    if instr.opcode not in __VALUE_BUILDERS:
+        raise NotImplementedError(instr.opcode)
+
+    return __VALUE_BUILDERS[instr.opcode](instr, builder, ctx, operands)
+
+def __is_TailCall(instr: Operation, next_instr: RegisterInstruction) -> bool:
+    if instr.opcode not in (OpCode.CALL, OpCode.INDIRECT_CALL) or not isinstance(next_instr, Operation) or next_instr.opcode != OpCode.RET:
+        return False
+
+    return next_instr.srcs == (() if instr.dest is None else (instr.dest,))
+
+def emit_RegisterFunction(function: RegisterFunction, ctx: GlobalContext) -> None:
+    llvm_func = ctx.get_function(function.name).llvm_func
+
+    # Registers live in allocas that LLVM's mem2reg pass promotes to SSA values
+    prologue = llvm_func.append_basic_block("")
+    llvm_blocks = {label: llvm_func.append_basic_block(label) for label, _ in function.basic_blocks}
+
+    llvm_builder = ir.IRBuilder(prologue)
+    registers = [llvm_builder.alloca(LLVMTypeWord) for _ in range(function.num_registers)]
+
+    for idx, arg in enumerate(llvm_func.args):
+        llvm_builder.store(arg, registers[idx])
+
+    llvm_builder.branch(llvm_blocks[function.entry])
+
+    for label, instrs in function.basic_blocks:
+        llvm_builder = ir.IRBuilder(llvm_blocks[label])
+
+        for idx, instr in enumerate(instrs):
+            if isinstance(instr, MOVE):
+                llvm_builder.store(llvm_builder.load(registers[instr.src]), registers[instr.dest])
+                continue
+
+            operands = [llvm_builder.load(registers[src]) for src in instr.srcs]
+
+            if isinstance(instr.instr, JUMP):
+                llvm_builder.branch(llvm_blocks[instr.instr.target])
+            elif isinstance(instr.instr, COND_JUMP):
+                condition = llvm_builder.icmp_unsigned("!=", operands[0], ir.Constant(LLVMTypeWord, 0))
+                llvm_builder.cbranch(condition, llvm_blocks[instr.instr.true_target], llvm_blocks[instr.instr.false_target])
+            elif isinstance(instr.instr, RET):
+                if function.returns_value:
+                    llvm_builder.ret(operands[0])
+                else:
+                    llvm_builder.ret_void()
+            else:
+                value = build_Value(instr.instr, llvm_builder, ctx, operands)
+
+                # A call whose result is returned straight away is marked for the code generator to turn
+                # into a jump. The call builders emit the call last, and returning its value directly
+                # rather than through a register keeps the jump possible in unoptimized code.
+                if idx + 1 < len(instrs) and __is_TailCall(instr, instrs[idx + 1]):
+                    llvm_builder.block.instructions[-1].tail = True
+
+                    if value is None:
+                        llvm_builder.ret_void()
+                    else:
+                        llvm_builder.ret(value)
+
+                    break
+
+                if instr.dest is not None:
+                    llvm_builder.store(value, registers[instr.dest])
+
+def __declare_Symbols(llvm_module: ir.Module, data: List[Tuple[str, bytes]], globals: Iterable[str], signatures: Dict[str, Signature], define: bool) -> None:
+    for label, bytes in data:
+        llvm_data = ir.GlobalVariable(llvm_module, ir.ArrayType(ir.IntType(8), len(bytes)), label)
+
+        if define:
+            llvm_data.initializer = ir.Constant(ir.ArrayType(ir.IntType(8), len(bytes)), bytearray(bytes))
+
+    for name in sorted(globals):
+        llvm_global = ir.GlobalVariable(llvm_module, LLVMTypeWord, name)
+
+        if define:
+            llvm_global.initializer = ir.Constant(LLVMTypeWord, 0)
+
+    declared = {func.name for func in llvm_module.functions}
+
+    for name, signature in signatures.items():
+        if name not in declared:
+            llvm_func_type = ir.FunctionType(LLVMTypeWord if signature.returns_value else ir.VoidType(), [LLVMTypeWord] * signature.num_params)
+            ir.Function(llvm_module, llvm_func_type, name)
+
+def declare_Program(program: Program, llvm_module: ir.Module) -> None:
+    signatures = {function.name: Signature(function.num_params, function.returns_value) for function in program.functions}
+    __declare_Symbols(llvm_module, [(label, bytes(data)) for label, data in program.data], program.globals, signatures, True)
+
+def __get_native_signatures(llvm_module: ir.Module) -> Dict[str, Signature]:
+    # Natives are the functions declared by the setup callback, apart from intrinsics it uses
+    return {func.name: Signature(len(func.args), func.return_value.type != ir.VoidType()) for func in llvm_module.functions if not func.name.startswith("llvm.")}
+
+def emit_RegisterProgram(program: Program, setup_callback: Callable[[ir.Module], None]) -> ir.Module:
+    llvm_module = ir.Module(name="")
+    setup_callback(llvm_module)
+
+    global_ctx = GlobalContext(llvm_module)
+    native_signatures = __get_native_signatures(llvm_module)
+
+    declare_Program(program, llvm_module)
+
+    for register_function in convert_Program(program, native_signatures).values():
+        emit_RegisterFunction(register_function, global_ctx)
+
+    return llvm_module
+
+def __emit_RegisterShard(shard: Tuple[List[Function], Dict[str, Signature], List[Tuple[str, bytes]], List[str]]) -> str:
+    functions, signatures, data, globals = shard
+
+    # Every symbol outside the shard is an external declaration that linking resolves
+    llvm_module = ir.Module(name="")
+    __declare_Symbols(llvm_module, data, globals, signatures, False)
+    global_ctx = GlobalContext(llvm_module)
+
+    for function in functions:
+        emit_RegisterFunction(convert_Function(function, signatures), global_ctx)
+
+    return str(llvm_module)
+
+def link_RegisterProgram(program: Program, setup_callback: Callable[[ir.Module], None], jobs: int = 1) -> llvm.ModuleRef:
+    initialize_llvm()
+
+    # The setup callback runs once here, so it does not need to be picklable
+    base_module = ir.Module(name="")
+    setup_callback(base_module)
+
+    signatures = get_signatures(program, __get_native_signatures(base_module))
+    data = [(label, bytes(data)) for label, data in program.data]
+    globals = sorted(program.globals)
+
+    __declare_Symbols(base_module, data, globals, {}, True)
+
+    shards = [(functions, signatures, data, globals) for functions in split_Shards(program.functions, jobs)]
+    llvm_module = llvm.parse_assembly(str(base_module))
+
+    # Linking in shard order keeps the result independent of which worker finishes first
+    for text in map_Shards(__emit_RegisterShard, shards, jobs):
+        llvm_module.link_in(llvm.parse_assembly(text))
+
+    llvm_module.verify()
+    return llvm_module
+
+def compile_Program(program: Program, setup_callback: Callable[[ir.Module], None], options: OptimizationOptions, target_machine: Optional[llvm.TargetMachine] = None) -> Tuple[llvm.ModuleRef, Optional[str]]:
+    return optimize_ir(emit_Program(program, setup_callback), options, target_machine)
+
+def compile_RegisterProgram(program: Program, setup_callback: Callable[[ir.Module], None], options: OptimizationOptions, target_machine: Optional[llvm.TargetMachine] = None, jobs: int = 1) -> Tuple[llvm.ModuleRef, Optional[str]]:
+    llvm_module = link_RegisterProgram(program, setup_callback, jobs)
+    return llvm_module, optimize(llvm_module, options, target_machine)
+
+def __compile_Object(llvm_module: llvm.ModuleRef, options: OptimizationOptions, preserved: Optional[Iterable[str]] = None) -> bytes:
+    # Position independent code suits the C toolchain's default of PIE executables as well as
+    # static ones. A module with preserved symbols is the whole program.
+    target_machine = llvm.Target.from_default_triple().create_target_machine(opt=options.opt_level, reloc="pic", codemodel="small")
+    llvm_module.triple = target_machine.triple
+    llvm_module.data_layout = str(target_machine.target_data)
+
+    llvm_module.verify()
+
+    if preserved is None:
+        optimize(llvm_module, options, target_machine)
+    else:
+        optimize_WholeProgram(llvm_module, preserved, options, target_machine)
+
+    return cast(bytes, target_machine.emit_object(llvm_module))
+
+def __emit_Shard(shard: Tuple[List[Function], Dict[str, Signature], List[Tuple[str, bytes]], List[str]]) -> str:
+    functions, signatures, data, globals = shard
+
+    llvm_module = ir.Module(name="")
+    __declare_Symbols(llvm_module, data, globals, signatures, False)
+    global_ctx = GlobalContext(llvm_module)
+
+    for function in functions:
+        emit_Function(function, global_ctx)
+
+    return str(llvm_module)
+
+def __compile_ObjectShard(args: Tuple[Tuple[List[Function], Dict[str, Signature], List[Tuple[str, bytes]], List[str]], OptimizationOptions]) -> bytes:
+    shard, options = args
+    initialize_llvm()
+
+    return __compile_Object(llvm.parse_assembly(__emit_Shard(shard)), options)
+
+def compile_Objects(program: Program, setup_callback: Callable[[ir.Module], None], options: OptimizationOptions, jobs: int = 1, whole_program: bool = False) -> List[bytes]:
+    # The setup callback's runtime together with the data and globals is the first object, followed by
+    # one for each shard of functions. Shards are compiled and optimized on their own, so calls between
+    # them are not inlined. For whole-program optimization the shards are instead linked into a single
+    # object, in which only the program's entry and the setup callback's functions stay visible.
+    initialize_llvm()
+
+    base_module = ir.Module(name="")
+    setup_callback(base_module)
+
+    native_signatures = __get_native_signatures(base_module)
+    signatures = get_signatures(program, native_signatures)
+    data = [(label, bytes(data)) for label, data in program.data]
+    globals = sorted(program.globals)
+
+    __declare_Symbols(base_module, data, globals, {}, True)
+    shards = [(functions, signatures, data, globals) for functions in split_Shards(program.functions, jobs)]
+
+    if whole_program:
+        llvm_modules = [llvm.parse_assembly(str(base_module))] + [llvm.parse_assembly(text) for text in map_Shards(__emit_Shard, shards, jobs)]
+        return [__compile_Object(link_Modules(llvm_modules), options, list(native_signatures) + [program.entry])]
+
+    return [__compile_Object(llvm.parse_assembly(str(base_module)), options)] + map_Shards(__compile_ObjectShard, [(shard, options) for shard in shards], jobs)
@@ -1,31 +1,171 @@
-from typing import Any, Callable, Dict, List, NamedTuple, Set
-from slate.slasm.function import Function
+from enum import Enum, auto
+from functools import lru_cache
+import io
+import re
+import struct
+from typing import Any, BinaryIO, Callable, Dict, List, NamedTuple, Optional, Set, TextIO, Tuple
+from slate.slasm.assembler import assemble_Source
+from slate.slasm.elf import write_ObjectFile
+from slate.slasm.function import BasicBlock, Function
 from slate.slasm.instruction import *
+from slate.slasm.layout import FrameLayout
+from slate.slasm.parallel import map_Shards, split_Shards
 from slate.slasm.program import Program
 from slate.slasm.slasm import VERSION, DataType, Word
+from slate.slasm.verifier import get_FrameInfo, verify_Program
+from slate.utilities import ui64
+
+class CallingConvention(Enum):
+    STACK = auto() # every argument on the machine stack, popped by the caller
+    SYSV = auto()  # the first six integer arguments in registers, as in the System V ABI
+
+# Integer argument registers of the System V ABI, in order
+ARGUMENT_REGISTERS = ("rdi", "rsi", "rdx", "rcx", "r8", "r9")
 
 class GlobalContext:
     FuncDef = NamedTuple('FuncDef', [('params', List[str]), ('locals', List[str]), ('returns_value', bool)])
 
     def __init__(self, func_defs: Dict[str, FuncDef]) -> None:
         self.__func_defs = func_defs
+        self.__layouts : Dict[str, FrameLayout] = {}
+        self.__signatures = {name: Signature(len(func_def.params), func_def.returns_value) for name, func_def in func_defs.items()}
+
+    def get_layout(self, name: str) -> FrameLayout:
+        if name not in self.__layouts:
+            func_def = self.get_function(name)
+            self.__layouts[name] = FrameLayout(func_def.params, func_def.locals)
+
+        return self.__layouts[name]
 
     def get_function(self, name: str) -> FuncDef:
         if name not in self.__func_defs:
             raise Exception(f"Global Context does not contain a function named {name}")
-        
-        return self.__func_defs[name] 
+
+        return self.__func_defs[name]
+
+    @property
+    def signatures(self) -> Dict[str, Signature]:
+        return self.__signatures
+
+class StackCache:
+    # Keeps the top entries of the slasm stack in registers, bottom first. With no registers every
+    # value goes through the machine stack, which is the plain push/pop translation.
+    REGISTERS = ("rax", "rbx")
+
+    def __init__(self, num_registers: int) -> None:
+        assert 0 <= num_registers <= len(StackCache.REGISTERS)
+        self.__capacity = num_registers
+        self.__cached : List[str] = []
+
+    def __get_free_register(self) -> str:
+        return next(reg for reg in StackCache.REGISTERS if reg not in self.__cached)
+
+    def allocate(self) -> Tuple[str, str]:
+        # Returns a register for a new top value, spilling the deepest cached value when full
+        if self.__capacity == 0:
+            return "rax", ""
+        elif len(self.__cached) == self.__capacity:
+            reg = self.__cached.pop(0)
+            return reg, f"push {reg}\n"
+
+        return self.__get_free_register(), ""
+
+    def commit(self, reg: str) -> str:
+        if self.__capacity == 0:
+            return f"push {reg}\n"
+
+        self.__cached.append(reg)
+        return ""
+
+    def push_operand(self, operand: str) -> str:
+        if self.__capacity == 0:
+            return f"push qword {operand}\n"
+
+        reg, string = self.allocate()
+        return string + f"mov {reg}, {operand}\n" + self.commit(reg)
+
+    def pop_register(self) -> Tuple[str, str]:
+        if len(self.__cached) != 0:
+            return self.__cached.pop(), ""
+
+        reg = "rax" if self.__capacity == 0 else self.__get_free_register()
+        return reg, f"pop {reg}\n"
+
+    def pop_into(self, operand: str) -> str:
+        if len(self.__cached) == 0:
+            return f"pop qword {operand}\n"
+
+        return f"mov {operand}, {self.__cached.pop()}\n"
+
+    def pop_into_register(self, reg: str) -> str:
+        if len(self.__cached) == 0:
+            return f"pop {reg}\n"
+
+        return f"mov {reg}, {self.__cached.pop()}\n"
+
+    def pop_operands(self) -> Tuple[str, str, str]:
+        # Returns the registers holding the left and right (top) operands, which are always rax and
+        # rbx in some order
+        if self.__capacity < 2:
+            return "rax", "rbx", self.flush() + "pop rbx\npop rax\n"
+        elif len(self.__cached) == 0:
+            return "rax", "rbx", "pop rbx\npop rax\n"
+
+        string = ""
+
+        if len(self.__cached) == 1:
+            reg = self.__get_free_register()
+            string += f"pop {reg}\n"
+            self.__cached.insert(0, reg)
+
+        lhs, rhs = self.__cached
+        self.__cached.clear()
+
+        return lhs, rhs, string
+
+    def discard(self) -> str:
+        if len(self.__cached) != 0:
+            self.__cached.pop()
+            return ""
+
+        return f"add rsp, {Word.SIZE()}\n"
+
+    def flush(self) -> str:
+        string = "".join(f"push {reg}\n" for reg in self.__cached)
+        self.__cached.clear()
+
+        return string
+
+    @property
+    def num_cached(self) -> int:
+        return len(self.__cached)
 
 class FunctionContext:
-    def __init__(self, func_name: str, global_ctx: GlobalContext) -> None:
+    def __init__(self, func_name: str, global_ctx: GlobalContext, cache_registers: int = 0, calling_convention: CallingConvention = CallingConvention.STACK) -> None:
         self.__func_name = func_name
         self.__global_ctx = global_ctx
+        self.__layout = global_ctx.get_layout(func_name)
+        self.__returns_value = global_ctx.get_function(func_name).returns_value
+        self.__stack = StackCache(cache_registers)
+        self.__calling_convention = calling_convention
+
+        # Params that arrive in registers are spilled below rbp, ahead of the locals
+        self.__num_spilled_params = min(self.__layout.num_params, len(ARGUMENT_REGISTERS)) if calling_convention == CallingConvention.SYSV else 0
+
+        # Number of slasm stack entries before the instruction being emitted, which is only tracked
+        # when calls need it to align the machine stack
+        self.depth = 0
+
+    def get_param_operand(self, name: str) -> str:
+        idx = self.__layout.get_param_slot(name)
+
+        if idx < self.__num_spilled_params:
+            return f"[rbp-{(idx + 1) * Word.SIZE()}]"
 
-    def get_param_idx(self, name: str) -> int:
-        return self.global_ctx.get_function(self.func_name).params.index(name)
+        return f"[rbp+{(idx - self.__num_spilled_params + 2) * Word.SIZE()}]"
 
-    def get_local_idx(self, name: str) -> int:
-        return self.global_ctx.get_function(self.func_name).locals.index(name)
+    def get_local_operand(self, name: str) -> str:
+        return f"[rbp-{(self.__num_spilled_params + self.__layout.get_local_slot(name) + 1) * Word.SIZE()}]"
 
     @property
     def func_name(self) -> str:
@@ -35,17 +175,82 @@ class FunctionContext:
     def global_ctx(self) -> GlobalContext:
         return self.__global_ctx
 
+    @property
+    def stack(self) -> StackCache:
+        return self.__stack
+
     @property
     def num_params(self) -> int:
-        return len(self.global_ctx.get_function(self.func_name).params)
+        return self.__layout.num_params
 
     @property
     def num_locals(self) -> int:
-        return len(self.global_ctx.get_function(self.func_name).locals)
+        return self.__layout.num_locals
+
+    @property
+    def num_spilled_params(self) -> int:
+        return self.__num_spilled_params
+
+    @property
+    def calling_convention(self) -> CallingConvention:
+        return self.__calling_convention
 
     @property
     def returns_value(self) -> bool:
-        return self.global_ctx.get_function(self.func_name).returns_value
+        return self.__returns_value
+
+__SUBREGISTERS : Dict[str, Dict[int, str]] = {
+    "rax": {8: "al", 16: "ax", 32: "eax", 64: "rax"},
+    "rbx": {8: "bl", 16: "bx", 32: "ebx", 64: "rbx"},
+    "rcx": {8: "cl", 16: "cx", 32: "ecx", 64: "rcx"},
+    "rdx": {8: "dl", 16: "dx", 32: "edx", 64: "rdx"},
+}
+
+__INT_FORMATS : Dict[DataType, Tuple[int, bool]] = {
+    DataType.I8: (8, True),
+    DataType.UI8: (8, False),
+    DataType.I16: (16, True),
+    DataType.UI16: (16, False),
+    DataType.I32: (32, True),
+    DataType.UI32: (32, False),
+    DataType.I64: (64, True),
+    DataType.UI64: (64, False),
+}
+
+def __is_float(dt: DataType) -> bool:
+    return dt == DataType.F32 or dt == DataType.F64
+
+def __extend(reg: str, dt: DataType) -> str:
+    # Words hold narrow integers sign or zero extended to 64 bits, as they are in the VM
+    if dt not in __INT_FORMATS:
+        return ""
+
+    bits, signed = __INT_FORMATS[dt]
+    subregs = __SUBREGISTERS[reg]
+
+    if bits == 64:
+        return ""
+    elif bits == 32:
+        return f"movsxd {reg}, {subregs[32]}\n" if signed else f"mov {subregs[32]}, {subregs[32]}\n"
+    elif signed:
+        return f"movsx {reg}, {subregs[bits]}\n"
+
+    return f"movzx {subregs[32]}, {subregs[bits]}\n"
+
+def __to_xmm(xmm: str, reg: str, dt: DataType) -> str:
+    return f"movd {xmm}, {__SUBREGISTERS[reg][32]}\n" if dt == DataType.F32 else f"movq {xmm}, {reg}\n"
+
+def __from_xmm(reg: str, xmm: str, dt: DataType) -> str:
+    return f"movd {__SUBREGISTERS[reg][32]}, {xmm}\n" if dt == DataType.F32 else f"movq {reg}, {xmm}\n"
+
+def __float_suffix(dt: DataType) -> str:
+    return "ss" if dt == DataType.F32 else "sd"
+
+def __float_one(dt: DataType) -> str:
+    if dt == DataType.F32:
+        return "0x" + struct.pack('>f', 1.0).hex()
+
+    return "0x" + struct.pack('>d', 1.0).hex()
 
 def __emit_NOOP(instr: NOOP, ctx: FunctionContext) -> str:
     return "; NOOP\n" \
@@ -53,288 +258,326 @@ def __emit_NOOP(instr: NOOP, ctx: FunctionContext) -> str:
 
 def __emit_LOAD_CONST(instr: LOAD_CONST, ctx: FunctionContext) -> str:
     value_hex = instr.value.as_hex()
-    
-    return f"; LOAD_CONST {value_hex}\n" \
-           f"mov rax, {value_hex}\n" \
-            "push rax"
+    reg, string = ctx.stack.allocate()
+
+    return f"; LOAD_CONST {value_hex}\n" + string + \
+           f"mov {reg}, {value_hex}\n" + ctx.stack.commit(reg)
 
 def __emit_LOAD_FUNC_ADDR(instr: LOAD_FUNC_ADDR, ctx: FunctionContext) -> str:
-    return f"; LOAD_FUNC_ADDR {instr.func_name}\n" \
-           f"lea rax, [{instr.func_name} wrt ..gotpcrel]\n" \
-            "push rax"
+    reg, string = ctx.stack.allocate()
+
+    return f"; LOAD_FUNC_ADDR {instr.func_name}\n" + string + \
+           f"lea {reg}, [rel {instr.func_name}]\n" + ctx.stack.commit(reg)
+
+def __get_memory_operand(instr: Union[LOAD_LOCAL, LOAD_PARAM, LOAD_GLOBAL], ctx: FunctionContext) -> str:
+    if isinstance(instr, LOAD_LOCAL):
+        return ctx.get_local_operand(instr.name)
+    elif isinstance(instr, LOAD_PARAM):
+        return ctx.get_param_operand(instr.name)
+
+    return f"[rel {instr.name}]"
 
 def __emit_LOAD_LOCAL(instr: LOAD_LOCAL, ctx: FunctionContext) -> str:
-    return f"; LOAD_LOCAL {instr.name}\n" \
-           f"push qword [rbp-{(ctx.get_local_idx(instr.name) + 1) * Word.SIZE()}]"
+    return f"; LOAD_LOCAL {instr.name}\n" + \
+           ctx.stack.push_operand(__get_memory_operand(instr, ctx))
 
 def __emit_LOAD_PARAM(instr: LOAD_PARAM, ctx: FunctionContext) -> str:
-    return f"; LOAD_PARAM {instr.name}\n" \
-           f"push qword [rbp+{(ctx.get_param_idx(instr.name) + 2) * Word.SIZE()}]"
+    return f"; LOAD_PARAM {instr.name}\n" + \
+           ctx.stack.push_operand(__get_memory_operand(instr, ctx))
 
 def __emit_LOAD_GLOBAL(instr: LOAD_GLOBAL, ctx: FunctionContext) -> str:
-    return f"; LOAD_GLOBAL {instr.name}\n" \
-           f"push qword [rel {instr.name}]"
+    return f"; LOAD_GLOBAL {instr.name}\n" + \
+           ctx.stack.push_operand(__get_memory_operand(instr, ctx))
 
 def __emit_LOAD_MEM(instr: LOAD_MEM, ctx: FunctionContext) -> str:
     sign = "-" if instr.offset < 0 else "+"
-    
-    return f"; LOAD_MEM {instr.offset}\n" \
-            "pop rax\n" \
-           f"push qword [rax{sign}{abs(instr.offset)}]"
-    
+    reg, string = ctx.stack.pop_register()
+
+    return f"; LOAD_MEM {instr.offset}\n" + string + \
+           f"mov {reg}, [{reg}{sign}{abs(instr.offset)}]\n" + ctx.stack.commit(reg)
+
 def __emit_STORE_LOCAL(instr: STORE_LOCAL, ctx: FunctionContext) -> str:
-    return f"; STORE_LOCAL {instr.name}\n" \
-           f"pop qword [rbp-{(ctx.get_local_idx(instr.name) + 1) * Word.SIZE()}]"
+    return f"; STORE_LOCAL {instr.name}\n" + \
+           ctx.stack.pop_into(ctx.get_local_operand(instr.name))
 
 def __emit_STORE_PARAM(instr: STORE_PARAM, ctx: FunctionContext) -> str:
-    return f"; STORE_PARAM {instr.name}\n" \
-           f"pop qword [rbp+{(ctx.get_param_idx(instr.name) + 2) * Word.SIZE()}]"
+    return f"; STORE_PARAM {instr.name}\n" + \
+           ctx.stack.pop_into(ctx.get_param_operand(instr.name))
 
 def __emit_STORE_GLOBAL(instr: STORE_GLOBAL, ctx: FunctionContext) -> str:
-    return f"; STORE_GLOBAL {instr.name}\n" \
-           f"pop qword [rel {instr.name}]"
+    return f"; STORE_GLOBAL {instr.name}\n" + \
+           ctx.stack.pop_into(f"[rel {instr.name}]")
 
 def __emit_STORE_MEM(instr: STORE_MEM, ctx: FunctionContext) -> str:
     sign = "-" if instr.offset < 0 else "+"
-    
-    return f"; STORE_MEM {instr.offset}\n" \
-            "pop rax\n" \
-           f"pop qword [rax{sign}{abs(instr.offset)}]"
+    addr_reg, string = ctx.stack.pop_register()
+
+    return f"; STORE_MEM {instr.offset}\n" + string + \
+           ctx.stack.pop_into(f"[{addr_reg}{sign}{abs(instr.offset)}]")
 
 def __emit_POP(instr: POP, ctx: FunctionContext) -> str:
-    return  "; POP\n" \
-           f"add rsp, {Word.SIZE()}"
+    return "; POP\n" + ctx.stack.discard()
 
-def __emit_ADD(instr: ADD, ctx: FunctionContext) -> str:
-    dt = instr.data_type
-    string = f"; ADD {dt.name}\n" \
-              "pop rbx\n" \
-              "pop rax\n"
-                
-    if dt == DataType.I8 or dt == DataType.UI8:
-        string += "add al, bl\n"
-    elif dt == DataType.I16 or dt == DataType.UI16:
-        string += "add ax, bx\n"
-    elif dt == DataType.I32 or dt == DataType.UI32:
-        string += "add eax, ebx\n"
-    elif dt == DataType.I64 or dt == DataType.UI64:
-        string += "add rax, rbx\n"
-    elif dt == DataType.F32:
-        string += "movq xmm0, rax\n" \
-                  "movq xmm1, rbx\n" \
-                  "addss xmm0, xmm1\n" \
-                  "movq rax, xmm0\n"
-    elif dt == DataType.F64:
-        string += "movq xmm0, rax\n" \
-                  "movq xmm1, rbx\n" \
-                  "addsd xmm0, xmm1\n" \
-                  "movq rax, xmm0\n"
-    else:
-        raise NotImplementedError(dt)
+__INT_ARITHMETIC : Dict[OpCode, str] = {
+    OpCode.ADD: "add",
+    OpCode.SUB: "sub",
+    OpCode.MUL: "imul",
+}
 
-    string += "push rax"
-    return string
+__FLOAT_ARITHMETIC : Dict[OpCode, str] = {
+    OpCode.ADD: "add",
+    OpCode.SUB: "sub",
+    OpCode.MUL: "mul",
+    OpCode.DIV: "div",
+}
 
-def __emit_SUB(instr: SUB, ctx: FunctionContext) -> str:
+def __emit_ARITHMETIC(instr: Union[ADD, SUB, MUL, DIV, MOD], ctx: FunctionContext) -> str:
     dt = instr.data_type
-    string = f"; SUB {dt.name}\n" \
-              "pop rbx\n" \
-              "pop rax\n"
-                
-    if dt == DataType.I8 or dt == DataType.UI8:
-        string += "sub al, bl\n"
-    elif dt == DataType.I16 or dt == DataType.UI16:
-        string += "sub ax, bx\n"
-    elif dt == DataType.I32 or dt == DataType.UI32:
-        string += "sub eax, ebx\n"
-    elif dt == DataType.I64 or dt == DataType.UI64:
-        string += "sub rax, rbx\n"
-    elif dt == DataType.F32:
-        string += "movq xmm0, rax\n" \
-                  "movq xmm1, rbx\n" \
-                  "subss xmm0, xmm1\n" \
-                  "movq rax, xmm0\n"
-    elif dt == DataType.F64:
-        string += "movq xmm0, rax\n" \
-                  "movq xmm1, rbx\n" \
-                  "subsd xmm0, xmm1\n" \
-                  "movq rax, xmm0\n"
+    lhs, rhs, string = ctx.stack.pop_operands()
+    string = f"; {instr.opcode.name} {dt.name}\n" + string
+
+    if __is_float(dt):
+        suffix = __float_suffix(dt)
+        string += __to_xmm("xmm0", lhs, dt) + __to_xmm("xmm1", rhs, dt)
+
+        if instr.opcode == OpCode.MOD:
+            # x - trunc(x / y) * y, which matches fmod for representable quotients
+            string += f"movap{suffix[1]} xmm2, xmm0\n" \
+                      f"div{suffix} xmm2, xmm1\n" \
+                      f"round{suffix} xmm2, xmm2, 3\n" \
+                      f"mul{suffix} xmm2, xmm1\n" \
+                      f"sub{suffix} xmm0, xmm2\n"
+        else:
+            string += f"{__FLOAT_ARITHMETIC[instr.opcode]}{suffix} xmm0, xmm1\n"
+
+        string += __from_xmm(lhs, "xmm0", dt)
+    elif instr.opcode in __INT_ARITHMETIC:
+        # The low bits of a 64-bit add, sub or mul are those of the narrow operation
+        string += f"{__INT_ARITHMETIC[instr.opcode]} {lhs}, {rhs}\n" + __extend(lhs, dt)
     else:
-        raise NotImplementedError(dt)
+        _, signed = __INT_FORMATS[dt]
 
-    string += "push rax"
-    return string
+        # Division needs its dividend in rax
+        if lhs != "rax":
+            string += "xchg rax, rbx\n"
+            lhs, rhs = rhs, lhs
+
+        string += __extend("rax", dt) + __extend("rbx", dt)
+        string += "cqo\nidiv rbx\n" if signed else "xor edx, edx\ndiv rbx\n"
+
+        if instr.opcode == OpCode.MOD:
+            string += "mov rax, rdx\n"
+
+        string += __extend("rax", dt)
+
+    return string + ctx.stack.commit(lhs)
 
-def __emit_MUL(instr: MUL, ctx: FunctionContext) -> str:
+__FUSABLE_LOADS = (OpCode.LOAD_CONST, OpCode.LOAD_LOCAL, OpCode.LOAD_PARAM, OpCode.LOAD_GLOBAL)
+
+__INT_CONDITIONS : Dict[OpCode, Tuple[str, str]] = {
+    # (signed, unsigned)
+    OpCode.EQ: ("e", "e"),
+    OpCode.NEQ: ("ne", "ne"),
+    OpCode.GT: ("g", "a"),
+    OpCode.LT: ("l", "b"),
+    OpCode.GTEQ: ("ge", "ae"),
+    OpCode.LTEQ: ("le", "be"),
+}
+
+def __emit_COMPARISON(instr: Union[EQ, NEQ, GT, LT, GTEQ, LTEQ], ctx: FunctionContext) -> str:
     dt = instr.data_type
-    string = f"; MUL {dt.name}\n" \
-              "pop rbx\n" \
-              "pop rax\n"
-                
-    if dt == DataType.I8 or dt == DataType.UI8:
-        string += "imul al, bl\n"
-    elif dt == DataType.I16 or dt == DataType.UI16:
-        string += "imul ax, bx\n"
-    elif dt == DataType.I32 or dt == DataType.UI32:
-        string += "imul eax, ebx\n"
-    elif dt == DataType.I64 or dt == DataType.UI64:
-        string += "imul rax, rbx\n"
-    elif dt == DataType.F32:
-        string += "movq xmm0, rax\n" \
-                  "movq xmm1, rbx\n" \
-                  "mulss xmm0, xmm1\n" \
-                  "movq rax, xmm0\n"
-    elif dt == DataType.F64:
-        string += "movq xmm0, rax\n" \
-                  "movq xmm1, rbx\n" \
-                  "mulsd xmm0, xmm1\n" \
-                  "movq rax, xmm0\n"
+    opcode = instr.opcode
+    lhs, rhs, string = ctx.stack.pop_operands()
+    string = f"; {opcode.name} {dt.name}\n" + string
+    result = __SUBREGISTERS[lhs]
+
+    if __is_float(dt):
+        suffix = __float_suffix(dt)
+        string += __to_xmm("xmm0", lhs, dt) + __to_xmm("xmm1", rhs, dt)
+
+        # Unordered comparisons set ZF, PF and CF, so only 'above' conditions are false for NaNs
+        if opcode == OpCode.LT or opcode == OpCode.LTEQ:
+            string += f"ucomi{suffix} xmm1, xmm0\n"
+        else:
+            string += f"ucomi{suffix} xmm0, xmm1\n"
+
+        if opcode == OpCode.EQ:
+            string += f"sete {result[8]}\nsetnp cl\nand {result[8]}, cl\n"
+        elif opcode == OpCode.NEQ:
+            string += f"setne {result[8]}\nsetp cl\nor {result[8]}, cl\n"
+        elif opcode == OpCode.GT or opcode == OpCode.LT:
+            string += f"seta {result[8]}\n"
+        else:
+            string += f"setae {result[8]}\n"
     else:
-        raise NotImplementedError(dt)
+        _, signed = __INT_FORMATS[dt]
+        signed_condition, unsigned_condition = __INT_CONDITIONS[opcode]
 
-    string += "push rax"
-    return string
+        string += __extend(lhs, dt) + __extend(rhs, dt) + \
+                  f"cmp {lhs}, {rhs}\n" + \
+                  f"set{signed_condition if signed else unsigned_condition} {result[8]}\n"
+
+    return string + f"movzx {result[32]}, {result[8]}\n" + ctx.stack.commit(lhs)
 
-def __emit_DIV(instr: DIV, ctx: FunctionContext) -> str:
+def __emit_UNARY(instr: Union[INC, DEC, NEG], ctx: FunctionContext) -> str:
     dt = instr.data_type
-    string = f"; DIV {dt.name}\n" \
-              "pop rbx\n" \
-              "pop rax\n" \
-                
-    if dt == DataType.I8:
-        string += "movsx eax, eax\n" \
-                  "movsx ecx, ebx\n" \
-                  "cdq\n" \
-                  "idiv ecx\n"
-    elif dt == DataType.UI8:
-        string += "mov rdx, 0\n" \
-                  "DIV bl\n"
-    elif dt == DataType.I16:
-        string += "movsx eax, eax\n" \
-                  "movsx ecx, ebx\n" \
-                  "cdq\n" \
-                  "idiv ecx\n"
-    elif dt == DataType.UI16:
-        string += "mov rdx, 0\n" \
-                  "div BX\n"
-    elif dt == DataType.I32:
-        string += "cdq\n" \
-                  "idiv ebx\n"
-    elif dt == DataType.UI32:
-        string += "mov rdx, 0\n" \
-                  "div ebx\n"
-    elif dt == DataType.I64:
-        string += "cqo\n" \
-                  "idiv rbx\n"
-    elif dt == DataType.UI64:
-        string += "mov rdx, 0\n" \
-                  "div rbx\n"
-    elif dt == DataType.F32:
-        string += "movq xmm0, rax\n" \
-                  "movq xmm1, rbx\n" \
-                  "divss xmm0, xmm1\n" \
-                  "movq rax, xmm0\n"
-    elif dt == DataType.F64:
-        string += "movq xmm0, rax\n" \
-                  "movq xmm1, rbx\n" \
-                  "divsd xmm0, xmm1\n" \
-                  "movq rax, xmm0\n"
+    reg, string = ctx.stack.pop_register()
+    string = f"; {instr.opcode.name} {dt.name}\n" + string
+
+    if __is_float(dt):
+        if instr.opcode == OpCode.NEG:
+            string += f"btc {reg}, {31 if dt == DataType.F32 else 63}\n"
+        else:
+            suffix = __float_suffix(dt)
+            op = "add" if instr.opcode == OpCode.INC else "sub"
+
+            string += __to_xmm("xmm0", reg, dt) + \
+                      f"mov rcx, {__float_one(dt)}\n" + \
+                      __to_xmm("xmm1", "rcx", dt) + \
+                      f"{op}{suffix} xmm0, xmm1\n" + \
+                      __from_xmm(reg, "xmm0", dt)
     else:
-        raise NotImplementedError()
+        op = {OpCode.INC: "inc", OpCode.DEC: "dec", OpCode.NEG: "neg"}[instr.opcode]
+        string += f"{op} {reg}\n" + __extend(reg, dt)
 
-    string += "push rax"
-    return string
+    return string + ctx.stack.commit(reg)
 
-def __emit_MOD(instr: MOD, ctx: FunctionContext) -> str:
-    dt = instr.data_type
-    string = f"; MOD {dt.name}\n" \
-              "pop rbx\n" \
-              "pop rax\n" \
-                
-    if dt == DataType.I8:
-        string += "movsx eax, eax\n" \
-                  "movsx ecx, ebx\n" \
-                  "cdq\n" \
-                  "idiv ecx\n" \
-                  "mov eax, edx"
-    elif dt == DataType.UI8:
-        string += "mov rdx, 0\n" \
-                  "div bl\n" \
-                  "mov al, bl"
-    elif dt == DataType.I16:
-        string += "movsx eax, eax\n" \
-                  "movsx ecx, ebx\n" \
-                  "cdq\n" \
-                  "idiv ecx\n" \
-                  "mov ax, dx"
-    elif dt == DataType.UI16:
-        string += "mov rdx, 0\n" \
-                  "div bx\n" \
-                  "mov ax, dx"
-    elif dt == DataType.I32:
-        string += "cdq\n" \
-                  "idiv ebx\n" \
-                  "mov eax, edx"
-    elif dt == DataType.UI32:
-        string += "mov rdx, 0\n" \
-                  "div ebx\n" \
-                  "mov eax, edx"
-    elif dt == DataType.I64:
-        string += "cqo\n" \
-                  "idiv rbx\n" \
-                  "mov rax, rdx"
-    elif dt == DataType.UI64:
-        string += "mov rdx, 0\n" \
-                  "div rbx\n" \
-                  "mov rax, rdx"
-    elif dt == DataType.F32:
-        string += "movq xmm0, rax\n" \
-                  "movq xmm1, rbx\n" \
-                  "movq xmm2, rax\n" \
-                  "divss xmm2, xmm1\n" \
-                  "cvttss2si rax, xmm2\n" \
-                  "cvtsi2ss xmm2, rax\n" \
-                  "mulss xmm2, xmm1\n" \
-                  "subss xmm0, xmm2\n" \
-                  "movq rax, xmm0\n"
-    elif dt == DataType.F64:
-        string += "movq xmm0, rax\n" \
-                  "movq xmm1, rbx\n" \
-                  "movq xmm2, rax\n" \
-                  "divsd xmm2, xmm1\n" \
-                  "cvttsd2si rax, xmm2\n" \
-                  "cvtsi2sd xmm2, rax\n" \
-                  "mulsd xmm2, xmm1\n" \
-                  "subsd xmm0, xmm2\n" \
-                  "movq rax, xmm0\n"
+def __emit_BITWISE(instr: Union[OR, AND, XOR], ctx: FunctionContext) -> str:
+    op = instr.opcode.name.lower()
+
+    lhs, rhs, string = ctx.stack.pop_operands()
+
+    return f"; {instr.opcode.name}\n" + string + \
+           f"{op} {lhs}, {rhs}\n" + ctx.stack.commit(lhs)
+
+def __emit_NOT(instr: NOT, ctx: FunctionContext) -> str:
+    reg, string = ctx.stack.pop_register()
+
+    return "; NOT\n" + string + f"not {reg}\n" + ctx.stack.commit(reg)
+
+def __emit_SHIFT(instr: Union[SHL, SHR], ctx: FunctionContext) -> str:
+    op = instr.opcode.name.lower()
+    reg, string = ctx.stack.pop_register()
+
+    return f"; {instr.opcode.name} {instr.amt}\n" + string + \
+           f"{op} {reg}, {instr.amt}\n" + ctx.stack.commit(reg)
+
+def __emit_CONVERT(instr: CONVERT, ctx: FunctionContext) -> str:
+    from_dt, to_dt = instr.from_dt, instr.to_dt
+    reg, string = ctx.stack.pop_register()
+    string = f"; CONVERT {from_dt.name} {to_dt.name}\n" + string
+
+    if __is_float(from_dt) and __is_float(to_dt):
+        if from_dt != to_dt:
+            string += __to_xmm("xmm0", reg, from_dt) + \
+                      f"cvt{__float_suffix(from_dt)}2{__float_suffix(to_dt)} xmm0, xmm0\n" + \
+                      __from_xmm(reg, "xmm0", to_dt)
+    elif __is_float(to_dt):
+        string += __extend(reg, from_dt) + \
+                  f"cvtsi2{__float_suffix(to_dt)} xmm0, {reg}\n" + \
+                  __from_xmm(reg, "xmm0", to_dt)
+    elif __is_float(from_dt):
+        string += __to_xmm("xmm0", reg, from_dt) + \
+                  f"cvtt{__float_suffix(from_dt)}2si {reg}, xmm0\n" + \
+                  __extend(reg, to_dt)
     else:
-        raise NotImplementedError(dt)
+        string += __extend(reg, from_dt) + __extend(reg, to_dt)
+
+    return string + ctx.stack.commit(reg)
+
+def __emit_JUMP(instr: JUMP, ctx: FunctionContext) -> str:
+    return f"; JUMP {instr.target}\n" + ctx.stack.flush() + \
+           f"jmp .{instr.target}"
+
+def __emit_COND_JUMP(instr: COND_JUMP, ctx: FunctionContext) -> str:
+    reg, string = ctx.stack.pop_register()
+
+    # Flushing only pushes the remaining cached registers, so the condition register survives
+    return f"; COND_JUMP {instr.true_target} {instr.false_target}\n" + string + \
+           ctx.stack.flush() + \
+           f"test {reg}, {reg}\n" \
+           f"jnz .{instr.true_target}\n" \
+           f"jmp .{instr.false_target}"
+
+def __emit_REGISTER_CALL(target: str, num_params: int, returns_value: bool, num_operands: int, ctx: FunctionContext) -> str:
+    # The first param is on top of the slasm stack, so arguments are popped in register order and
+    # any beyond the sixth stay on the machine stack with the seventh lowest, as the ABI lays them out
+    num_stack_args = max(0, num_params - len(ARGUMENT_REGISTERS))
+    string = "".join(ctx.stack.pop_into_register(reg) for reg in ARGUMENT_REGISTERS[:num_params]) + ctx.stack.flush()
+
+    # Every frame starts 16-byte aligned, so the words below rbp tell whether rsp is aligned at the call
+    num_words = ctx.num_spilled_params + ctx.num_locals + ctx.depth - num_operands + num_stack_args
+    padding = num_words % 2
+
+    if padding != 0:
+        string += "sub rsp, 8 ; align stack to 16 bytes\n"
+
+        for idx in range(num_stack_args):
+            string += f"mov r11, [rsp+{(idx + 1) * Word.SIZE()}]\n" \
+                      f"mov [rsp+{idx * Word.SIZE()}], r11\n"
+
+    string += f"call {target}\n"
+
+    if num_stack_args != 0:
+        string += f"add rsp, {(num_stack_args + padding) * Word.SIZE()} ; remove arguments from stack\n"
+    elif padding != 0:
+        string += "add rsp, 8 ; remove alignment padding\n"
+
+    if returns_value:
+        string += ctx.stack.commit("rax")
 
-    string += "push rax"
     return string
 
 def __emit_CALL(instr: CALL, ctx: FunctionContext) -> str:
-    string = f"; CALL\n" \
-             f"call {instr.target}\n"
-
     target_func_def = ctx.global_ctx.get_function(instr.target)
     target_func_param_count = len(target_func_def.params)
 
+    if ctx.calling_convention == CallingConvention.SYSV:
+        return f"; CALL {instr.target}\n" + __emit_REGISTER_CALL(instr.target, target_func_param_count, target_func_def.returns_value, target_func_param_count, ctx)
+
+    string = f"; CALL {instr.target}\n" + ctx.stack.flush() + \
+             f"call {instr.target}\n"
+
     if target_func_param_count != 0:
-        string += f"add rsp, {target_func_param_count * Word.SIZE()} ; remove arguments from stack"
-        
+        string += f"add rsp, {target_func_param_count * Word.SIZE()} ; remove arguments from stack\n"
+
     if target_func_def.returns_value:
-        string += "push rax ; push return value"
-    
+        string += ctx.stack.commit("rax")
+
+    return string
+
+def __emit_INDIRECT_CALL(instr: INDIRECT_CALL, ctx: FunctionContext) -> str:
+    if ctx.calling_convention == CallingConvention.SYSV:
+        # r10 is neither an argument register nor used by the stack cache
+        return f"; INDIRECT_CALL {instr.num_params} {instr.returns_value}\n" + ctx.stack.pop_into_register("r10") + \
+               __emit_REGISTER_CALL("r10", instr.num_params, instr.returns_value, instr.num_params + 1, ctx)
+
+    reg, string = ctx.stack.pop_register()
+    string = f"; INDIRECT_CALL {instr.num_params} {instr.returns_value}\n" + string + \
+             ctx.stack.flush() + \
+             f"call {reg}\n"
+
+    if instr.num_params != 0:
+        string += f"add rsp, {instr.num_params * Word.SIZE()} ; remove arguments from stack\n"
+
+    if instr.returns_value:
+        string += ctx.stack.commit("rax")
+
     return string
 
 def __emit_RET(instr: RET, ctx: FunctionContext) -> str:
     string = "; RET\n"
 
     if ctx.returns_value:
-        string += "pop rax\n"
-    
-    string += "ret"
+        reg, pop = ctx.stack.pop_register()
+        string += pop
+
+        if reg != "rax":
+            string += f"mov rax, {reg}\n"
+
+    string += "mov rsp, rbp\n" \
+              "pop rbp\n" \
+              "ret"
     return string
 
 __INSTRUCTION_TRANSLATORS : Dict[OpCode, Callable[..., str]] = {
@@ -350,51 +593,255 @@ __INSTRUCTION_TRANSLATORS : Dict[OpCode, Callable[..., str]] = {
     OpCode.STORE_GLOBAL: __emit_STORE_GLOBAL,
     OpCode.STORE_MEM: __emit_STORE_MEM,
     OpCode.POP: __emit_POP,
-    OpCode.ADD: __emit_ADD,
-    OpCode.SUB: __emit_SUB,
-    OpCode.MUL: __emit_MUL,
-    OpCode.DIV: __emit_DIV,
-    OpCode.MOD: __emit_MOD,
+    OpCode.ADD: __emit_ARITHMETIC,
+    OpCode.SUB: __emit_ARITHMETIC,
+    OpCode.MUL: __emit_ARITHMETIC,
+    OpCode.DIV: __emit_ARITHMETIC,
+    OpCode.MOD: __emit_ARITHMETIC,
+    OpCode.INC: __emit_UNARY,
+    OpCode.DEC: __emit_UNARY,
+    OpCode.EQ: __emit_COMPARISON,
+    OpCode.NEQ: __emit_COMPARISON,
+    OpCode.GT: __emit_COMPARISON,
+    OpCode.LT: __emit_COMPARISON,
+    OpCode.GTEQ: __emit_COMPARISON,
+    OpCode.LTEQ: __emit_COMPARISON,
+    OpCode.NEG: __emit_UNARY,
+    OpCode.OR: __emit_BITWISE,
+    OpCode.AND: __emit_BITWISE,
+    OpCode.XOR: __emit_BITWISE,
+    OpCode.NOT: __emit_NOT,
+    OpCode.SHL: __emit_SHIFT,
+    OpCode.SHR: __emit_SHIFT,
+    OpCode.CONVERT: __emit_CONVERT,
+    OpCode.JUMP: __emit_JUMP,
+    OpCode.COND_JUMP: __emit_COND_JUMP,
     OpCode.CALL: __emit_CALL,
+    OpCode.INDIRECT_CALL: __emit_INDIRECT_CALL,
     OpCode.RET: __emit_RET,
 }
 
+def __get_immediate(instr: LOAD_CONST, dt: Optional[DataType], exact: bool) -> Optional[str]:
+    # Instructions sign extend imm32 operands to 64 bits. Add, sub and mul only need the low bits of a
+    # narrow constant to be right, while comparisons need the constant extended the way the type is.
+    value = int(instr.value.as_i64())
+
+    if dt is not None and dt in __INT_FORMATS and __INT_FORMATS[dt][0] != 64:
+        bits, signed = __INT_FORMATS[dt]
+        value &= (1 << bits) - 1
+
+        if (signed or not exact) and value >= 1 << (bits - 1):
+            value -= 1 << bits
+
+    return str(value) if -2**31 <= value < 2**31 else None
+
+def __get_fused_operand(instr: Union[LOAD_CONST, LOAD_LOCAL, LOAD_PARAM, LOAD_GLOBAL], dt: Optional[DataType], exact: bool, ctx: FunctionContext) -> Optional[str]:
+    if isinstance(instr, LOAD_CONST):
+        return __get_immediate(instr, dt, exact)
+    elif exact and dt is not None and __INT_FORMATS[dt][0] != 64:
+        # A narrow value in memory cannot be extended in place
+        return None
+
+    return "qword " + __get_memory_operand(instr, ctx)
+
+def __describe_operand(instr: Union[LOAD_CONST, LOAD_LOCAL, LOAD_PARAM, LOAD_GLOBAL]) -> str:
+    return f"LOAD_CONST {instr.value.as_hex()}" if isinstance(instr, LOAD_CONST) else f"{instr.opcode.name} {instr.name}"
+
+def __emit_FUSED_ARITHMETIC(load: Union[LOAD_CONST, LOAD_LOCAL, LOAD_PARAM, LOAD_GLOBAL], instr: Union[ADD, SUB, MUL], ctx: FunctionContext) -> Optional[str]:
+    dt = instr.data_type
+
+    if __is_float(dt):
+        return None
+
+    operand = __get_fused_operand(load, dt, False, ctx)
+
+    if operand is None:
+        return None
+
+    reg, string = ctx.stack.pop_register()
+    string = f"; {__describe_operand(load)}\n; {instr.opcode.name} {dt.name}\n" + string
+
+    if isinstance(load, LOAD_CONST) and instr.opcode == OpCode.MUL:
+        string += f"imul {reg}, {reg}, {operand}\n"
+    else:
+        string += f"{__INT_ARITHMETIC[instr.opcode]} {reg}, {operand}\n"
+
+    return string + __extend(reg, dt) + ctx.stack.commit(reg)
+
+def __emit_FUSED_COMPARISON(load: Union[LOAD_CONST, LOAD_LOCAL, LOAD_PARAM, LOAD_GLOBAL], instr: Union[EQ, NEQ, GT, LT, GTEQ, LTEQ], ctx: FunctionContext) -> Optional[str]:
+    dt = instr.data_type
+
+    if __is_float(dt):
+        return None
+
+    operand = __get_fused_operand(load, dt, True, ctx)
+
+    if operand is None:
+        return None
+
+    _, signed = __INT_FORMATS[dt]
+    signed_condition, unsigned_condition = __INT_CONDITIONS[instr.opcode]
+    reg, string = ctx.stack.pop_register()
+    result = __SUBREGISTERS[reg]
+
+    return f"; {__describe_operand(load)}\n; {instr.opcode.name} {dt.name}\n" + string + \
+           __extend(reg, dt) + \
+           f"cmp {reg}, {operand}\n" \
+           f"set{signed_condition if signed else unsigned_condition} {result[8]}\n" \
+           f"movzx {result[32]}, {result[8]}\n" + ctx.stack.commit(reg)
+
+def __emit_FUSED_BITWISE(load: Union[LOAD_CONST, LOAD_LOCAL, LOAD_PARAM, LOAD_GLOBAL], instr: Union[OR, AND, XOR], ctx: FunctionContext) -> Optional[str]:
+    operand = __get_fused_operand(load, None, True, ctx)
+
+    if operand is None:
+        return None
+
+    reg, string = ctx.stack.pop_register()
+
+    return f"; {__describe_operand(load)}\n; {instr.opcode.name}\n" + string + \
+           f"{instr.opcode.name.lower()} {reg}, {operand}\n" + ctx.stack.commit(reg)
+
+def __emit_FOLDED_SHIFT(load: LOAD_CONST, instr: Union[SHL, SHR], ctx: FunctionContext) -> Optional[str]:
+    # Shifts already take an immediate amount, so a shifted constant is folded instead
+    value = load.value.as_ui64()
+    value = (value << instr.amt) & 0xFFFFFFFFFFFFFFFF if isinstance(instr, SHL) else value >> instr.amt
+
+    return __emit_LOAD_CONST(LOAD_CONST(Word.FromUI64(ui64(value))), ctx)
+
+def __emit_TAIL_CALL(instr: CALL, ret: RET, ctx: FunctionContext) -> Optional[str]:
+    # The callee reuses the caller's frame and returns straight to the caller's caller, which only
+    # works when the callee's stack arguments fit where the caller's were, and it leaves the value
+    # the caller would return
+    target_func_def = ctx.global_ctx.get_function(instr.target)
+    num_params = len(target_func_def.params)
+    num_register_params = len(ARGUMENT_REGISTERS) if ctx.calling_convention == CallingConvention.SYSV else 0
+
+    if ctx.returns_value and not target_func_def.returns_value:
+        return None
+    elif max(0, num_params - num_register_params) > max(0, ctx.num_params - num_register_params):
+        return None
+
+    string = f"; CALL {instr.target}\n; RET\n" + \
+             "".join(ctx.stack.pop_into_register(reg) for reg in ARGUMENT_REGISTERS[:min(num_params, num_register_params)])
+
+    for idx in range(max(0, num_params - num_register_params)):
+        string += ctx.stack.pop_into(f"[rbp+{(idx + 2) * Word.SIZE()}]")
+
+    return string + "mov rsp, rbp\n" \
+                    "pop rbp\n" \
+                   f"jmp {instr.target}"
+
+__FUSED_TRANSLATORS : Dict[Tuple[OpCode, OpCode], Callable[..., Optional[str]]] = {
+    **{(load, op): __emit_FUSED_ARITHMETIC for load in __FUSABLE_LOADS for op in (OpCode.ADD, OpCode.SUB, OpCode.MUL)},
+    **{(load, op): __emit_FUSED_COMPARISON for load in __FUSABLE_LOADS for op in __INT_CONDITIONS},
+    **{(load, op): __emit_FUSED_BITWISE for load in __FUSABLE_LOADS for op in (OpCode.OR, OpCode.AND, OpCode.XOR)},
+    (OpCode.LOAD_CONST, OpCode.SHL): __emit_FOLDED_SHIFT,
+    (OpCode.LOAD_CONST, OpCode.SHR): __emit_FOLDED_SHIFT,
+    (OpCode.CALL, OpCode.RET): __emit_TAIL_CALL,
+}
+
 def emit_Instruction(instr: Instruction, ctx: FunctionContext) -> str:
     if instr.opcode not in __INSTRUCTION_TRANSLATORS:
         raise NotImplementedError(instr.opcode)
 
-    return __INSTRUCTION_TRANSLATORS[instr.opcode](instr, ctx)
+    return __INSTRUCTION_TRANSLATORS[instr.opcode](instr, ctx).rstrip('\n')
 
-def emit_Function(function: Function, ctx: GlobalContext) -> str:
-    func_ctx = FunctionContext(function.name, ctx)
-    string = f"{function.name}:"
+def emit_BasicBlock(bb: BasicBlock, ctx: FunctionContext, fuse_operands: bool = False) -> List[str]:
+    instrs = list(bb)
+    nasm : List[str] = []
+    idx = 0
 
-    for label, bb in function.basic_blocks:
-        string += f"\n  .{label}:"
+    def advance(instr: Instruction) -> None:
+        if ctx.calling_convention == CallingConvention.SYSV and not isinstance(instr, RET):
+            pops, pushes = get_stack_effect(instr, ctx.global_ctx.signatures)
+            ctx.depth += pushes - pops
 
-        for instr in bb:
-            nasm = emit_Instruction(instr, func_ctx).replace('\n', '\n    ')
-            string += f"\n    {nasm}"
+    while idx < len(instrs):
+        # Prefer a single instruction with an immediate or memory operand over a load and an operation,
+        # and a jump over a call that is immediately returned from
+        if fuse_operands and idx + 1 < len(instrs) and (instrs[idx].opcode, instrs[idx + 1].opcode) in __FUSED_TRANSLATORS:
+            fused = __FUSED_TRANSLATORS[(instrs[idx].opcode, instrs[idx + 1].opcode)](instrs[idx], instrs[idx + 1], ctx)
 
-    return string
+            if fused is not None:
+                nasm.append(fused.rstrip('\n'))
+                advance(instrs[idx])
+                advance(instrs[idx + 1])
+                idx += 2
+                continue
+
+        nasm.append(emit_Instruction(instrs[idx], ctx))
+        advance(instrs[idx])
+        idx += 1
+
+    return nasm
+
+def write_Function(function: Function, ctx: GlobalContext, file: TextIO, cache_registers: int = 0, fuse_operands: bool = False, calling_convention: CallingConvention = CallingConvention.STACK) -> None:
+    func_ctx = FunctionContext(function.name, ctx, cache_registers, calling_convention)
+    file.write(f"{function.name}:\n"
+                "    push rbp\n"
+                "    mov rbp, rsp\n")
+
+    if func_ctx.num_spilled_params + func_ctx.num_locals != 0:
+        file.write(f"    sub rsp, {(func_ctx.num_spilled_params + func_ctx.num_locals) * Word.SIZE()}\n")
+
+    for idx, reg in enumerate(ARGUMENT_REGISTERS[:func_ctx.num_spilled_params]):
+        file.write(f"    mov [rbp-{(idx + 1) * Word.SIZE()}], {reg}\n")
+
+    entry_depths = get_FrameInfo(function, ctx.signatures).entry_depths if calling_convention == CallingConvention.SYSV else {}
+
+    # The prologue falls through into the entry block, which must therefore come first
+    labels = [function.entry] + [label for label, _ in function.basic_blocks if label != function.entry]
+
+    for label in labels:
+        file.write(f"  .{label}:\n")
+
+        # Every block is entered with the whole slasm stack in memory
+        assert func_ctx.stack.num_cached == 0
+        func_ctx.depth = entry_depths.get(label, 0)
 
-def emit_Program(program: Program, template: str, native_funcs: Dict[str, GlobalContext.FuncDef]) -> str:
-    string = template
+        for nasm in emit_BasicBlock(function.get_basic_block(label), func_ctx, fuse_operands):
+            file.write("    ")
+            file.write(nasm.replace('\n', '\n    '))
+            file.write("\n")
 
-    assert "#SLASM_VERSION#" in template
-    string = string.replace("#SLASM_VERSION#", VERSION())
+def emit_Function(function: Function, ctx: GlobalContext, cache_registers: int = 0, fuse_operands: bool = False, calling_convention: CallingConvention = CallingConvention.STACK) -> str:
+    buffer = io.StringIO()
+    write_Function(function, ctx, buffer, cache_registers, fuse_operands, calling_convention)
 
-    assert "#TARGET#" in template
-    string = string.replace("#TARGET#", program.target)
+    return buffer.getvalue().rstrip('\n')
 
-    assert "#DATA#" in template
-    string = string.replace("#DATA#", '\n'.join([f"{label}: db {', '.join([str(int(byte)) for byte in bytes])}" for label, bytes in program.data]))
+__PLACEHOLDER = re.compile(r"#([A-Z_]+)#")
 
-    assert "#GLOBALS#" in template
-    string = string.replace("#GLOBALS#", '\n'.join([f"{name}: resb {Word.SIZE()}" for name in program.globals]))
+@lru_cache(maxsize=None)
+def split_Template(template: str) -> Tuple[str, ...]:
+    # Alternating literal text and placeholder names, starting and ending with literal text
+    return tuple(__PLACEHOLDER.split(template))
 
-    assert "#ENTRY_FUNC_NAME#" in template
-    string = string.replace("#ENTRY_FUNC_NAME#", program.entry)
+def __write_data(program: Program, file: TextIO) -> None:
+    for idx, (label, bytes) in enumerate(program.data):
+        if idx != 0:
+            file.write("\n")
+
+        file.write(f"{label}: db {', '.join([str(int(byte)) for byte in bytes])}")
+
+def __write_globals(program: Program, file: TextIO) -> None:
+    file.write('\n'.join([f"{name}: resb {Word.SIZE()}" for name in sorted(program.globals)]))
+
+def __emit_Shard(shard: Tuple[List[Function], Dict[str, Tuple[List[str], List[str], bool]], int, bool, CallingConvention]) -> str:
+    functions, func_defs, cache_registers, fuse_operands, calling_convention = shard
+    global_ctx = GlobalContext({name: GlobalContext.FuncDef(*func_def) for name, func_def in func_defs.items()})
+    buffer = io.StringIO()
+
+    for idx, function in enumerate(functions):
+        if idx != 0:
+            buffer.write("\n")
+
+        write_Function(function, global_ctx, buffer, cache_registers, fuse_operands, calling_convention)
+
+    return buffer.getvalue()
+
+def write_Program(program: Program, template: str, native_funcs: Dict[str, GlobalContext.FuncDef], file: TextIO, cache_registers: int = 0, fuse_operands: bool = False, jobs: int = 1, calling_convention: CallingConvention = CallingConvention.STACK) -> None:
+    verify_Program(program, {name: Signature(len(func_def.params), func_def.returns_value) for name, func_def in native_funcs.items()})
 
     # Get function forward declarations
     func_defs = dict(native_funcs)
@@ -403,11 +850,63 @@ def emit_Program(program: Program, template: str, native_funcs: Dict[str, Global
         if function.name in func_defs:
             raise Exception(f"Function with name {function.name} is already declared as a native function!")
 
-        func_defs[function.name] = GlobalContext.FuncDef(list(function.params), list(function.locals), function.returns_value)
-        
-    global_ctx = GlobalContext(func_defs)
+        func_defs[function.name] = GlobalContext.FuncDef(function.layout.params, function.layout.locals, function.returns_value)
 
-    assert "#SLASM_FUNCS#" in template
-    string = string.replace("#SLASM_FUNCS#", '\n'.join([emit_Function(f, global_ctx) for f in program.functions]))
+    global_ctx = GlobalContext(func_defs)
 
-    return string
+    def write_functions() -> None:
+        if jobs > 1:
+            # Functions are translated independently once the global context is fixed, so shards of
+            # them are emitted in worker processes and written back in program order
+            plain_func_defs = {name: (func_def.params, func_def.locals, func_def.returns_value) for name, func_def in func_defs.items()}
+            shards = [(functions, plain_func_defs, cache_registers, fuse_operands, calling_convention) for functions in split_Shards(program.functions, jobs)]
+
+            for idx, text in enumerate(map_Shards(__emit_Shard, shards, jobs)):
+                if idx != 0:
+                    file.write("\n")
+
+                file.write(text)
+
+            return
+
+        for idx, function in enumerate(program.functions):
+            if idx != 0:
+                file.write("\n")
+
+            write_Function(function, global_ctx, file, cache_registers, fuse_operands, calling_convention)
+
+    writers : Dict[str, Callable[[], Any]] = {
+        "SLASM_VERSION": lambda: file.write(VERSION()),
+        "TARGET": lambda: file.write(program.target),
+        "DATA": lambda: __write_data(program, file),
+        "GLOBALS": lambda: __write_globals(program, file),
+        "ENTRY_FUNC_NAME": lambda: file.write(program.entry),
+        "SLASM_FUNCS": write_functions,
+        # Lets the template's natives take their arguments the way they are passed
+        "CALLING_CONVENTION": lambda: file.write(f"%define SLASM_CALLS_{calling_convention.name}"),
+    }
+
+    segments = split_Template(template)
+
+    for name in writers:
+        # Templates without the calling convention placeholder only support the stack convention
+        if name != "CALLING_CONVENTION" or calling_convention != CallingConvention.STACK:
+            assert name in segments[1::2], f"Template does not contain #{name}#"
+
+    for idx, segment in enumerate(segments):
+        if idx % 2 == 0:
+            file.write(segment)
+        elif segment in writers:
+            writers[segment]()
+        else:
+            file.write(f"#{segment}#")
+
+def emit_Program(program: Program, template: str, native_funcs: Dict[str, GlobalContext.FuncDef], cache_registers: int = 0, fuse_operands: bool = False, jobs: int = 1, calling_convention: CallingConvention = CallingConvention.STACK) -> str:
+    buffer = io.StringIO()
+    write_Program(program, template, native_funcs, buffer, cache_registers, fuse_operands, jobs, calling_convention)
+
+    return buffer.getvalue()
+
+def write_Object(program: Program, template: str, native_funcs: Dict[str, GlobalContext.FuncDef], file: BinaryIO, cache_registers: int = 0, fuse_operands: bool = False, jobs: int = 1, calling_convention: CallingConvention = CallingConvention.STACK) -> None:
+    # Assembles the program with the built-in assembler into an ELF64 object, the same one nasm -felf64 would produce
+    write_ObjectFile(assemble_Source(emit_Program(program, template, native_funcs, cache_registers, fuse_operands, jobs, calling_convention)), file)
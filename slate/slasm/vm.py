@@ -0,0 +1,1159 @@
+from enum import Enum, auto
+import math
+import operator
+import struct
+import sys
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, TextIO, Tuple, cast
+from slate.slasm.bytecode import BytecodeFunction, BytecodeReader, RawInstruction
+from slate.slasm.function import Function
+from slate.slasm.instruction import *
+from slate.slasm.program import Program
+from slate.slasm.register_form import MOVE, Operation, RegisterFunction, convert_Program
+from slate.slasm.slasm import DataType, Word
+from slate.slasm.verifier import VerificationError, verify_Program
+
+ExitCode = int
+
+Handler = Callable[[List[int], List[int], List[int], Any], None]
+Step = Callable[[List[int]], None]
+CompiledBlock = Callable[[List[int], List[int], List[int]], Any]
+
+WORD_MASK = 2**64 - 1
+
+DATA_BASE_ADDRESS = 0x10000
+FUNCTION_BASE_ADDRESS = 0x7F0000000000
+
+class ExecutionMode(Enum):
+    INTERPRET = auto()
+    COMPILE = auto()
+    REGISTER = auto()
+
+class VMError(Exception):
+    def __init__(self, msg: str) -> None:
+        super().__init__(msg)
+
+class _VMExit(Exception):
+    def __init__(self, exit_code: ExitCode) -> None:
+        super().__init__(exit_code)
+        self.exit_code = exit_code
+
+class NativeFunc(NamedTuple):
+    num_params : int
+    returns_value : bool
+    callback : Callable[['VirtualMachine', List[int]], Optional[int]]
+
+class Memory:
+    __WORD = struct.Struct('<Q')
+
+    def __init__(self, base_address: int, size: int) -> None:
+        self.__base_address = base_address
+        self.__bytes = bytearray(size)
+
+    def __check(self, address: int, size: int) -> int:
+        offset = address - self.__base_address
+
+        if offset < 0 or offset + size > len(self.__bytes):
+            raise VMError(f"Memory access of {size} bytes at {hex(address)} is out of bounds!")
+
+        return offset
+
+    def read_word(self, address: int) -> int:
+        return Memory.__WORD.unpack_from(self.__bytes, self.__check(address, Word.SIZE()))[0]
+
+    def write_word(self, address: int, value: int) -> None:
+        Memory.__WORD.pack_into(self.__bytes, self.__check(address, Word.SIZE()), value)
+
+    def read_bytes(self, address: int, size: int) -> bytes:
+        offset = self.__check(address, size)
+        return bytes(self.__bytes[offset:offset + size])
+
+    def write_bytes(self, address: int, data: bytes) -> None:
+        offset = self.__check(address, len(data))
+        self.__bytes[offset:offset + len(data)] = data
+
+    @property
+    def base_address(self) -> int:
+        return self.__base_address
+
+    @property
+    def size(self) -> int:
+        return len(self.__bytes)
+
+class PreparedBlock:
+    __slots__ = ('label', 'body', 'terminator', 'operand', 'code', 'steps')
+
+    def __init__(self, label: str) -> None:
+        self.label = label
+        self.body : List[Tuple[Handler, Any]] = []
+        self.terminator = OpCode.RET
+        self.operand : Any = None
+        self.code : Optional[CompiledBlock] = None
+        self.steps : List[Step] = []
+
+class PreparedFunction:
+    __slots__ = ('name', 'num_params', 'num_locals', 'returns_value', 'blocks', 'entry', 'num_registers', 'max_stack_height')
+
+    def __init__(self, function: Union[Function, BytecodeFunction]) -> None:
+        self.name = function.name
+        self.num_params = function.num_params
+        self.num_locals = function.num_locals
+        self.returns_value = function.returns_value
+        self.blocks = {label: PreparedBlock(label) for label, _ in function.basic_blocks}
+        self.entry = self.blocks[function.entry]
+        self.num_registers = 0
+        self.max_stack_height = 0
+
+# Word <-> value conversions for each data type
+__U32 = struct.Struct('<I')
+__U64 = struct.Struct('<Q')
+__F32 = struct.Struct('<f')
+__F64 = struct.Struct('<d')
+
+__INT_FORMATS : Dict[DataType, Tuple[int, bool]] = {
+    DataType.I8: (8, True),
+    DataType.UI8: (8, False),
+    DataType.I16: (16, True),
+    DataType.UI16: (16, False),
+    DataType.I32: (32, True),
+    DataType.UI32: (32, False),
+    DataType.I64: (64, True),
+    DataType.UI64: (64, False),
+}
+
+def __make_int_codec(bits: int, signed: bool) -> Tuple[Callable[[int], int], Callable[[int], int]]:
+    mask = (1 << bits) - 1
+    sign_bit = 1 << (bits - 1)
+    extension = WORD_MASK ^ mask
+
+    def decode(word: int) -> int:
+        value = word & mask
+        return value - (1 << bits) if signed and value & sign_bit else value
+
+    def encode(value: int) -> int:
+        value &= mask
+        return value | extension if signed and value & sign_bit else value
+
+    return decode, encode
+
+def __decode_F32(word: int) -> float:
+    return __F32.unpack(__U32.pack(word & 0xFFFFFFFF))[0]
+
+def __encode_F32(value: float) -> int:
+    try:
+        return __U32.unpack(__F32.pack(value))[0]
+    except OverflowError:
+        return __U32.unpack(__F32.pack(math.copysign(math.inf, value)))[0]
+
+def __decode_F64(word: int) -> float:
+    return __F64.unpack(__U64.pack(word))[0]
+
+def __encode_F64(value: float) -> int:
+    return __U64.unpack(__F64.pack(value))[0]
+
+def get_codec(dt: DataType) -> Tuple[Callable[[int], Any], Callable[[Any], int]]:
+    if dt == DataType.F32:
+        return __decode_F32, __encode_F32
+    elif dt == DataType.F64:
+        return __decode_F64, __encode_F64
+    elif dt in __INT_FORMATS:
+        return __make_int_codec(*__INT_FORMATS[dt])
+
+    raise NotImplementedError(dt)
+
+def is_float(dt: DataType) -> bool:
+    return dt == DataType.F32 or dt == DataType.F64
+
+# Arithmetic with the semantics of the target machine (truncating division, IEEE floats)
+def __int_div(a: int, b: int) -> int:
+    if b == 0:
+        raise VMError("Integer division by zero!")
+
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+def __int_mod(a: int, b: int) -> int:
+    return a - b * __int_div(a, b)
+
+def __float_div(a: float, b: float) -> float:
+    try:
+        return a / b
+    except ZeroDivisionError:
+        return math.nan if a == 0 or math.isnan(a) else math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+def __float_mod(a: float, b: float) -> float:
+    try:
+        return math.fmod(a, b)
+    except ValueError:
+        return math.nan
+
+__BINARY_OPERATORS : Dict[OpCode, Tuple[Callable[[Any, Any], Any], Callable[[Any, Any], Any]]] = {
+    OpCode.ADD: (operator.add, operator.add),
+    OpCode.SUB: (operator.sub, operator.sub),
+    OpCode.MUL: (operator.mul, operator.mul),
+    OpCode.DIV: (__int_div, __float_div),
+    OpCode.MOD: (__int_mod, __float_mod),
+}
+
+__COMPARISON_OPERATORS : Dict[OpCode, Callable[[Any, Any], bool]] = {
+    OpCode.EQ: operator.eq,
+    OpCode.NEQ: operator.ne,
+    OpCode.GT: operator.gt,
+    OpCode.LT: operator.lt,
+    OpCode.GTEQ: operator.ge,
+    OpCode.LTEQ: operator.le,
+}
+
+def get_binary_operator(opcode: OpCode, dt: DataType) -> Callable[[int, int], int]:
+    if opcode in __COMPARISON_OPERATORS:
+        compare = __COMPARISON_OPERATORS[opcode]
+        decode, _ = get_codec(dt)
+
+        if dt == DataType.UI64:
+            return lambda a, b: 1 if compare(a, b) else 0
+
+        return lambda a, b: 1 if compare(decode(a), decode(b)) else 0
+
+    int_op, float_op = __BINARY_OPERATORS[opcode]
+
+    # 64-bit integer add, sub and mul wrap identically for both signednesses
+    if (dt == DataType.I64 or dt == DataType.UI64) and opcode in (OpCode.ADD, OpCode.SUB, OpCode.MUL):
+        return lambda a, b: int_op(a, b) & WORD_MASK
+
+    decode, encode = get_codec(dt)
+    op = float_op if is_float(dt) else int_op
+
+    return lambda a, b: encode(op(decode(a), decode(b)))
+
+def get_unary_operator(opcode: OpCode, dt: DataType) -> Callable[[int], int]:
+    decode, encode = get_codec(dt)
+
+    if opcode == OpCode.INC:
+        return lambda a: encode(decode(a) + 1)
+    elif opcode == OpCode.DEC:
+        return lambda a: encode(decode(a) - 1)
+    elif opcode == OpCode.NEG:
+        return lambda a: encode(-decode(a))
+
+    raise NotImplementedError(opcode)
+
+def get_conversion(from_dt: DataType, to_dt: DataType) -> Callable[[int], int]:
+    decode, _ = get_codec(from_dt)
+    _, encode = get_codec(to_dt)
+
+    if is_float(to_dt):
+        return lambda a: encode(float(decode(a)))
+    elif is_float(from_dt):
+        def convert(a: int) -> int:
+            value = decode(a)
+            return 0 if math.isnan(value) or math.isinf(value) else encode(int(value))
+
+        return convert
+
+    return lambda a: encode(decode(a))
+
+# Instruction handlers; each receives the operand stack, the frame's locals and params, and a preresolved operand
+def __exec_NOOP(stack: List[int], locals: List[int], params: List[int], operand: Any) -> None:
+    pass
+
+def __exec_LOAD_CONST(stack: List[int], locals: List[int], params: List[int], operand: int) -> None:
+    stack.append(operand)
+
+def __exec_LOAD_LOCAL(stack: List[int], locals: List[int], params: List[int], operand: int) -> None:
+    stack.append(locals[operand])
+
+def __exec_LOAD_PARAM(stack: List[int], locals: List[int], params: List[int], operand: int) -> None:
+    stack.append(params[operand])
+
+def __exec_LOAD_GLOBAL(stack: List[int], locals: List[int], params: List[int], operand: Tuple[List[int], int]) -> None:
+    stack.append(operand[0][operand[1]])
+
+def __exec_LOAD_MEM(stack: List[int], locals: List[int], params: List[int], operand: Tuple[Memory, int]) -> None:
+    stack.append(operand[0].read_word(stack.pop() + operand[1]))
+
+def __exec_POP(stack: List[int], locals: List[int], params: List[int], operand: Any) -> None:
+    stack.pop()
+
+def __exec_STORE_LOCAL(stack: List[int], locals: List[int], params: List[int], operand: int) -> None:
+    locals[operand] = stack.pop()
+
+def __exec_STORE_PARAM(stack: List[int], locals: List[int], params: List[int], operand: int) -> None:
+    params[operand] = stack.pop()
+
+def __exec_STORE_GLOBAL(stack: List[int], locals: List[int], params: List[int], operand: Tuple[List[int], int]) -> None:
+    operand[0][operand[1]] = stack.pop()
+
+def __exec_STORE_MEM(stack: List[int], locals: List[int], params: List[int], operand: Tuple[Memory, int]) -> None:
+    address = stack.pop() + operand[1]
+    operand[0].write_word(address, stack.pop())
+
+def __exec_UNARY(stack: List[int], locals: List[int], params: List[int], operand: Callable[[int], int]) -> None:
+    stack.append(operand(stack.pop()))
+
+def __exec_BINARY(stack: List[int], locals: List[int], params: List[int], operand: Callable[[int, int], int]) -> None:
+    b = stack.pop()
+    stack.append(operand(stack.pop(), b))
+
+def __exec_CALL(stack: List[int], locals: List[int], params: List[int], operand: Tuple['VirtualMachine', PreparedFunction]) -> None:
+    vm, callee = operand
+    result = vm.execute(callee, [stack.pop() for _ in range(callee.num_params)])
+
+    if callee.returns_value:
+        stack.append(cast(int, result))
+
+def __exec_NATIVE_CALL(stack: List[int], locals: List[int], params: List[int], operand: Tuple['VirtualMachine', NativeFunc]) -> None:
+    vm, native = operand
+    result = native.callback(vm, [stack.pop() for _ in range(native.num_params)])
+
+    if native.returns_value:
+        stack.append(0 if result is None else result & WORD_MASK)
+
+def __exec_INDIRECT_CALL(stack: List[int], locals: List[int], params: List[int], operand: Tuple['VirtualMachine', int, bool]) -> None:
+    vm, num_params, returns_value = operand
+    callee = vm.get_function_at(stack.pop())
+
+    if callee.num_params != num_params or callee.returns_value != returns_value:
+        raise VMError(f"Indirect call does not match the signature of {callee.name if isinstance(callee, PreparedFunction) else 'native function'}!")
+
+    args = [stack.pop() for _ in range(num_params)]
+    result = vm.execute(callee, args) if isinstance(callee, PreparedFunction) else callee.callback(vm, args)
+
+    if returns_value:
+        stack.append(0 if result is None else result & WORD_MASK)
+
+class FunctionContext:
+    def __init__(self, function: Union[Function, BytecodeFunction], prepared: PreparedFunction, vm: 'VirtualMachine') -> None:
+        self.__prepared = prepared
+        self.__vm = vm
+        self.__layout = function.layout
+
+    def get_param_slot(self, name: str) -> int:
+        if not self.__layout.has_param(name):
+            raise VMError(f"Function '{self.__prepared.name}' does not contain a param named {name}")
+
+        return self.__layout.get_param_slot(name)
+
+    def get_local_slot(self, name: str) -> int:
+        if not self.__layout.has_local(name):
+            raise VMError(f"Function '{self.__prepared.name}' does not contain a local named {name}")
+
+        return self.__layout.get_local_slot(name)
+
+    def get_block(self, label: str) -> PreparedBlock:
+        if label not in self.__prepared.blocks:
+            raise VMError(f"Function '{self.__prepared.name}' does not contain a basic block labelled '{label}'")
+
+        return self.__prepared.blocks[label]
+
+    @property
+    def vm(self) -> 'VirtualMachine':
+        return self.__vm
+
+def __decode_NOOP(instr: NOOP, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_NOOP, None
+
+def __decode_LOAD_CONST(instr: LOAD_CONST, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_LOAD_CONST, instr.value.as_ui64()
+
+def __decode_LOAD_FUNC_ADDR(instr: LOAD_FUNC_ADDR, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_LOAD_CONST, ctx.vm.get_function_address(instr.func_name)
+
+def __decode_LOAD_LOCAL(instr: LOAD_LOCAL, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_LOAD_LOCAL, ctx.get_local_slot(instr.name)
+
+def __decode_LOAD_PARAM(instr: LOAD_PARAM, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_LOAD_PARAM, ctx.get_param_slot(instr.name)
+
+def __decode_LOAD_GLOBAL(instr: LOAD_GLOBAL, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_LOAD_GLOBAL, (ctx.vm.globals, ctx.vm.get_global_slot(instr.name))
+
+def __decode_LOAD_MEM(instr: LOAD_MEM, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_LOAD_MEM, (ctx.vm.memory, int(instr.offset))
+
+def __decode_POP(instr: POP, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_POP, None
+
+def __decode_STORE_LOCAL(instr: STORE_LOCAL, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_STORE_LOCAL, ctx.get_local_slot(instr.name)
+
+def __decode_STORE_PARAM(instr: STORE_PARAM, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_STORE_PARAM, ctx.get_param_slot(instr.name)
+
+def __decode_STORE_GLOBAL(instr: STORE_GLOBAL, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_STORE_GLOBAL, (ctx.vm.globals, ctx.vm.get_global_slot(instr.name))
+
+def __decode_STORE_MEM(instr: STORE_MEM, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_STORE_MEM, (ctx.vm.memory, int(instr.offset))
+
+def __decode_TYPED_BINARY(instr: Union[ADD, SUB, MUL, DIV, MOD, EQ, NEQ, GT, LT, GTEQ, LTEQ], ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_BINARY, get_binary_operator(instr.opcode, instr.data_type)
+
+def __decode_TYPED_UNARY(instr: Union[INC, DEC, NEG], ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_UNARY, get_unary_operator(instr.opcode, instr.data_type)
+
+def __decode_OR(instr: OR, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_BINARY, operator.or_
+
+def __decode_AND(instr: AND, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_BINARY, operator.and_
+
+def __decode_XOR(instr: XOR, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_BINARY, operator.xor
+
+def __decode_NOT(instr: NOT, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_UNARY, lambda a: a ^ WORD_MASK
+
+def __decode_SHL(instr: SHL, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    amt = instr.amt
+    return __exec_UNARY, lambda a: (a << amt) & WORD_MASK
+
+def __decode_SHR(instr: SHR, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    amt = instr.amt
+    return __exec_UNARY, lambda a: a >> amt
+
+def __decode_CONVERT(instr: CONVERT, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_UNARY, get_conversion(instr.from_dt, instr.to_dt)
+
+def __decode_CALL(instr: CALL, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    callee = ctx.vm.get_function(instr.target)
+
+    if isinstance(callee, PreparedFunction):
+        return __exec_CALL, (ctx.vm, callee)
+
+    return __exec_NATIVE_CALL, (ctx.vm, callee)
+
+def __decode_INDIRECT_CALL(instr: INDIRECT_CALL, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    return __exec_INDIRECT_CALL, (ctx.vm, int(instr.num_params), instr.returns_value)
+
+__DECODERS : Dict[OpCode, Callable[..., Tuple[Handler, Any]]] = {
+    OpCode.NOOP: __decode_NOOP,
+    OpCode.LOAD_CONST: __decode_LOAD_CONST,
+    OpCode.LOAD_LOCAL: __decode_LOAD_LOCAL,
+    OpCode.LOAD_PARAM: __decode_LOAD_PARAM,
+    OpCode.LOAD_GLOBAL: __decode_LOAD_GLOBAL,
+    OpCode.LOAD_MEM: __decode_LOAD_MEM,
+    OpCode.LOAD_FUNC_ADDR: __decode_LOAD_FUNC_ADDR,
+    OpCode.POP: __decode_POP,
+    OpCode.STORE_LOCAL: __decode_STORE_LOCAL,
+    OpCode.STORE_PARAM: __decode_STORE_PARAM,
+    OpCode.STORE_GLOBAL: __decode_STORE_GLOBAL,
+    OpCode.STORE_MEM: __decode_STORE_MEM,
+    OpCode.ADD: __decode_TYPED_BINARY,
+    OpCode.SUB: __decode_TYPED_BINARY,
+    OpCode.MUL: __decode_TYPED_BINARY,
+    OpCode.DIV: __decode_TYPED_BINARY,
+    OpCode.MOD: __decode_TYPED_BINARY,
+    OpCode.INC: __decode_TYPED_UNARY,
+    OpCode.DEC: __decode_TYPED_UNARY,
+    OpCode.EQ: __decode_TYPED_BINARY,
+    OpCode.NEQ: __decode_TYPED_BINARY,
+    OpCode.GT: __decode_TYPED_BINARY,
+    OpCode.LT: __decode_TYPED_BINARY,
+    OpCode.GTEQ: __decode_TYPED_BINARY,
+    OpCode.LTEQ: __decode_TYPED_BINARY,
+    OpCode.NEG: __decode_TYPED_UNARY,
+    OpCode.OR: __decode_OR,
+    OpCode.AND: __decode_AND,
+    OpCode.XOR: __decode_XOR,
+    OpCode.NOT: __decode_NOT,
+    OpCode.SHL: __decode_SHL,
+    OpCode.SHR: __decode_SHR,
+    OpCode.CONVERT: __decode_CONVERT,
+    OpCode.CALL: __decode_CALL,
+    OpCode.INDIRECT_CALL: __decode_INDIRECT_CALL,
+}
+
+def decode_Instruction(instr: Instruction, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    if instr.opcode not in __DECODERS:
+        raise NotImplementedError(instr.opcode)
+
+    return __DECODERS[instr.opcode](instr, ctx)
+
+def prepare_Function(function: Function, prepared: PreparedFunction, vm: 'VirtualMachine') -> None:
+    ctx = FunctionContext(function, prepared, vm)
+
+    for label, bb in function.basic_blocks:
+        block = ctx.get_block(label)
+
+        if not bb.is_terminated():
+            raise VMError(f"Basic block '{label}' in function '{function.name}' is not terminated!")
+
+        instructions = list(bb)
+
+        for instr in instructions[:-1]:
+            block.body.append(decode_Instruction(instr, ctx))
+
+        terminator = instructions[-1]
+        block.terminator = terminator.opcode
+
+        if isinstance(terminator, JUMP):
+            block.operand = ctx.get_block(terminator.target)
+        elif isinstance(terminator, COND_JUMP):
+            block.operand = (ctx.get_block(terminator.true_target), ctx.get_block(terminator.false_target))
+
+def decode_RawInstruction(raw: RawInstruction, reader: BytecodeReader, ctx: FunctionContext) -> Tuple[Handler, Any]:
+    opcode, a, _, x, _ = raw
+    op = OpCode(opcode)
+
+    # Bytecode operands are already indices, so most resolve without going through names
+    if op == OpCode.LOAD_CONST:
+        return __exec_LOAD_CONST, reader.get_const(x)
+    elif op == OpCode.LOAD_FUNC_ADDR:
+        return __exec_LOAD_CONST, ctx.vm.get_function_address(reader.get_string(x))
+    elif op == OpCode.LOAD_LOCAL:
+        return __exec_LOAD_LOCAL, x
+    elif op == OpCode.LOAD_PARAM:
+        return __exec_LOAD_PARAM, x
+    elif op == OpCode.STORE_LOCAL:
+        return __exec_STORE_LOCAL, x
+    elif op == OpCode.STORE_PARAM:
+        return __exec_STORE_PARAM, x
+    elif op == OpCode.LOAD_GLOBAL:
+        return __exec_LOAD_GLOBAL, (ctx.vm.globals, ctx.vm.get_global_slot(reader.get_string(x)))
+    elif op == OpCode.STORE_GLOBAL:
+        return __exec_STORE_GLOBAL, (ctx.vm.globals, ctx.vm.get_global_slot(reader.get_string(x)))
+    elif op == OpCode.LOAD_MEM:
+        return __exec_LOAD_MEM, (ctx.vm.memory, Word.FromUI64(ui64(reader.get_const(x))).as_i64())
+    elif op == OpCode.STORE_MEM:
+        return __exec_STORE_MEM, (ctx.vm.memory, Word.FromUI64(ui64(reader.get_const(x))).as_i64())
+    elif op in (OpCode.ADD, OpCode.SUB, OpCode.MUL, OpCode.DIV, OpCode.MOD, OpCode.EQ, OpCode.NEQ, OpCode.GT, OpCode.LT, OpCode.GTEQ, OpCode.LTEQ):
+        return __exec_BINARY, get_binary_operator(op, DataType(a))
+    elif op in (OpCode.INC, OpCode.DEC, OpCode.NEG):
+        return __exec_UNARY, get_unary_operator(op, DataType(a))
+    elif op == OpCode.CONVERT:
+        return __exec_UNARY, get_conversion(DataType(a), DataType(raw[2]))
+    elif op == OpCode.CALL:
+        return __decode_CALL(CALL(reader.get_string(x)), ctx)
+    elif op == OpCode.INDIRECT_CALL:
+        return __exec_INDIRECT_CALL, (ctx.vm, x, a != 0)
+    elif op == OpCode.SHL:
+        return __decode_SHL(SHL(cast(ShiftAmount, a)), ctx)
+    elif op == OpCode.SHR:
+        return __decode_SHR(SHR(cast(ShiftAmount, a)), ctx)
+    elif op in __DECODERS:
+        # The remaining opcodes carry no operands
+        return __DECODERS[op](None, ctx)
+
+    raise NotImplementedError(op)
+
+def prepare_BytecodeFunction(function: BytecodeFunction, reader: BytecodeReader, prepared: PreparedFunction, vm: 'VirtualMachine') -> None:
+    ctx = FunctionContext(function, prepared, vm)
+
+    for label, bb in function.basic_blocks:
+        block = ctx.get_block(label)
+
+        if not bb.is_terminated():
+            raise VMError(f"Basic block '{label}' in function '{function.name}' is not terminated!")
+
+        for raw in bb:
+            opcode = OpCode(raw[0])
+
+            if opcode == OpCode.JUMP:
+                block.operand = ctx.get_block(function.get_block_label(raw[3]))
+            elif opcode == OpCode.COND_JUMP:
+                block.operand = (ctx.get_block(function.get_block_label(raw[3])), ctx.get_block(function.get_block_label(raw[4])))
+            elif opcode != OpCode.RET:
+                block.body.append(decode_RawInstruction(raw, reader, ctx))
+                continue
+
+            block.terminator = opcode
+
+class BlockCompiler:
+    def __init__(self, namespace: Dict[str, Any]) -> None:
+        self.__namespace = namespace
+        self.__lines : List[str] = []
+        self.__stack : List[str] = [] # expressions of values that have not been pushed onto the real stack yet
+        self.__num_temps = 0
+
+    def bind(self, value: Any) -> str:
+        name = f"_k{len(self.__namespace)}"
+        self.__namespace[name] = value
+        return name
+
+    def emit(self, line: str) -> None:
+        self.__lines.append(line)
+
+    def push(self, expr: str) -> None:
+        name = f"t{self.__num_temps}"
+        self.__num_temps += 1
+
+        self.emit(f"{name} = {expr}")
+        self.__stack.append(name)
+
+    def push_const(self, value: int) -> None:
+        self.__stack.append(str(value))
+
+    def pop(self) -> str:
+        if len(self.__stack) != 0:
+            return self.__stack.pop()
+
+        name = f"t{self.__num_temps}"
+        self.__num_temps += 1
+
+        self.emit(f"{name} = stack.pop()")
+        return name
+
+    def flush(self) -> None:
+        if len(self.__stack) == 1:
+            self.emit(f"stack.append({self.__stack[0]})")
+        elif len(self.__stack) > 1:
+            self.emit(f"stack.extend(({', '.join(self.__stack)}))")
+
+        self.__stack.clear()
+
+    def get_source(self, name: str) -> str:
+        return f"def {name}(stack, locals, params):\n" + "".join(f"    {line}\n" for line in self.__lines)
+
+def __compile_FALLBACK(instr: Instruction, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    handler, operand = decode_Instruction(instr, ctx)
+
+    compiler.flush()
+    compiler.emit(f"{compiler.bind(handler)}(stack, locals, params, {compiler.bind(operand)})")
+
+def __compile_NOOP(instr: NOOP, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    pass
+
+def __compile_LOAD_CONST(instr: LOAD_CONST, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    compiler.push_const(instr.value.as_ui64())
+
+def __compile_LOAD_FUNC_ADDR(instr: LOAD_FUNC_ADDR, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    compiler.push_const(ctx.vm.get_function_address(instr.func_name))
+
+def __compile_LOAD_LOCAL(instr: LOAD_LOCAL, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    compiler.push(f"locals[{ctx.get_local_slot(instr.name)}]")
+
+def __compile_LOAD_PARAM(instr: LOAD_PARAM, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    compiler.push(f"params[{ctx.get_param_slot(instr.name)}]")
+
+def __compile_LOAD_GLOBAL(instr: LOAD_GLOBAL, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    compiler.push(f"{compiler.bind(ctx.vm.globals)}[{ctx.vm.get_global_slot(instr.name)}]")
+
+def __compile_LOAD_MEM(instr: LOAD_MEM, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    address = compiler.pop()
+    compiler.push(f"{compiler.bind(ctx.vm.memory.read_word)}({address} + {int(instr.offset)})")
+
+def __compile_POP(instr: POP, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    compiler.pop()
+
+def __compile_STORE_LOCAL(instr: STORE_LOCAL, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    value = compiler.pop()
+    compiler.emit(f"locals[{ctx.get_local_slot(instr.name)}] = {value}")
+
+def __compile_STORE_PARAM(instr: STORE_PARAM, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    value = compiler.pop()
+    compiler.emit(f"params[{ctx.get_param_slot(instr.name)}] = {value}")
+
+def __compile_STORE_GLOBAL(instr: STORE_GLOBAL, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    value = compiler.pop()
+    compiler.emit(f"{compiler.bind(ctx.vm.globals)}[{ctx.vm.get_global_slot(instr.name)}] = {value}")
+
+def __compile_STORE_MEM(instr: STORE_MEM, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    address = compiler.pop()
+    value = compiler.pop()
+    compiler.emit(f"{compiler.bind(ctx.vm.memory.write_word)}({address} + {int(instr.offset)}, {value})")
+
+__INLINE_WORD_OPERATORS : Dict[OpCode, str] = {
+    OpCode.ADD: "({a} + {b}) & " + hex(WORD_MASK),
+    OpCode.SUB: "({a} - {b}) & " + hex(WORD_MASK),
+    OpCode.MUL: "({a} * {b}) & " + hex(WORD_MASK),
+    OpCode.EQ: "1 if {a} == {b} else 0",
+    OpCode.NEQ: "1 if {a} != {b} else 0",
+    OpCode.GT: "1 if {a} > {b} else 0",
+    OpCode.LT: "1 if {a} < {b} else 0",
+    OpCode.GTEQ: "1 if {a} >= {b} else 0",
+    OpCode.LTEQ: "1 if {a} <= {b} else 0",
+    OpCode.INC: "({a} + 1) & " + hex(WORD_MASK),
+    OpCode.DEC: "({a} - 1) & " + hex(WORD_MASK),
+    OpCode.NEG: "-{a} & " + hex(WORD_MASK),
+}
+
+__COMPARISON_OPCODES = set([OpCode.GT, OpCode.LT, OpCode.GTEQ, OpCode.LTEQ])
+
+def __compile_TYPED_BINARY(instr: Union[ADD, SUB, MUL, DIV, MOD, EQ, NEQ, GT, LT, GTEQ, LTEQ], compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    b = compiler.pop()
+    a = compiler.pop()
+
+    if instr.data_type == DataType.UI64 and instr.opcode in __INLINE_WORD_OPERATORS:
+        compiler.push(__INLINE_WORD_OPERATORS[instr.opcode].format(a=a, b=b))
+    elif instr.data_type == DataType.I64 and instr.opcode in __COMPARISON_OPCODES:
+        # Flipping the sign bit maps signed order onto unsigned order
+        compiler.push(__INLINE_WORD_OPERATORS[instr.opcode].format(a=f"({a} ^ {hex(1 << 63)})", b=f"({b} ^ {hex(1 << 63)})"))
+    elif instr.data_type == DataType.I64 and instr.opcode in __INLINE_WORD_OPERATORS:
+        compiler.push(__INLINE_WORD_OPERATORS[instr.opcode].format(a=a, b=b))
+    else:
+        compiler.push(f"{compiler.bind(get_binary_operator(instr.opcode, instr.data_type))}({a}, {b})")
+
+def __compile_TYPED_UNARY(instr: Union[INC, DEC, NEG], compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    a = compiler.pop()
+
+    if instr.data_type == DataType.I64 or instr.data_type == DataType.UI64:
+        compiler.push(__INLINE_WORD_OPERATORS[instr.opcode].format(a=a))
+    else:
+        compiler.push(f"{compiler.bind(get_unary_operator(instr.opcode, instr.data_type))}({a})")
+
+def __compile_OR(instr: OR, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    b = compiler.pop()
+    compiler.push(f"{compiler.pop()} | {b}")
+
+def __compile_AND(instr: AND, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    b = compiler.pop()
+    compiler.push(f"{compiler.pop()} & {b}")
+
+def __compile_XOR(instr: XOR, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    b = compiler.pop()
+    compiler.push(f"{compiler.pop()} ^ {b}")
+
+def __compile_NOT(instr: NOT, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    compiler.push(f"{compiler.pop()} ^ {hex(WORD_MASK)}")
+
+def __compile_SHL(instr: SHL, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    compiler.push(f"({compiler.pop()} << {instr.amt}) & {hex(WORD_MASK)}")
+
+def __compile_SHR(instr: SHR, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    compiler.push(f"{compiler.pop()} >> {instr.amt}")
+
+def __compile_CONVERT(instr: CONVERT, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    compiler.push(f"{compiler.bind(get_conversion(instr.from_dt, instr.to_dt))}({compiler.pop()})")
+
+def __compile_CALL(instr: CALL, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    callee = ctx.vm.get_function(instr.target)
+    args = ', '.join([compiler.pop() for _ in range(callee.num_params)])
+
+    if isinstance(callee, PreparedFunction):
+        call = f"{compiler.bind(ctx.vm.execute)}({compiler.bind(callee)}, [{args}])"
+    else:
+        call = f"{compiler.bind(callee.callback)}({compiler.bind(ctx.vm)}, [{args}])"
+
+    if not callee.returns_value:
+        compiler.emit(call)
+    elif isinstance(callee, PreparedFunction):
+        compiler.push(call)
+    else:
+        compiler.push(f"({call} or 0) & {hex(WORD_MASK)}")
+
+__COMPILERS : Dict[OpCode, Callable[..., None]] = {
+    OpCode.NOOP: __compile_NOOP,
+    OpCode.LOAD_CONST: __compile_LOAD_CONST,
+    OpCode.LOAD_LOCAL: __compile_LOAD_LOCAL,
+    OpCode.LOAD_PARAM: __compile_LOAD_PARAM,
+    OpCode.LOAD_GLOBAL: __compile_LOAD_GLOBAL,
+    OpCode.LOAD_MEM: __compile_LOAD_MEM,
+    OpCode.LOAD_FUNC_ADDR: __compile_LOAD_FUNC_ADDR,
+    OpCode.POP: __compile_POP,
+    OpCode.STORE_LOCAL: __compile_STORE_LOCAL,
+    OpCode.STORE_PARAM: __compile_STORE_PARAM,
+    OpCode.STORE_GLOBAL: __compile_STORE_GLOBAL,
+    OpCode.STORE_MEM: __compile_STORE_MEM,
+    OpCode.ADD: __compile_TYPED_BINARY,
+    OpCode.SUB: __compile_TYPED_BINARY,
+    OpCode.MUL: __compile_TYPED_BINARY,
+    OpCode.DIV: __compile_TYPED_BINARY,
+    OpCode.MOD: __compile_TYPED_BINARY,
+    OpCode.INC: __compile_TYPED_UNARY,
+    OpCode.DEC: __compile_TYPED_UNARY,
+    OpCode.EQ: __compile_TYPED_BINARY,
+    OpCode.NEQ: __compile_TYPED_BINARY,
+    OpCode.GT: __compile_TYPED_BINARY,
+    OpCode.LT: __compile_TYPED_BINARY,
+    OpCode.GTEQ: __compile_TYPED_BINARY,
+    OpCode.LTEQ: __compile_TYPED_BINARY,
+    OpCode.NEG: __compile_TYPED_UNARY,
+    OpCode.OR: __compile_OR,
+    OpCode.AND: __compile_AND,
+    OpCode.XOR: __compile_XOR,
+    OpCode.NOT: __compile_NOT,
+    OpCode.SHL: __compile_SHL,
+    OpCode.SHR: __compile_SHR,
+    OpCode.CONVERT: __compile_CONVERT,
+    OpCode.CALL: __compile_CALL,
+    OpCode.INDIRECT_CALL: __compile_FALLBACK,
+}
+
+def compile_Instruction(instr: Instruction, compiler: BlockCompiler, ctx: FunctionContext) -> None:
+    if instr.opcode not in __COMPILERS:
+        raise NotImplementedError(instr.opcode)
+
+    __COMPILERS[instr.opcode](instr, compiler, ctx)
+
+def compile_Function(function: Function, prepared: PreparedFunction, vm: 'VirtualMachine') -> str:
+    ctx = FunctionContext(function, prepared, vm)
+    namespace : Dict[str, Any] = {}
+    block_names = {label: f"_b{idx}" for idx, (label, _) in enumerate(function.basic_blocks)}
+    source = ""
+
+    for label, bb in function.basic_blocks:
+        if not bb.is_terminated():
+            raise VMError(f"Basic block '{label}' in function '{function.name}' is not terminated!")
+
+        compiler = BlockCompiler(namespace)
+        instructions = list(bb)
+
+        for instr in instructions[:-1]:
+            compile_Instruction(instr, compiler, ctx)
+
+        # Each block returns the next block to run, or None once the function returns
+        terminator = instructions[-1]
+
+        if isinstance(terminator, JUMP):
+            compiler.flush()
+            compiler.emit(f"return {block_names[ctx.get_block(terminator.target).label]}")
+        elif isinstance(terminator, COND_JUMP):
+            condition = compiler.pop()
+            true_block = block_names[ctx.get_block(terminator.true_target).label]
+            false_block = block_names[ctx.get_block(terminator.false_target).label]
+
+            compiler.flush()
+            compiler.emit(f"return {true_block} if {condition} else {false_block}")
+        else:
+            if prepared.returns_value:
+                compiler.emit(f"stack.append({compiler.pop()})")
+
+            compiler.emit("return None")
+
+        source += compiler.get_source(block_names[label])
+
+    exec(compile(source, f"<slasm {function.name}>", "exec"), namespace)
+
+    for label, name in block_names.items():
+        prepared.blocks[label].code = namespace[name]
+
+    return source
+
+def __prepare_MOVE(dest: int, src: int) -> Step:
+    def step(regs: List[int]) -> None:
+        regs[dest] = regs[src]
+
+    return step
+
+def __prepare_CONST(dest: int, value: int) -> Step:
+    def step(regs: List[int]) -> None:
+        regs[dest] = value
+
+    return step
+
+def __prepare_LOAD_GLOBAL(dest: int, globals: List[int], slot: int) -> Step:
+    def step(regs: List[int]) -> None:
+        regs[dest] = globals[slot]
+
+    return step
+
+def __prepare_UNARY(dest: int, src: int, func: Callable[[int], int]) -> Step:
+    def step(regs: List[int]) -> None:
+        regs[dest] = func(regs[src])
+
+    return step
+
+def __prepare_BINARY(dest: int, lhs: int, rhs: int, func: Callable[[int, int], int]) -> Step:
+    def step(regs: List[int]) -> None:
+        regs[dest] = func(regs[lhs], regs[rhs])
+
+    return step
+
+def __prepare_STORE_GLOBAL(src: int, globals: List[int], slot: int) -> Step:
+    def step(regs: List[int]) -> None:
+        globals[slot] = regs[src]
+
+    return step
+
+def __prepare_STORE_MEM(value: int, address: int, memory: Memory, offset: int) -> Step:
+    def step(regs: List[int]) -> None:
+        memory.write_word(regs[address] + offset, regs[value])
+
+    return step
+
+def __prepare_CALL(dest: Optional[int], args: List[int], call: Callable[[List[int]], Optional[int]]) -> Step:
+    def step(regs: List[int]) -> None:
+        result = call([regs[arg] for arg in args])
+
+        if dest is not None:
+            regs[dest] = 0 if result is None else result & WORD_MASK
+
+    return step
+
+def prepare_RegisterInstruction(instr: Union[MOVE, Operation], ctx: FunctionContext) -> Step:
+    if isinstance(instr, MOVE):
+        return __prepare_MOVE(instr.dest, instr.src)
+
+    op, dest, srcs, vm = instr.instr, instr.dest, instr.srcs, ctx.vm
+
+    if isinstance(op, LOAD_CONST):
+        return __prepare_CONST(cast(int, dest), op.value.as_ui64())
+    elif isinstance(op, LOAD_FUNC_ADDR):
+        return __prepare_CONST(cast(int, dest), vm.get_function_address(op.func_name))
+    elif isinstance(op, LOAD_GLOBAL):
+        return __prepare_LOAD_GLOBAL(cast(int, dest), vm.globals, vm.get_global_slot(op.name))
+    elif isinstance(op, STORE_GLOBAL):
+        return __prepare_STORE_GLOBAL(srcs[0], vm.globals, vm.get_global_slot(op.name))
+    elif isinstance(op, LOAD_MEM):
+        read_word, offset = vm.memory.read_word, int(op.offset)
+        return __prepare_UNARY(cast(int, dest), srcs[0], lambda address: read_word(address + offset))
+    elif isinstance(op, STORE_MEM):
+        return __prepare_STORE_MEM(srcs[0], srcs[1], vm.memory, int(op.offset))
+    elif isinstance(op, CALL):
+        callee = vm.get_function(op.target)
+
+        if isinstance(callee, PreparedFunction):
+            execute, prepared = vm.execute, callee
+            return __prepare_CALL(dest, list(reversed(srcs)), lambda args: execute(prepared, args))
+
+        callback = callee.callback
+        return __prepare_CALL(dest, list(reversed(srcs)), lambda args: callback(vm, args))
+    elif isinstance(op, INDIRECT_CALL):
+        num_params, returns_value = int(op.num_params), op.returns_value
+
+        def indirect_call(args: List[int]) -> Optional[int]:
+            stack = list(reversed(args))
+            __exec_INDIRECT_CALL(stack, [], [], (vm, num_params, returns_value))
+            return stack.pop() if returns_value else None
+
+        return __prepare_CALL(dest, [srcs[-1]] + list(reversed(srcs[:-1])), indirect_call)
+
+    # Remaining operations reuse the operators resolved for the stack form
+    handler, operand = decode_Instruction(op, ctx)
+
+    if handler is __exec_BINARY:
+        return __prepare_BINARY(cast(int, dest), srcs[0], srcs[1], operand)
+    elif handler is __exec_UNARY:
+        return __prepare_UNARY(cast(int, dest), srcs[0], operand)
+
+    raise NotImplementedError(op.opcode)
+
+def prepare_RegisterFunction(function: Function, register_function: RegisterFunction, prepared: PreparedFunction, vm: 'VirtualMachine') -> None:
+    ctx = FunctionContext(function, prepared, vm)
+    prepared.num_registers = register_function.num_registers
+
+    for label, instrs in register_function.basic_blocks:
+        block = ctx.get_block(label)
+
+        for instr in instrs[:-1]:
+            block.steps.append(prepare_RegisterInstruction(instr, ctx))
+
+        terminator = instrs[-1]
+        assert isinstance(terminator, Operation)
+        block.terminator = terminator.opcode
+
+        if isinstance(terminator.instr, JUMP):
+            block.operand = ctx.get_block(terminator.instr.target)
+        elif isinstance(terminator.instr, COND_JUMP):
+            block.operand = (terminator.srcs[0], ctx.get_block(terminator.instr.true_target), ctx.get_block(terminator.instr.false_target))
+        else:
+            block.operand = terminator.srcs[0] if len(terminator.srcs) != 0 else None
+
+def __native_DEBUG_PRINT_I64(vm: 'VirtualMachine', args: List[int]) -> None:
+    vm.output.write(f"{Word.FromUI64(ui64(args[0])).as_i64()}\n")
+
+def __native_LINUX_x86_64_SYSCALL1(vm: 'VirtualMachine', args: List[int]) -> None:
+    code, arg = args
+
+    if code == 60: # exit
+        raise _VMExit(Word.FromUI64(ui64(arg)).as_i64())
+
+    raise VMError(f"Unsupported syscall: {code}")
+
+def get_default_native_funcs() -> Dict[str, NativeFunc]:
+    return {
+        "LINUX_x86_64_SYSCALL1_WITH_RET": NativeFunc(2, True, __native_LINUX_x86_64_SYSCALL1),
+        "LINUX_x86_64_SYSCALL1_NO_RET": NativeFunc(2, False, __native_LINUX_x86_64_SYSCALL1),
+        "DEBUG_PRINT_I64": NativeFunc(1, False, __native_DEBUG_PRINT_I64),
+    }
+
+class VirtualMachine:
+    def __init__(self, program: Union[Program, BytecodeReader], native_funcs: Optional[Dict[str, NativeFunc]] = None, output: TextIO = sys.stdout, mode: ExecutionMode = ExecutionMode.INTERPRET) -> None:
+        # Bytecode is interpreted straight from its buffer; the other modes work on instruction objects
+        if isinstance(program, BytecodeReader) and mode != ExecutionMode.INTERPRET:
+            program = program.load_Program()
+
+        self.__program = program
+        self.__output = output
+        self.__mode = mode
+        self.__native_funcs = get_default_native_funcs() if native_funcs is None else dict(native_funcs)
+
+        # Lay out data labels in memory
+        self.__data_addresses : Dict[str, int] = {}
+        address = DATA_BASE_ADDRESS
+
+        for label, data in program.data:
+            self.__data_addresses[label] = address
+            address += len(data)
+
+        self.__memory = Memory(DATA_BASE_ADDRESS, address - DATA_BASE_ADDRESS)
+
+        for label, data in program.data:
+            self.__memory.write_bytes(self.__data_addresses[label], data)
+
+        # Assign global slots
+        self.__global_slots = {name: idx for idx, name in enumerate(program.globals)}
+        self.__globals = [0] * len(self.__global_slots)
+
+        # Forward declare functions and assign their addresses
+        self.__functions : Dict[str, Union[PreparedFunction, NativeFunc]] = dict(self.__native_funcs)
+        self.__function_addresses : Dict[str, int] = {}
+
+        for function in program.functions:
+            if function.name in self.__native_funcs:
+                raise VMError(f"Function with name {function.name} is already declared as a native function!")
+
+            self.__functions[function.name] = PreparedFunction(function)
+
+        for idx, name in enumerate(self.__functions):
+            self.__function_addresses[name] = FUNCTION_BASE_ADDRESS + idx * Word.SIZE()
+
+        self.__functions_by_address = {address: self.__functions[name] for name, address in self.__function_addresses.items()}
+
+        # Verify stack effects up front so malformed programs fail before anything runs
+        native_signatures = {name: Signature(native.num_params, native.returns_value) for name, native in self.__native_funcs.items()}
+
+        if isinstance(program, Program):
+            try:
+                frame_infos = verify_Program(program, native_signatures)
+            except VerificationError as e:
+                raise VMError(str(e))
+
+            for name, frame_info in frame_infos.items():
+                cast(PreparedFunction, self.__functions[name]).max_stack_height = frame_info.max_stack_height
+
+        # Resolve operands and dispatch handlers
+        if mode == ExecutionMode.REGISTER:
+            register_functions = convert_Program(cast(Program, program), native_signatures)
+
+        for function in program.functions:
+            prepared = self.__functions[function.name]
+            assert isinstance(prepared, PreparedFunction)
+
+            if isinstance(function, BytecodeFunction):
+                prepare_BytecodeFunction(function, cast(BytecodeReader, program), prepared, self)
+                continue
+            elif mode == ExecutionMode.REGISTER:
+                prepare_RegisterFunction(function, register_functions[function.name], prepared, self)
+                continue
+
+            prepare_Function(function, prepared, self)
+
+            if mode == ExecutionMode.COMPILE:
+                compile_Function(function, prepared, self)
+
+    def execute(self, function: PreparedFunction, args: List[int]) -> Optional[int]:
+        if self.__mode is ExecutionMode.COMPILE:
+            return self.__execute_compiled(function, args)
+        elif self.__mode is ExecutionMode.REGISTER:
+            return self.__execute_registers(function, args)
+
+        locals = [0] * function.num_locals
+        stack : List[int] = []
+        block = function.entry
+
+        try:
+            while True:
+                for handler, operand in block.body:
+                    handler(stack, locals, args, operand)
+
+                terminator = block.terminator
+
+                if terminator is OpCode.JUMP:
+                    block = block.operand
+                elif terminator is OpCode.COND_JUMP:
+                    block = block.operand[0] if stack.pop() != 0 else block.operand[1]
+                else:
+                    return stack.pop() if function.returns_value else None
+        except IndexError:
+            raise VMError(f"Stack underflow in function '{function.name}' at basic block '{block.label}'")
+
+    def __execute_registers(self, function: PreparedFunction, args: List[int]) -> Optional[int]:
+        regs = [0] * function.num_registers
+        regs[:len(args)] = args
+        block = function.entry
+
+        while True:
+            for step in block.steps:
+                step(regs)
+
+            terminator = block.terminator
+
+            if terminator is OpCode.JUMP:
+                block = block.operand
+            elif terminator is OpCode.COND_JUMP:
+                condition, true_block, false_block = block.operand
+                block = true_block if regs[condition] != 0 else false_block
+            else:
+                return None if block.operand is None else regs[block.operand]
+
+    def __execute_compiled(self, function: PreparedFunction, args: List[int]) -> Optional[int]:
+        locals = [0] * function.num_locals
+        stack : List[int] = []
+        code = function.entry.code
+
+        try:
+            while code is not None:
+                code = code(stack, locals, args)
+
+            return stack.pop() if function.returns_value else None
+        except IndexError:
+            raise VMError(f"Stack underflow in function '{function.name}'")
+
+    def call(self, func_name: str, args: List[int]) -> Optional[int]:
+        function = self.get_function(func_name)
+
+        if len(args) != function.num_params:
+            raise VMError(f"Function {func_name} expects {function.num_params} arguments but {len(args)} were given!")
+
+        if isinstance(function, NativeFunc):
+            return function.callback(self, list(args))
+
+        return self.execute(function, list(args))
+
+    def run(self) -> ExitCode:
+        try:
+            exit_code = self.call(self.__program.entry, [])
+        except _VMExit as e:
+            return e.exit_code
+
+        return 0 if exit_code is None else Word.FromUI64(ui64(exit_code)).as_i64()
+
+    def get_function(self, name: str) -> Union[PreparedFunction, NativeFunc]:
+        if name not in self.__functions:
+            raise VMError(f"Virtual machine does not contain a function named {name}")
+
+        return self.__functions[name]
+
+    def get_function_address(self, name: str) -> int:
+        if name not in self.__function_addresses:
+            raise VMError(f"Virtual machine does not contain a function named {name}")
+
+        return self.__function_addresses[name]
+
+    def get_function_at(self, address: int) -> Union[PreparedFunction, NativeFunc]:
+        if address not in self.__functions_by_address:
+            raise VMError(f"No function exists at address {hex(address)}")
+
+        return self.__functions_by_address[address]
+
+    def get_global_slot(self, name: str) -> int:
+        if name not in self.__global_slots:
+            raise VMError(f"Program does not contain a global named {name}")
+
+        return self.__global_slots[name]
+
+    def get_data_address(self, label: str) -> int:
+        if label not in self.__data_addresses:
+            raise VMError(f"Program does not contain data labelled {label}")
+
+        return self.__data_addresses[label]
+
+    @property
+    def program(self) -> Union[Program, BytecodeReader]:
+        return self.__program
+
+    @property
+    def output(self) -> TextIO:
+        return self.__output
+
+    @property
+    def mode(self) -> ExecutionMode:
+        return self.__mode
+
+    @property
+    def memory(self) -> Memory:
+        return self.__memory
+
+    @property
+    def globals(self) -> List[int]:
+        return self.__globals
@@ -18,7 +18,7 @@ class Location:
 
 class uint(int):
     def __new__(cls, value: int, *args, **kwargs):
-        assert 0 >= value, f"{value} is not a valid value for an unsigned integer"
+        assert 0 <= value, f"{value} is not a valid value for an unsigned integer"
         return super(uint, cls).__new__(cls, value)
 
 class i64(int):
@@ -1,6 +1,8 @@
-from typing import Any, Callable, Dict
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from slate.ast import ASTBinopExpr, ASTIntegerLiteral, ASTModule, ASTNode, Binop
+from slate.optimizer import OptimizationOptions, initialize_llvm, link_Modules, optimize_WholeProgram
 from llvmlite import ir # type: ignore
+import llvmlite.binding as llvm # type: ignore
 
 TypeI64 = ir.IntType(64)
 
@@ -35,7 +37,7 @@ def __visit_ASTNode(node: ASTNode, builder: ir.IRBuilder) -> ir.Value:
 
 def visit(module: ASTModule, ir_module: ir.Module) -> ir.Module:
     entry_func_type = ir.FunctionType(TypeI64, ())
-    entry_func = ir.Function(ir_module, entry_func_type, module.get_path() + "#entry")
+    entry_func = ir.Function(ir_module, entry_func_type, __get_entry_func_name(module))
     start_block = entry_func.append_basic_block("start")
     builder = ir.IRBuilder(start_block)
 
@@ -45,4 +47,26 @@ def visit(module: ASTModule, ir_module: ir.Module) -> ir.Module:
         last_value = __visit_ASTNode(node, builder)
 
     builder.ret(last_value)
-    return ir_module
\ No newline at end of file
+    return ir_module
+
+def __get_entry_func_name(module: ASTModule) -> str:
+    return module.get_path() + "#entry"
+
+def __get_export_names(module: ASTModule) -> List[str]:
+    return [f"{module.get_path()}#{name}" for name in module.get_ctx().get_exports()]
+
+def compile_modules(modules: List[ASTModule], options: OptimizationOptions, target_machine: Optional[llvm.TargetMachine] = None) -> Tuple[llvm.ModuleRef, Optional[str]]:
+    # Each module is emitted on its own and the results are linked, after which only entry functions
+    # and exports are visible outside, so the whole program is optimized across module boundaries
+    initialize_llvm()
+    llvm_modules = []
+
+    for module in modules:
+        llvm_module = llvm.parse_assembly(str(visit(module, ir.Module(name=module.get_path()))))
+        llvm_module.verify()
+        llvm_modules.append(llvm_module)
+
+    linked_module = link_Modules(llvm_modules)
+    preserved = [name for module in modules for name in [__get_entry_func_name(module)] + __get_export_names(module)]
+
+    return linked_module, optimize_WholeProgram(linked_module, preserved, options, target_machine)
@@ -52,8 +52,8 @@ def __visit_ASTNode(node: ASTNode, basic_block: BasicBlock, function: Function)
     return __VISITORS[type(node)](node, basic_block, function)
 
 def visit(modules: List[ASTModule], target: str) -> Program:
-    program = Program(target)
-    function = Function("Main", set(), set(), True)
+    program = Program(target, set())
+    function = Function("Main", [], [], True)
 
     basic_block = BasicBlock()
     
@@ -4,6 +4,7 @@
 [BITS 64]
 
 global main     ; LINUX
+extern printf
 
 %macro LINUX_x86_64_SYSCALL1 0
     mov rax, [rsp + 8]  ; set syscall code
@@ -25,6 +26,12 @@ global main     ; LINUX
     ret                     ; return
 %endmacro
 
+    section .data
+#DATA#
+
+    section .bss
+#GLOBALS#
+
     section .text
     
     default rel
@@ -39,10 +46,15 @@ main: ; LINUX
     push rbp
     mov rbp, rsp
 
+    ; slasm functions use rbx as a scratch register, but it is callee-saved in C
+    push rbx
+    sub rsp, 8
+
     ; call entry function
     call #ENTRY_FUNC_NAME#
 
-    ; delete stack frame
+    ; restore rbx and delete stack frame
+    mov rbx, [rbp - 8]
     mov rsp, rbp
     pop rbp
 
@@ -62,7 +74,7 @@ DEBUG_PRINT_I64:
     push 0
 
     ; arg1 (function address)
-    lea rax, [_printf wrt ..gotpcrel]   ; obtain pointer to function address
+    lea rax, [printf wrt ..gotpcrel]   ; obtain pointer to function address
     push QWORD [rax]                    ; deference pointer
 
     ; perform call
@@ -1,13 +1,26 @@
 from enum import Enum, auto
+import ctypes
+import io
+import json
+import os
+import shutil
+import struct
 import subprocess
 from tempfile import TemporaryDirectory, TemporaryFile
-from typing import Tuple
+from typing import Dict, List, Tuple, Union
 import unittest
+from slate.slasm.bytecode import BytecodeReader
 from slate.slasm.program import Program
 from slate.slasm.function import Function, BasicBlock
-from slate.slasm import instruction
-from slate.slasm.slasm import Word
-from slate.slasm.visitors import nasm_visitor
+from slate.slasm import assembler, cfg, elf, instruction, llvm_runtime, peephole, toolchain, verifier
+from slate.slasm.slasm import DataType, Word
+from slate.slasm.visitors import json_visitor, llvm_visitor, nasm_visitor
+from slate.slasm.vm import ExecutionMode, VirtualMachine
+from slate.utilities import i64, uint
+from slate.interpreter import JITSession, run_llvm
+from slate.optimizer import OptimizationOptions
+from llvmlite import ir # type: ignore
+import llvmlite.binding as llvm # type: ignore
 from pathlib import Path
 
 class OSTarget(Enum):
@@ -20,7 +33,7 @@ class TestSlasm(unittest.TestCase):
 
     def _create_LOAD_CONST(self) -> Tuple[Program, str]:
         program = Program(target="x86-64-linux-nasm", globals={})
-        function = Function("SLASM_Main", {}, {}, True)
+        function = Function("SLASM_Main", [], [], True)
 
         basic_block = BasicBlock()
         basic_block.append_instr(instruction.LOAD_CONST(Word.FromI64(123)))
@@ -36,6 +49,83 @@ class TestSlasm(unittest.TestCase):
 
         return program, "123"
 
+    def _create_arithmetic(self) -> Tuple[Program, str]:
+        program = Program(target="x86-64-linux-nasm", globals={"counter"})
+
+        function = Function("SLASM_Main", [], ["i"], True)
+
+        entry = BasicBlock()
+        entry.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(3))))
+        entry.append_instr(instruction.STORE_LOCAL("i"))
+        entry.append_instr(instruction.JUMP("loop"))
+
+        loop = BasicBlock()
+        loop.append_instr(instruction.LOAD_LOCAL("i"))
+        loop.append_instr(instruction.CALL("SLASM_Square"))
+        loop.append_instr(instruction.CALL("DEBUG_PRINT_I64"))
+        loop.append_instr(instruction.LOAD_LOCAL("i"))
+        loop.append_instr(instruction.DEC(DataType.I64))
+        loop.append_instr(instruction.STORE_LOCAL("i"))
+        loop.append_instr(instruction.LOAD_LOCAL("i"))
+        loop.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(0))))
+        loop.append_instr(instruction.GT(DataType.I64))
+        loop.append_instr(instruction.COND_JUMP("loop", "exit"))
+
+        done = BasicBlock()
+        done.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(-7))))
+        done.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(2))))
+        done.append_instr(instruction.DIV(DataType.I64))
+        done.append_instr(instruction.CALL("DEBUG_PRINT_I64"))
+        done.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(250))))
+        done.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(10))))
+        done.append_instr(instruction.ADD(DataType.I8))
+        done.append_instr(instruction.CALL("DEBUG_PRINT_I64"))
+        done.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(7))))
+        done.append_instr(instruction.CONVERT(DataType.I64, DataType.F32))
+        done.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(2))))
+        done.append_instr(instruction.CONVERT(DataType.I64, DataType.F32))
+        done.append_instr(instruction.DIV(DataType.F32))
+        done.append_instr(instruction.CONVERT(DataType.F32, DataType.F64))
+        done.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(2))))
+        done.append_instr(instruction.CONVERT(DataType.I64, DataType.F64))
+        done.append_instr(instruction.MUL(DataType.F64))
+        done.append_instr(instruction.CONVERT(DataType.F64, DataType.I64))
+        done.append_instr(instruction.STORE_GLOBAL("counter"))
+        done.append_instr(instruction.LOAD_GLOBAL("counter"))
+        done.append_instr(instruction.CALL("DEBUG_PRINT_I64"))
+        done.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(5))))
+        done.append_instr(instruction.LOAD_FUNC_ADDR("SLASM_Square"))
+        done.append_instr(instruction.INDIRECT_CALL(uint(1), True))
+        done.append_instr(instruction.RET())
+
+        function.add_basic_block("entry", entry)
+        function.add_basic_block("loop", loop)
+        function.add_basic_block("exit", done)
+        function.entry = "entry"
+
+        square = Function("SLASM_Square", ["x"], [], True)
+
+        basic_block = BasicBlock()
+        basic_block.append_instr(instruction.LOAD_PARAM("x"))
+        basic_block.append_instr(instruction.LOAD_PARAM("x"))
+        basic_block.append_instr(instruction.MUL(DataType.I64))
+        basic_block.append_instr(instruction.RET())
+
+        square.add_basic_block("entry", basic_block)
+        square.entry = "entry"
+
+        program.add_function(function)
+        program.add_function(square)
+        program.entry = function.name
+
+        return program, "9\n4\n1\n-3\n4\n7\n"
+
+    def _run_vm_program(self, program: Union[Program, BytecodeReader], mode: ExecutionMode = ExecutionMode.INTERPRET) -> Tuple[str, int]:
+        output = io.StringIO()
+        exit_code = VirtualMachine(program, output=output, mode=mode).run()
+
+        return output.getvalue(), exit_code
+
     def _run_nasm_program(self, program: Program, target_os: OSTarget) -> str:
         with open('tests/slasm/nasm_template.asm', 'r') as template_file:
             template = template_file.read()
@@ -83,6 +173,585 @@ class TestSlasm(unittest.TestCase):
         program, expected = self._create_LOAD_CONST()
         self.assertEqual(self._run_nasm_program(program, OSTarget.LINUX), expected)
         
+    def test_vm_LOAD_CONST(self) -> None:
+        program, expected = self._create_LOAD_CONST()
+        self.assertEqual(self._run_vm_program(program), (expected + "\n", 0))
+
+    def test_vm_arithmetic(self) -> None:
+        program, expected = self._create_arithmetic()
+        self.assertEqual(self._run_vm_program(program), (expected, 25))
+
+    def test_vm_compiled_arithmetic(self) -> None:
+        program, expected = self._create_arithmetic()
+        self.assertEqual(self._run_vm_program(program, ExecutionMode.COMPILE), (expected, 25))
+
+    def test_vm_register_arithmetic(self) -> None:
+        program, expected = self._create_arithmetic()
+        self.assertEqual(self._run_vm_program(program, ExecutionMode.REGISTER), (expected, 25))
+
+    def test_bytecode_arithmetic(self) -> None:
+        program, expected = self._create_arithmetic()
+
+        with TemporaryDirectory() as temp_dir:
+            bytecode_path = Path(temp_dir) / "program.slbc"
+
+            with bytecode_path.open("wb") as file:
+                program.write_bytecode(file)
+
+            loaded = Program.read_bytecode(bytecode_path)
+            self.assertEqual([(f.name, f.params, f.locals, [list(bb) for _, bb in f.basic_blocks]) for f in loaded.functions],
+                             [(f.name, f.params, f.locals, [list(bb) for _, bb in f.basic_blocks]) for f in program.functions])
+            self.assertEqual(self._run_vm_program(loaded), (expected, 25))
+
+            with BytecodeReader.open(bytecode_path) as reader:
+                self.assertEqual(self._run_vm_program(reader), (expected, 25))
+
+    def test_json_arithmetic(self) -> None:
+        program, expected = self._create_arithmetic()
+        program.add_data("DATA_message", b"Hello")
+
+        def summarize(program: Program) -> Tuple:
+            return program.target, program.entry, program.globals, program.data, [(f.name, f.params, f.locals, f.entry, [(label, list(bb)) for label, bb in f.basic_blocks]) for f in program.functions]
+
+        loaded = json_visitor.load_Program(json.loads(json_visitor.to_string(json_visitor.emit_Program(program))))
+        self.assertEqual(summarize(loaded), summarize(program))
+
+        file = io.StringIO()
+        json_visitor.write_Program(program, file)
+        file.seek(0)
+
+        streamed = json_visitor.read_Program(file, chunk_size=7)
+        self.assertEqual(summarize(streamed), summarize(program))
+        self.assertEqual(self._run_vm_program(streamed), (expected, 25))
+
+    def test_peephole(self) -> None:
+        function = Function("SLASM_Main", [], ["x"], True)
+
+        basic_block = BasicBlock()
+        basic_block.append_instr(instruction.NOOP())
+        basic_block.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(41))))
+        basic_block.append_instr(instruction.STORE_LOCAL("x"))
+        basic_block.append_instr(instruction.LOAD_LOCAL("x"))
+        basic_block.append_instr(instruction.STORE_LOCAL("x"))
+        basic_block.append_instr(instruction.LOAD_LOCAL("x"))
+        basic_block.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(7))))
+        basic_block.append_instr(instruction.POP())
+        basic_block.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(1))))
+        basic_block.append_instr(instruction.ADD(DataType.I64))
+        basic_block.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(-1))))
+        basic_block.append_instr(instruction.SUB(DataType.I8))
+        basic_block.append_instr(instruction.RET())
+
+        function.add_basic_block("entry", basic_block)
+        function.entry = "entry"
+
+        rewrites = peephole.optimize_Function(function)
+
+        self.assertEqual(rewrites, {"remove_noop": 1, "repeated_store": 1, "dead_load": 1, "add_one": 2})
+        self.assertEqual(list(basic_block), [
+            instruction.LOAD_CONST(Word.FromI64(i64(41))),
+            instruction.STORE_LOCAL("x"),
+            instruction.LOAD_LOCAL("x"),
+            instruction.INC(DataType.I64),
+            instruction.INC(DataType.I8),
+            instruction.RET(),
+        ])
+
+        program, expected = self._create_arithmetic()
+        peephole.optimize_Program(program)
+        self.assertEqual(self._run_vm_program(program), (expected, 25))
+
+    def _create_function(self, name: str, blocks: Dict[str, List[instruction.Instruction]]) -> Function:
+        # The first block is the entry
+        function = Function(name, [], [], True)
+
+        for label, instrs in blocks.items():
+            basic_block = BasicBlock()
+
+            for instr in instrs:
+                basic_block.append_instr(instr)
+
+            function.add_basic_block(label, basic_block)
+
+        function.entry = next(iter(blocks))
+        return function
+
+    def test_cfg(self) -> None:
+        blocks : Dict[str, List[instruction.Instruction]] = {
+            "entry": [instruction.LOAD_CONST(Word.FromI64(i64(1))), instruction.COND_JUMP("then", "else")],
+            "then": [instruction.JUMP("join")],
+            "else": [instruction.JUMP("join")],
+            "join": [instruction.JUMP("exit")],
+            "exit": [instruction.LOAD_CONST(Word.FromI64(i64(0))), instruction.RET()],
+            "dead": [instruction.JUMP("join")],
+        }
+        function = self._create_function("SLASM_Main", blocks)
+
+        graph = cfg.get_CFG(function)
+        self.assertIs(cfg.get_CFG(function), graph)
+        self.assertEqual(graph.get_predecessors("join"), ["then", "else", "dead"])
+        self.assertEqual(graph.reverse_postorder[0], "entry")
+        self.assertFalse(graph.is_reachable("dead"))
+
+        tree = cfg.get_DominatorTree(function)
+        self.assertEqual(tree.get_idom("join"), "entry")
+        self.assertEqual(tree.get_idom("exit"), "join")
+        self.assertTrue(tree.dominates("entry", "exit"))
+        self.assertFalse(tree.dominates("then", "join"))
+
+        self.assertEqual(cfg.simplify_Function(function), (1, 1))
+        self.assertIsNot(cfg.get_CFG(function), graph)
+        self.assertEqual([label for label, _ in function.basic_blocks], ["entry", "then", "else", "join"])
+        self.assertEqual(list(function.get_basic_block("join")), blocks["exit"])
+
+    def test_verifier(self) -> None:
+        natives = {"DEBUG_PRINT_I64": instruction.Signature(1, False)}
+
+        program, _ = self._create_arithmetic()
+        self.assertTrue(program.is_valid(natives))
+
+        frame_infos = verifier.verify_Program(program, natives)
+        self.assertEqual(frame_infos["SLASM_Main"].entry_depths, {"entry": 0, "loop": 0, "exit": 0})
+        self.assertEqual(frame_infos["SLASM_Main"].max_stack_height, 2)
+        self.assertEqual(frame_infos["SLASM_Square"].exit_depths, {"entry": 0})
+
+        underflow = Program(target="slasm-vm", globals=set())
+        function = self._create_function("SLASM_Main", {
+            "entry": [instruction.LOAD_CONST(Word.FromI64(i64(1))), instruction.ADD(DataType.I64), instruction.RET()],
+        })
+        underflow.add_function(function)
+        underflow.entry = function.name
+
+        self.assertFalse(underflow.is_valid(natives))
+
+        mismatch = Program(target="slasm-vm", globals=set())
+        function = self._create_function("SLASM_Main", {
+            "entry": [instruction.LOAD_CONST(Word.FromI64(i64(1))), instruction.COND_JUMP("push", "exit")],
+            "push": [instruction.LOAD_CONST(Word.FromI64(i64(2))), instruction.JUMP("exit")],
+            "exit": [instruction.LOAD_CONST(Word.FromI64(i64(0))), instruction.RET()],
+        })
+        mismatch.add_function(function)
+        mismatch.entry = function.name
+
+        with self.assertRaises(verifier.VerificationError):
+            verifier.verify_Program(mismatch, natives)
+
+    def test_frame_layout(self) -> None:
+        program, _ = self._create_arithmetic()
+        function = dict((f.name, f) for f in program.functions)["SLASM_Square"]
+
+        self.assertEqual(function.layout.get_param_slot(function.params[0]), 0)
+        self.assertEqual([function.layout.get_local_slot(name) for name in function.locals], list(range(function.num_locals)))
+
+        with self.assertRaises(Exception):
+            Function("SLASM_Dup", ["a", "a"], [], False)
+
+        with self.assertRaises(Exception):
+            function.layout.get_local_slot("missing")
+
+    def _emit_nasm_instrs(self, program: Program, cache_registers: int, fuse_operands: bool = False) -> List[str]:
+        native_funcs = {"DEBUG_PRINT_I64": nasm_visitor.GlobalContext.FuncDef(["arg0"], [], False)}
+        nasm = nasm_visitor.emit_Program(program, "#SLASM_VERSION##TARGET##DATA##GLOBALS##ENTRY_FUNC_NAME##SLASM_FUNCS#", native_funcs, cache_registers, fuse_operands)
+        lines = [line.split(';')[0].strip() for line in nasm.split('\n')]
+
+        return [line for line in lines if line != "" and not line.endswith(':')]
+
+    def test_nasm_stack_cache(self) -> None:
+        program, _ = self._create_arithmetic()
+
+        uncached = self._emit_nasm_instrs(program, 0)
+        cached = self._emit_nasm_instrs(program, 2)
+
+        self.assertLess(len(cached), len(uncached))
+        self.assertLess(len([instr for instr in cached if instr.startswith(("push", "pop"))]) * 4, len([instr for instr in uncached if instr.startswith(("push", "pop"))]))
+
+    def test_nasm_streaming(self) -> None:
+        program, _ = self._create_arithmetic()
+        native_funcs = {"DEBUG_PRINT_I64": nasm_visitor.GlobalContext.FuncDef(["arg0"], [], False)}
+        template = "; #SLASM_VERSION# #TARGET#\n#DATA#\n#GLOBALS#\n#UNKNOWN#\ncall #ENTRY_FUNC_NAME#\n#SLASM_FUNCS#"
+
+        output = io.StringIO()
+        nasm_visitor.write_Program(program, template, native_funcs, output)
+
+        self.assertEqual(output.getvalue(), nasm_visitor.emit_Program(program, template, native_funcs))
+        self.assertTrue(output.getvalue().startswith("; 1.0 x86-64-linux-nasm\n\ncounter: resb 8\n#UNKNOWN#\ncall SLASM_Main\nSLASM_Main:\n"))
+        self.assertEqual(len(nasm_visitor.split_Template(template)), 15)
+
+    def test_nasm_operand_fusion(self) -> None:
+        program, _ = self._create_arithmetic()
+
+        unfused = self._emit_nasm_instrs(program, 2)
+        fused = self._emit_nasm_instrs(program, 2, True)
+
+        self.assertLess(len(fused), len(unfused))
+        self.assertIn("cmp rax, 0", fused)
+        self.assertIn("imul rax, qword [rbp+16]", fused)
+
+    def _setup_llvm_natives(self, llvm_module: ir.Module) -> None:
+        print_func = ir.Function(llvm_module, ir.FunctionType(ir.VoidType(), [ir.IntType(64)]), "DEBUG_PRINT_I64")
+        ir.IRBuilder(print_func.append_basic_block("")).ret_void()
+
+    def test_llvm_register_arithmetic(self) -> None:
+        program, _ = self._create_arithmetic()
+
+        llvm_module = llvm.parse_assembly(str(llvm_visitor.emit_RegisterProgram(program, self._setup_llvm_natives)))
+        self.assertEqual(run_llvm(llvm_module, program.entry), 25)
+
+    def test_llvm_stack_arithmetic(self) -> None:
+        program, _ = self._create_arithmetic()
+        llvm_module = llvm_visitor.emit_Program(program, self._setup_llvm_natives)
+
+        # The local counting down the loop becomes a phi rather than a stack slot
+        self.assertIn("phi i64", str(llvm_module))
+        self.assertNotIn("alloca", str(llvm_module))
+        self.assertEqual(run_llvm(llvm.parse_assembly(str(llvm_module)), program.entry), 25)
+
+    def test_parallel_codegen(self) -> None:
+        program, _ = self._create_arithmetic()
+        native_funcs = {"DEBUG_PRINT_I64": nasm_visitor.GlobalContext.FuncDef(["arg0"], [], False)}
+        template = "#SLASM_VERSION##TARGET##DATA##GLOBALS##ENTRY_FUNC_NAME##SLASM_FUNCS#"
+
+        self.assertEqual(nasm_visitor.emit_Program(program, template, native_funcs, 2, True, jobs=2), nasm_visitor.emit_Program(program, template, native_funcs, 2, True))
+
+        serial_module = llvm_visitor.link_RegisterProgram(program, self._setup_llvm_natives)
+        parallel_module = llvm_visitor.link_RegisterProgram(program, self._setup_llvm_natives, jobs=2)
+
+        self.assertEqual(str(parallel_module), str(serial_module))
+        self.assertEqual(run_llvm(parallel_module, program.entry), 25)
+
+    def test_assembler_encoding(self) -> None:
+        source = "section .text\n" \
+                 "extern printf\n" \
+                 "f:\n" \
+                 "    mov rax, [rbp-8]\n" \
+                 "    push qword [rbp+16]\n" \
+                 "    imul rax, qword [rbp+16]\n" \
+                 "    mov rax, 0x000000000000007b\n" \
+                 "    mov rax, 0xffffffffffffffff\n" \
+                 "    movq xmm0, rax\n" \
+                 "    cvttsd2si rax, xmm0\n" \
+                 "    mov rax, [rsp + 8]\n" \
+                 "    sete al\n" \
+                 "    jmp .done\n" \
+                 "    nop\n" \
+                 "  .done:\n" \
+                 "    call printf wrt ..plt\n" \
+                 "    ret\n"
+
+        object_file = assembler.assemble_Source(source)
+        text = object_file.sections[0]
+
+        self.assertEqual(text.data.hex(), "488b45f8" "ff7510" "480faf4510" "b87b000000" "48c7c0ffffffff" "66480f6ec0" "f2480f2cc0" "488b442408" "0f94c0" "eb01" "90" "e800000000" "c3")
+        self.assertEqual(text.relocations, [elf.Relocation(len(text.data) - 5, "printf", elf.R_X86_64_PLT32, -4)])
+        self.assertEqual([(symbol.name, symbol.section) for symbol in object_file.symbols], [("f", ".text"), ("f.done", ".text"), ("printf", None)])
+
+    @unittest.skipUnless(shutil.which("gcc"), "requires gcc to link")
+    def test_builtin_assembler(self) -> None:
+        program, expected = self._create_arithmetic()
+
+        with open('tests/slasm/nasm_template.asm', 'r') as template_file:
+            template = template_file.read()
+
+        native_funcs = {
+            "LINUX_x86_64_SYSCALL1_WITH_RET": nasm_visitor.GlobalContext.FuncDef(["arg0", "arg1"], [], True),
+            "LINUX_x86_64_SYSCALL1_NO_RET": nasm_visitor.GlobalContext.FuncDef(["arg0", "arg1"], [], False),
+            "C_CALL_3_WITH_RET": nasm_visitor.GlobalContext.FuncDef(["arg0", "arg1", "arg2", "arg3"], [], True),
+            "C_CALL_3_NO_RET": nasm_visitor.GlobalContext.FuncDef(["arg0", "arg1", "arg2", "arg3"], [], False),
+            "DEBUG_PRINT_I64": nasm_visitor.GlobalContext.FuncDef(["arg0"], [], False),
+        }
+
+        with TemporaryDirectory() as temp_dir:
+            object_file_path = Path(temp_dir) / "program.o"
+            executable_file_path = Path(temp_dir) / "program"
+
+            for cache_registers, fuse_operands in [(0, False), (2, True)]:
+                with object_file_path.open("wb") as file:
+                    nasm_visitor.write_Object(program, template, native_funcs, file, cache_registers, fuse_operands)
+
+                subprocess.run(["gcc", "-o", str(executable_file_path), str(object_file_path)], check=True)
+                process = subprocess.run([str(executable_file_path)], capture_output=True, text=True)
+
+                self.assertEqual((process.stdout, process.returncode), (expected, 25))
+
+    @unittest.skipUnless(shutil.which("gcc"), "requires gcc to link")
+    def test_build_cache(self) -> None:
+        program, expected = self._create_arithmetic()
+        platform = toolchain.get_Platform("linux")
+        template = toolchain.read_Template(platform)
+        native_funcs = {"DEBUG_PRINT_I64": nasm_visitor.GlobalContext.FuncDef(["arg0"], [], False)}
+
+        with TemporaryDirectory() as temp_dir:
+            cache = toolchain.BuildCache(Path(temp_dir) / "cache")
+            targets = [toolchain.BuildTarget(Path(temp_dir) / f"{name}.asm", Path(temp_dir) / f"{name}.o", Path(temp_dir) / name) for name in ["first", "second"]]
+
+            for target in targets:
+                with target.asm_path.open("w") as file:
+                    nasm_visitor.write_Program(program, template, native_funcs, file)
+
+            # Both targets have the same assembly, so building one fills the cache for both
+            toolchain.build_Targets(targets[:1], platform, cache, builtin_assembler=True)
+            timings = toolchain.build_Targets(targets, platform, cache, jobs=2, builtin_assembler=True)
+
+            self.assertEqual([(timing.target, timing.step, timing.cached) for timing in timings],
+                             [(target.executable_path, step, True) for target in targets for step in ["assemble", "link"]])
+
+            for target in targets:
+                process = subprocess.run([str(target.executable_path)], capture_output=True, text=True)
+                self.assertEqual((process.stdout, process.returncode), (expected, 25))
+
+    @unittest.skipUnless(shutil.which("ld"), "requires ld to link")
+    def test_freestanding_executable(self) -> None:
+        program, expected = self._create_arithmetic()
+        platform = toolchain.get_Platform("linux", freestanding=True)
+        native_funcs = {"DEBUG_PRINT_I64": nasm_visitor.GlobalContext.FuncDef(["arg0"], [], False)}
+
+        with TemporaryDirectory() as temp_dir:
+            target = toolchain.BuildTarget(Path(temp_dir) / "program.asm", Path(temp_dir) / "program.o", Path(temp_dir) / "program")
+
+            with target.asm_path.open("w") as file:
+                nasm_visitor.write_Program(program, toolchain.read_Template(platform), native_funcs, file, 2, True)
+
+            toolchain.build_Targets([target], platform, toolchain.BuildCache(None), builtin_assembler=True)
+            process = subprocess.run([str(target.executable_path)], capture_output=True, text=True)
+            self.assertEqual((process.stdout, process.returncode), (expected, 25))
+
+            # No PT_INTERP program header, so the kernel starts the program without a dynamic loader
+            executable = target.executable_path.read_bytes()
+            program_header_offset, = struct.unpack_from('<Q', executable, 32)
+            program_header_size, num_program_headers = struct.unpack_from('<HH', executable, 54)
+            program_header_types = [struct.unpack_from('<I', executable, program_header_offset + idx * program_header_size)[0] for idx in range(num_program_headers)]
+
+            self.assertNotIn(3, program_header_types)
+
+    def _create_printing(self, values: List[int], count: int) -> Tuple[Program, str]:
+        program = Program("x86-64-linux-nasm", set())
+        function = Function("print_all", [], ["i"], True)
+
+        entry = BasicBlock()
+
+        for value in values:
+            entry.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(value))))
+            entry.append_instr(instruction.CALL("DEBUG_PRINT_I64"))
+
+        entry.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(0))))
+        entry.append_instr(instruction.STORE_LOCAL("i"))
+        entry.append_instr(instruction.JUMP("loop"))
+
+        loop = BasicBlock()
+        loop.append_instr(instruction.LOAD_LOCAL("i"))
+        loop.append_instr(instruction.CALL("DEBUG_PRINT_I64"))
+        loop.append_instr(instruction.LOAD_LOCAL("i"))
+        loop.append_instr(instruction.INC(DataType.I64))
+        loop.append_instr(instruction.STORE_LOCAL("i"))
+        loop.append_instr(instruction.LOAD_LOCAL("i"))
+        loop.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(count))))
+        loop.append_instr(instruction.LT(DataType.I64))
+        loop.append_instr(instruction.COND_JUMP("loop", "done"))
+
+        done = BasicBlock()
+        done.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(3))))
+        done.append_instr(instruction.RET())
+
+        function.add_basic_block("entry", entry)
+        function.add_basic_block("loop", loop)
+        function.add_basic_block("done", done)
+        function.entry = "entry"
+        program.add_function(function)
+        program.entry = function.name
+
+        return program, "".join(f"{value}\n" for value in values + list(range(count)))
+
+    @unittest.skipUnless(shutil.which("gcc"), "requires gcc to link")
+    def test_buffered_output(self) -> None:
+        # More output than fits in the runtime's buffer, and numbers with every digit count and sign
+        program, expected = self._create_printing([0, 9, 10, 99, 100, -1, -10, -2**63, 2**63 - 1, 10**18], 20000)
+        native_funcs = {"DEBUG_PRINT_I64": nasm_visitor.GlobalContext.FuncDef(["arg0"], [], False)}
+
+        with TemporaryDirectory() as temp_dir:
+            for platform in (toolchain.get_Platform("linux"), toolchain.get_Platform("linux", freestanding=True)):
+                target = toolchain.BuildTarget(Path(temp_dir) / "program.asm", Path(temp_dir) / "program.o", Path(temp_dir) / platform.name)
+
+                with target.asm_path.open("w") as file:
+                    nasm_visitor.write_Program(program, toolchain.read_Template(platform), native_funcs, file, 2, True)
+
+                toolchain.build_Targets([target], platform, toolchain.BuildCache(None), builtin_assembler=True)
+                process = subprocess.run([str(target.executable_path)], capture_output=True, text=True)
+                self.assertEqual((process.stdout, process.returncode), (expected, 3))
+
+        session = JITSession()
+        session.add_module(llvm_visitor.link_RegisterProgram(program, llvm_runtime.define_OutputRuntime))
+        flush = ctypes.CFUNCTYPE(None)(session.get_function_address(llvm_runtime.FLUSH_FUNC_NAME))
+
+        # The runtime writes to file descriptor 1 directly
+        with TemporaryFile() as output:
+            stdout = os.dup(1)
+            os.dup2(output.fileno(), 1)
+
+            try:
+                exit_code = session.run(program.entry)
+                flush()
+            finally:
+                os.dup2(stdout, 1)
+                os.close(stdout)
+
+            output.seek(0)
+            self.assertEqual((output.read().decode(), exit_code), (expected, 3))
+
+    @unittest.skipUnless(shutil.which("gcc") and shutil.which("ld"), "requires gcc and ld to link")
+    def test_llvm_objects(self) -> None:
+        program, expected = self._create_arithmetic()
+
+        with TemporaryDirectory() as temp_dir:
+            for freestanding, whole_program in [(False, False), (True, False), (False, True)]:
+                platform = toolchain.get_Platform("linux", freestanding=freestanding)
+                setup = lambda llvm_module: llvm_runtime.define_Runtime(llvm_module, platform.natives, program.entry, freestanding)
+                executable_path = Path(temp_dir) / platform.name
+
+                # The runtime and one object per shard of functions, compiled in separate processes, or
+                # a single object for the whole program
+                objects = llvm_visitor.compile_Objects(program, setup, OptimizationOptions(), jobs=2, whole_program=whole_program)
+                self.assertEqual(len(objects) == 1, whole_program)
+
+                toolchain.link_Objects(objects, executable_path, platform, toolchain.BuildCache(None))
+                process = subprocess.run([str(executable_path)], capture_output=True, text=True)
+                self.assertEqual((process.stdout, process.returncode), (expected, 25))
+
+    @unittest.skipUnless(shutil.which("ld"), "requires ld to link")
+    def test_register_calling_convention(self) -> None:
+        # weigh(p0, ..., p7) = p0 * 1 + ... + p7 * 8, so that six arguments go in registers and two on
+        # the stack, called directly and indirectly with an odd and an even number of values below
+        program = Program("x86-64-linux-nasm", set())
+        weigh = Function("weigh", [f"p{idx}" for idx in range(8)], [], True)
+        body = BasicBlock()
+        body.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(0))))
+
+        for idx in range(8):
+            body.append_instr(instruction.LOAD_PARAM(f"p{idx}"))
+            body.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(idx + 1))))
+            body.append_instr(instruction.MUL(DataType.I64))
+            body.append_instr(instruction.ADD(DataType.I64))
+
+        body.append_instr(instruction.RET())
+        weigh.add_basic_block("entry", body)
+        weigh.entry = "entry"
+        program.add_function(weigh)
+
+        main = Function("main_", [], [], True)
+        entry = BasicBlock()
+        expected = ""
+
+        for below, indirect in [(0, False), (1, False), (1, True), (2, True)]:
+            for value in range(below):
+                entry.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(100 + value))))
+
+            # The last argument is pushed first, so p0 ends up on top
+            for idx in reversed(range(8)):
+                entry.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(10 * below + idx))))
+
+            if indirect:
+                entry.append_instr(instruction.LOAD_FUNC_ADDR("weigh"))
+                entry.append_instr(instruction.INDIRECT_CALL(uint(8), True))
+            else:
+                entry.append_instr(instruction.CALL("weigh"))
+
+            entry.append_instr(instruction.CALL("DEBUG_PRINT_I64"))
+            expected += f"{sum((10 * below + idx) * (idx + 1) for idx in range(8))}\n"
+
+            for value in reversed(range(below)):
+                entry.append_instr(instruction.CALL("DEBUG_PRINT_I64"))
+                expected += f"{100 + value}\n"
+
+        entry.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(4))))
+        entry.append_instr(instruction.RET())
+        main.add_basic_block("entry", entry)
+        main.entry = "entry"
+        program.add_function(main)
+        program.entry = main.name
+
+        platform = toolchain.get_Platform("linux", freestanding=True)
+        native_funcs = {"DEBUG_PRINT_I64": nasm_visitor.GlobalContext.FuncDef(["arg0"], [], False)}
+        asm = nasm_visitor.emit_Program(program, toolchain.read_Template(platform), native_funcs, 2, True, calling_convention=nasm_visitor.CallingConvention.SYSV)
+
+        self.assertIn("mov [rbp-48], r9", asm)
+        self.assertIn("[rbp+24]", asm)
+
+        with TemporaryDirectory() as temp_dir:
+            target = toolchain.BuildTarget(Path(temp_dir) / "program.asm", Path(temp_dir) / "program.o", Path(temp_dir) / "program")
+            target.asm_path.write_text(asm)
+
+            toolchain.build_Targets([target], platform, toolchain.BuildCache(None), builtin_assembler=True)
+            process = subprocess.run([str(target.executable_path)], capture_output=True, text=True)
+            self.assertEqual((process.stdout, process.returncode), (expected, 4))
+
+    @unittest.skipUnless(shutil.which("ld"), "requires ld to link")
+    def test_tail_calls(self) -> None:
+        # total(n, acc) = acc if n == 0 else total(n - 1, acc + n), recursing deeper than the stack allows
+        # unless the recursive call reuses the caller's frame
+        depth = 1000000
+        program = Program("x86-64-linux-nasm", set())
+        total = Function("total", ["n", "acc"], [], True)
+
+        entry = BasicBlock()
+        entry.append_instr(instruction.LOAD_PARAM("n"))
+        entry.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(0))))
+        entry.append_instr(instruction.EQ(DataType.I64))
+        entry.append_instr(instruction.COND_JUMP("done", "recurse"))
+
+        done = BasicBlock()
+        done.append_instr(instruction.LOAD_PARAM("acc"))
+        done.append_instr(instruction.RET())
+
+        recurse = BasicBlock()
+        recurse.append_instr(instruction.LOAD_PARAM("acc"))
+        recurse.append_instr(instruction.LOAD_PARAM("n"))
+        recurse.append_instr(instruction.ADD(DataType.I64))
+        recurse.append_instr(instruction.LOAD_PARAM("n"))
+        recurse.append_instr(instruction.DEC(DataType.I64))
+        recurse.append_instr(instruction.CALL("total"))
+        recurse.append_instr(instruction.RET())
+
+        total.add_basic_block("entry", entry)
+        total.add_basic_block("done", done)
+        total.add_basic_block("recurse", recurse)
+        total.entry = "entry"
+        program.add_function(total)
+
+        main = Function("main_", [], [], True)
+        body = BasicBlock()
+        body.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(0))))
+        body.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(depth))))
+        body.append_instr(instruction.CALL("total"))
+        body.append_instr(instruction.CALL("DEBUG_PRINT_I64"))
+        body.append_instr(instruction.LOAD_CONST(Word.FromI64(i64(5))))
+        body.append_instr(instruction.RET())
+        main.add_basic_block("entry", body)
+        main.entry = "entry"
+        program.add_function(main)
+        program.entry = main.name
+
+        platform = toolchain.get_Platform("linux", freestanding=True)
+        native_funcs = {"DEBUG_PRINT_I64": nasm_visitor.GlobalContext.FuncDef(["arg0"], [], False)}
+        expected = f"{depth * (depth + 1) // 2}\n"
+
+        with TemporaryDirectory() as temp_dir:
+            for calling_convention in nasm_visitor.CallingConvention:
+                asm = nasm_visitor.emit_Program(program, toolchain.read_Template(platform), native_funcs, 2, True, calling_convention=calling_convention)
+                self.assertIn("jmp total", asm)
+
+                target = toolchain.BuildTarget(Path(temp_dir) / "program.asm", Path(temp_dir) / "program.o", Path(temp_dir) / calling_convention.name)
+                target.asm_path.write_text(asm)
+
+                toolchain.build_Targets([target], platform, toolchain.BuildCache(None), builtin_assembler=True)
+                process = subprocess.run([str(target.executable_path)], capture_output=True, text=True)
+                self.assertEqual((process.stdout, process.returncode), (expected, 5))
+
+        llvm_module = llvm_visitor.emit_RegisterProgram(program, llvm_runtime.define_OutputRuntime)
+        self.assertIn("tail call i64 @\"total\"", str(llvm_module))
+
+        session = JITSession()
+        session.add_module(llvm.parse_assembly(str(llvm_module)))
+        total_func = ctypes.CFUNCTYPE(ctypes.c_int64, ctypes.c_int64, ctypes.c_int64)(session.get_function_address("total"))
+        self.assertEqual(total_func(depth, 0), depth * (depth + 1) // 2)
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import llvmlite.binding as llvm # type: ignore
+from slate import interpreter, optimizer
+from slate.optimizer import OptimizationOptions
+
+
+class TestInterpreter(unittest.TestCase):
+
+    def _create_module(self, entry_func_name: str, exit_code: int) -> llvm.ModuleRef:
+        return llvm.parse_assembly(f'define i64 @"{entry_func_name}"() {{\n  ret i64 {exit_code}\n}}')
+
+    def test_run_llvm(self) -> None:
+        self.assertEqual(interpreter.run_llvm(self._create_module("test#entry", 35), "test#entry"), 35)
+        self.assertEqual(interpreter.run_llvm(self._create_module("test#entry", 36), "test#entry"), 36)
+
+    def test_default_session_is_bounded(self) -> None:
+        session = interpreter.get_default_session()
+
+        for i in range(interpreter.DEFAULT_SESSION_MAX_REMOVED_MODULES - session.removed_modules):
+            self.assertEqual(interpreter.run_llvm(self._create_module("test#entry", i), "test#entry"), i)
+
+        # The session holding the code of every removed module is retired with its engine
+        self.assertIsNot(interpreter.get_default_session(), session)
+        self.assertEqual(interpreter.get_default_session().removed_modules, 0)
+
+    def test_jit_session(self) -> None:
+        session = interpreter.JITSession()
+        module1 = self._create_module("module1#entry", 1)
+        module2 = self._create_module("module2#entry", 2)
+
+        session.add_module(module1)
+        session.add_module(module2)
+        self.assertEqual(session.run("module1#entry"), 1)
+        self.assertEqual(session.run("module2#entry"), 2)
+
+        session.remove_module(module1)
+        self.assertEqual(session.modules, [module2])
+        self.assertRaises(Exception, session.get_function_address, "module1#entry")
+        self.assertEqual(session.run("module2#entry"), 2)
+
+    def test_object_cache(self) -> None:
+        with TemporaryDirectory() as temp_dir:
+            cold_cache = interpreter.ObjectCache(Path(temp_dir))
+            self.assertEqual(interpreter.run_llvm(self._create_module("test#entry", 7), "test#entry", interpreter.JITSession(cold_cache)), 7)
+            self.assertEqual(cold_cache.hits, 0)
+
+            warm_cache = interpreter.ObjectCache(Path(temp_dir))
+            self.assertEqual(interpreter.run_llvm(self._create_module("test#entry", 7), "test#entry", interpreter.JITSession(warm_cache)), 7)
+            self.assertEqual(warm_cache.misses, 0)
+
+            bounded_cache = interpreter.ObjectCache(Path(temp_dir), max_size=0)
+            self.assertEqual(interpreter.run_llvm(self._create_module("test#entry", 8), "test#entry", interpreter.JITSession(bounded_cache)), 8)
+            self.assertEqual(list(Path(temp_dir).glob("*.o")), [])
+
+    def test_default_object_cache(self) -> None:
+        default_cache = interpreter.get_default_object_cache()
+
+        with TemporaryDirectory() as temp_dir:
+            cache = interpreter.ObjectCache(Path(temp_dir))
+            interpreter.set_default_object_cache(cache)
+
+            try:
+                # The second run of the same module loads its object instead of generating code again
+                self.assertEqual(interpreter.run_llvm(self._create_module("test#entry", 9), "test#entry"), 9)
+                self.assertEqual(cache.hits, 0)
+                self.assertEqual(interpreter.run_llvm(self._create_module("test#entry", 9), "test#entry"), 9)
+                self.assertEqual(cache.hits, 1)
+
+                interpreter.set_default_object_cache(None)
+                self.assertIsNone(interpreter.get_default_session().object_cache)
+            finally:
+                interpreter.set_default_object_cache(default_cache)
+
+    def test_object_cache_threads(self) -> None:
+        with TemporaryDirectory() as temp_dir:
+            cache = interpreter.ObjectCache(Path(temp_dir))
+
+            # Threads of one process storing the same key must not share a temporary file
+            with ThreadPoolExecutor(4) as executor:
+                list(executor.map(lambda _: cache.store("key", b"object"), range(200)))
+
+            self.assertEqual(list(Path(temp_dir).iterdir()), [Path(temp_dir) / "key.o"])
+
+    def test_optimization(self) -> None:
+        module = llvm.parse_assembly('define i64 @add(i64 %a, i64 %b) {\n  %c = add i64 %a, %b\n  ret i64 %c\n}\n'
+                                     'define i64 @"test#entry"() {\n  %v = call i64 @add(i64 3, i64 4)\n  ret i64 %v\n}')
+        session = interpreter.JITSession(optimization=OptimizationOptions(opt_level=3, time_passes=True))
+
+        self.assertEqual(interpreter.run_llvm(module, "test#entry", session), 7)
+        self.assertIn("ret i64 7", str(module.get_function("test#entry")))
+        self.assertIsNotNone(session.last_pass_timings)
+
+    def test_whole_program_optimization(self) -> None:
+        module1 = llvm.parse_assembly('define i64 @add(i64 %a, i64 %b) {\n  %c = add i64 %a, %b\n  ret i64 %c\n}\n'
+                                      'define i64 @unused() {\n  ret i64 0\n}')
+        module2 = llvm.parse_assembly('declare i64 @add(i64, i64)\n'
+                                      'define i64 @"test#entry"() {\n  %v = call i64 @add(i64 3, i64 4)\n  ret i64 %v\n}')
+
+        # Only the entry stays visible, so the other functions are inlined and dropped
+        module = optimizer.link_Modules([module1, module2])
+        optimizer.optimize_WholeProgram(module, ["test#entry"], OptimizationOptions(opt_level=2))
+
+        self.assertEqual([func.name for func in module.functions], ["test#entry"])
+        self.assertIn("ret i64 7", str(module.get_function("test#entry")))
+        self.assertEqual(interpreter.run_llvm(module, "test#entry"), 7)
+
+if __name__ == '__main__':
+    unittest.main()